@@ -0,0 +1,80 @@
+# python -m benchmarks.dispatch [iterations]
+# per-platform cost of what every command pays before its own logic runs: building the Context,
+# resolving user_id and sending a reply through the platform formatter (to a stub that does nothing)
+import asyncio
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import context
+from context import Context, PetalContext
+
+PLAIN_REPLY = 'You have 120 flowers (rank #4 of 96)'
+REPLY = '**Loot boxes:** \n`Common (3)`\nRare (1)\n\n<https://example.com/>'
+
+
+class StubTwitchContext(context.TwitchContext):
+  def __init__(self):
+    self.author = SimpleNamespace(id='12345', name='chatter', is_mod=False, is_subscriber=True)
+    self.message = SimpleNamespace(raw_data='@badges= :chatter PRIVMSG #channel :!bal', timestamp=datetime.now())
+
+  async def reply(self, content: str):
+    pass
+
+class StubDiscordContext(context.DiscordContext):
+  def __init__(self):
+    self.author = SimpleNamespace(id=67890, roles=[])
+    self.message = SimpleNamespace(system_content='!bal', clean_content='!bal', created_at=datetime.now())
+
+  async def reply(self, content: str, **kwargs):
+    pass
+
+class StubPetalBot:
+  async def send(self, **payload):
+    pass
+
+context.ADAPTERS[StubTwitchContext] = context.TwitchCommandContext
+context.ADAPTERS[StubDiscordContext] = context.DiscordCommandContext
+
+# the formatter every Twitch and Petal reply went through before format_plain_text
+def chained_replace(content: str):
+  return ' | '.join(filter(
+    None, content\
+      .replace('***', '')\
+      .replace('**', '')\
+      .replace('`', '')\
+      .replace('<http', 'http')\
+      .replace('/>', '')\
+      .split('\n')
+  ))
+
+async def dispatch(source_ctx, data: dict, n: int):
+  started = time.perf_counter()
+  for _ in range(n):
+    ctx = Context(None, None, None, source_ctx, data)
+    ctx.user_id
+    await ctx.reply(REPLY)
+  return time.perf_counter() - started
+
+def report(label: str, elapsed: float, n: int):
+  print(f'  {label:<28} {elapsed / n * 1e9:8.0f} ns')
+
+async def main(n: int):
+  data = {'discord:67890': 12345, 'petal:chatter': 12345}
+  print(f'{n} dispatches, per call')
+  report('twitch', await dispatch(StubTwitchContext(), data, n), n)
+  report('discord', await dispatch(StubDiscordContext(), data, n), n)
+  report('petal', await dispatch(PetalContext(StubPetalBot(), 'chatter', '!bal'), data, n), n)
+
+  for reply in (REPLY, PLAIN_REPLY):
+    assert context.format_plain_text(reply) == chained_replace(reply)
+    for label, formatter in (('replace chain', chained_replace), ('format_plain_text', context.format_plain_text)):
+      started = time.perf_counter()
+      for _ in range(n):
+        formatter(reply)
+      report(f'{label} ({"markup" if reply is REPLY else "plain"})', time.perf_counter() - started, n)
+
+
+if __name__ == '__main__':
+  asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
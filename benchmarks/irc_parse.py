@@ -0,0 +1,86 @@
+# python -m benchmarks.irc_parse [recorded_lines.txt]
+# emote extraction + message text per chat line: the split chain event_message used against irc.strip_emotes,
+# which is what scoring runs, and against the same through a parsed IrcMessage.
+# takes a file of raw PRIVMSG lines (one per line) if given, otherwise generates tagged lines like Twitch's
+import random
+import sys
+import time
+
+import irc
+
+SEED = 1337
+REPEATS = 5
+EMOTES = ['Kappa', 'LUL', 'PogChamp', 'KEKW', 'catJAM', 'lynnyaHeart', 'BibleThump']
+WORDS = 'the a to and you is it that this so lol what no yes im just like gg nice wow me my cat game play win'.split()
+
+
+def generate_lines(n: int, rng: random.Random, chatters: int = 500):
+  lines = []
+  for i in range(n):
+    tokens = [rng.choice(EMOTES) if rng.random() < 0.2 else rng.choice(WORDS) for _ in range(rng.randint(1, 14))]
+    if rng.random() < 0.1:
+      tokens.insert(rng.randrange(len(tokens)), 'note:')
+    text = ' '.join(tokens)
+
+    uses = {}
+    pos = 0
+    for token in tokens:
+      if token in EMOTES:
+        uses.setdefault(EMOTES.index(token) + 25, []).append(f'{pos}-{pos + len(token) - 1}')
+      pos += len(token) + 1
+    emotes = '/'.join(f'{emote_id}:{",".join(ranges)}' for emote_id, ranges in uses.items())
+    badges = rng.choice(['', 'subscriber/12', 'subscriber/3,premium/1', 'moderator/1,subscriber/24', 'founder/0'])
+    lines.append(
+      f'@badge-info=;badges={badges};color=#1E90FF;display-name=Chatter{i % chatters};emotes={emotes};'
+      f'first-msg=0;flags=;id=00000000-0000-0000-0000-{i:012d};mod=0;room-id=123456;subscriber=0;'
+      f'tmi-sent-ts=1650000000000;turbo=0;user-id={100000 + i % chatters};user-type= '
+      f':chatter{i % chatters}!chatter{i % chatters}@chatter{i % chatters}.tmi.twitch.tv PRIVMSG #lynnya_tv :{text}'
+    )
+  return lines
+
+# what event_message (later scoring.score_message) did before irc.parse, emote removal included
+def split_chain(raw_data: str):
+  emote_pre = raw_data.split('emotes=', 1)[-1]
+  tokens_str = emote_pre.split(' PRIVMSG ')[-1].split(':')[-1]
+  emote_blob = emote_pre.split(';', 1)[0]
+  num_emotes = 0
+  unique_emotes = []
+  if emote_blob:
+    for emote_type in emote_blob.split('/'):
+      ranges_used = emote_type.split(':')[-1].split(',')
+      num_emotes += len(ranges_used)
+      start, stop = map(int, ranges_used[0].split('-'))
+      unique_emotes.append(tokens_str[start : stop + 1])
+  for emote in unique_emotes:
+    tokens_str = tokens_str.replace(emote, '')
+  return num_emotes, tokens_str
+
+def parsed(raw_data: str):
+  return irc.parse(raw_data).strip_emotes()
+
+def main(path: str = None):
+  if path:
+    with open(path) as f:
+      lines = [line.rstrip('\r\n') for line in f if ' PRIVMSG ' in line]
+  else:
+    lines = generate_lines(50_000, random.Random(SEED))
+
+  print(f'{len(lines)} lines')
+  # best of REPEATS rounds, alternating between them so background load hits each alike
+  best = {split_chain: float('inf'), irc.strip_emotes: float('inf'), parsed: float('inf')}
+  for _ in range(REPEATS):
+    for fn in best:
+      started = time.perf_counter()
+      for line in lines:
+        fn(line)
+      best[fn] = min(best[fn], time.perf_counter() - started)
+  for label, fn in (('split chain', split_chain), ('irc.strip_emotes', irc.strip_emotes), ('irc.parse', parsed)):
+    print(f'  {label:<16} {best[fn] * 1000:8.1f} ms  ({best[fn] / len(lines) * 1e9:6.0f} ns/line, {best[fn] / best[split_chain]:.2f}x)')
+
+  # the split chain takes the text after the last ":", so any message containing one loses its start
+  differing = sum(split_chain(line)[1].split() != irc.strip_emotes(line)[1].split() for line in lines)
+  print(f'  texts differing from the split chain: {differing} (messages with ":" in them)')
+
+
+if __name__ == '__main__':
+  main(sys.argv[1] if len(sys.argv) > 1 else None)
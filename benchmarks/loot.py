@@ -0,0 +1,73 @@
+# python -m benchmarks.loot [samples]
+# times box purchases and openings against the old per-roll list scan, then checks the sampled
+# rarities and items against the configured odds with a chi-square test
+import random
+import sys
+import time
+from collections import Counter
+
+import constants
+import loot
+
+SEED = 1337
+# z-score of the 99.9th percentile, for the Wilson-Hilferty chi-square critical value
+Z_999 = 3.0902
+
+
+def chi_square(observed: Counter, odds: dict, n: int):
+  return sum((observed[value] - n * p) ** 2 / (n * p) for value, p in odds.items() if p > 0)
+
+def critical_value(dof: int):
+  return dof * (1 - 2 / (9 * dof) + Z_999 * (2 / (9 * dof)) ** 0.5) ** 3
+
+def check(label: str, observed: Counter, odds: dict, n: int):
+  stat = chi_square(observed, odds, n)
+  limit = critical_value(len(odds) - 1)
+  ok = stat < limit
+  print(f'  {label:<12} chi2 {stat:8.2f} < {limit:6.2f}  {"ok" if ok else "FAIL"}')
+  return ok
+
+def timed(label: str, fn, n: int):
+  started = time.perf_counter()
+  fn()
+  elapsed = time.perf_counter() - started
+  print(f'  {label:<36} {elapsed * 1000:8.1f} ms  ({elapsed / n * 1e9:6.0f} ns/roll)')
+
+# how box rarities used to be rolled: a random() per box and a scan of the cumulative odds
+def scan_rarities(n: int, rng: random.Random):
+  counts = Counter()
+  for _ in range(n):
+    roll = rng.random()
+    for rarity, odds in constants.LOOT_BOX_ODDS.items():
+      if roll < odds:
+        counts[rarity] += 1
+        break
+      roll -= odds
+  return counts
+
+def main(n: int):
+  table = loot.LootTable(rng=random.Random(SEED))
+  rng = random.Random(SEED)
+
+  print(f'{n} rolls')
+  timed('box rarities (list scan)', lambda: scan_rarities(n, rng), n)
+  timed('box rarities (alias table)', lambda: loot.draw_box_rarities(n, rng), n)
+  timed(f'open {n} Common boxes (batched)', lambda: table.open_boxes({constants.RARITY_COMMON: n}), n)
+
+  print('distribution')
+  ok = check('box rarity', Counter(loot.draw_box_rarities(n, rng)), loot.BOX_RARITY_TABLE.odds(), n)
+  for rarity in loot.RARITIES:
+    opened = Counter(name for name, _, _ in table.open_boxes({rarity: n}))
+    ok &= check(rarity, opened, table.odds(rarity), n)
+
+  # reforging under a fixed seed is reproducible
+  first = loot.LootTable(rng=random.Random(SEED)).open_boxes({constants.RARITY_RARE: 100})
+  second = loot.LootTable(rng=random.Random(SEED)).open_boxes({constants.RARITY_RARE: 100})
+  print(f'  {"seeded":<12} {"ok" if first == second else "FAIL"}')
+  ok &= first == second
+
+  return 0 if ok else 1
+
+
+if __name__ == '__main__':
+  sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
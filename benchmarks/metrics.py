@@ -0,0 +1,94 @@
+# python -m benchmarks.metrics [iterations]
+# what instrumentation costs on the hot paths: a counter increment, a histogram observation (bare,
+# labelled and through a Timer), the instrumented command wrapper, and rendering a scrape. exits
+# non-zero when a per-call cost goes over BUDGET_NS
+import asyncio
+import sys
+import time
+
+from metrics import Metrics
+
+# per instrumented call; even the cheapest handler (event_message: parse, sub status, queueing) takes several times this
+BUDGET_NS = 2000
+
+
+def per_call(fn, n: int):
+  best = float('inf')
+  for _ in range(5):
+    started = time.perf_counter()
+    fn(n)
+    best = min(best, time.perf_counter() - started)
+  return best / n * 1e9
+
+def main(n: int = 200_000):
+  registry = Metrics()
+  counter = registry.counter('events_total', 'events')
+  labelled_counter = registry.counter('command_errors_total', 'errors', ('command', 'platform'))
+  histogram = registry.histogram('handler_seconds', 'handler time')
+  labelled = registry.histogram('command_seconds', 'command time', ('command', 'platform'))
+
+  def baseline(n):
+    for _ in range(n):
+      started = time.perf_counter()
+      time.perf_counter() - started
+  def inc(n):
+    for _ in range(n):
+      counter.inc()
+  def inc_labelled(n):
+    for _ in range(n):
+      labelled_counter.inc('bal', 'twitch')
+  def observe(n):
+    for _ in range(n):
+      started = time.perf_counter()
+      histogram.observe(time.perf_counter() - started)
+  def observe_labelled(n):
+    for _ in range(n):
+      started = time.perf_counter()
+      labelled.observe(time.perf_counter() - started, 'bal', 'twitch')
+  def timer(n):
+    for _ in range(n):
+      with histogram.time():
+        pass
+
+  async def command(ctx, *args):
+    pass
+  async def instrumented(ctx, *args):
+    started = time.perf_counter()
+    try:
+      await command(ctx, *args)
+    finally:
+      labelled.observe(time.perf_counter() - started, 'bal', 'twitch')
+  def run_commands(coro):
+    async def run(n):
+      for _ in range(n):
+        await coro(None)
+    return lambda n: asyncio.run(run(n))
+
+  base = per_call(baseline, n)
+  results = {
+    'counter.inc()': per_call(inc, n),
+    'counter.inc(labels)': per_call(inc_labelled, n),
+    'histogram.observe()': per_call(observe, n) - base,
+    'histogram.observe(labels)': per_call(observe_labelled, n) - base,
+    'with histogram.time()': per_call(timer, n),
+    'instrumented command': per_call(run_commands(instrumented), n) - per_call(run_commands(command), n)
+  }
+  over = False
+  for label, ns in results.items():
+    over |= ns > BUDGET_NS
+    print(f'  {label:<26} {ns:7.0f} ns/call{"  OVER BUDGET" if ns > BUDGET_NS else ""}')
+
+  # a scrape with a realistic number of series, each with a full window
+  for i in range(30):
+    for platform in ('twitch', 'discord', 'petal'):
+      for _ in range(labelled.window):
+        labelled.observe(i / 1000, f'command{i}', platform)
+  started = time.perf_counter()
+  body = registry.render()
+  print(f'  render, {len(labelled.series)} series  {(time.perf_counter() - started) * 1000:7.1f} ms ({len(body)} bytes)')
+  print(f'budget {BUDGET_NS} ns/call: {"exceeded" if over else "ok"}')
+  return 1 if over else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
@@ -0,0 +1,383 @@
+# python -m benchmarks.replay [--users 1000 100000 1000000] [--messages N] [--twitch FILE] [--discord FILE] [--petal FILE]
+# replays chat through the real handlers from bot.setup, with stand-ins for the Twitch, Discord and
+# Twitter clients and a PetalBot that never connects. for each data size (users with a balance) it
+# reports throughput and p50/p95/p99 per stage, then replays a sample again under tracemalloc for
+# net allocations per message. a handler that raises is counted per stage and the replay moves on.
+# recorded input: --twitch takes raw PRIVMSG lines, --discord takes
+# "<discord user id>\t<content>" lines and --petal takes one JSON frame per line
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from types import SimpleNamespace
+
+import constants
+import context
+import irc
+import logger
+from benchmarks.irc_parse import generate_lines
+from bot_data import BotData
+from metrics import Series
+from petal_bot import PetalBot
+from storage import JsonBackend
+from sub_status import SubStatus
+from user_cache import UserCache
+
+import bot
+
+SEED = 1337
+SIZES = (1_000, 100_000, 1_000_000)
+FIRST_USER_ID = 100000
+FIRST_DISCORD_ID = 10 ** 17
+# users that chat during a replay, and users with linked Discord/Petal accounts
+ACTIVE_USERS = 2000
+COMMAND_RATE = 0.05
+TWITCH_COMMANDS = ['!bal', '!daily', '!lb', '!buybox', '!boxes', '!usebox', '!sub', '!code']
+DISCORD_COMMANDS = TWITCH_COMMANDS + ['!inv', '!item', '!buybox 3', '!usebox all']
+ALLOC_SAMPLE = 2000
+
+
+class StubChannel:
+  def __init__(self):
+    self.sent = 0
+    self.guild = self
+    self.members = []
+
+  async def send(self, *args, **kwargs):
+    self.sent += 1
+
+  def get_chatter(self, name: str):
+    return None
+
+  async def edit(self, **kwargs):
+    pass
+
+  async def set_permissions(self, *args, **kwargs):
+    pass
+
+class StubTwitchBot:
+  nick = 'lynnya_bot'
+
+  def __init__(self, data: BotData):
+    self.data = data
+    self.commands = {}
+    self.channel = StubChannel()
+    self.ready_event = asyncio.Event()
+    self.ready_event.set()
+    self.user_cache = UserCache(self, data)
+    data.add_index(UserCache.key_prefix, self.user_cache)
+    self.sub_status = SubStatus(data)
+    data.add_index(SubStatus.key_prefix, self.sub_status)
+
+  def event(self):
+    def decorator(coro):
+      setattr(self, coro.__name__, coro)
+      return coro
+    return decorator
+
+  def command(self, name: str):
+    def decorator(coro):
+      self.commands[name] = coro
+      return coro
+    return decorator
+
+  def get_channel(self, name: str):
+    return self.channel
+
+  async def fetch_channel(self, name: str):
+    return SimpleNamespace(title='replay', game_name='DDNet')
+
+  # every channel is live, its user ID is its index in BROADCASTER_CHANNELS
+  async def fetch_streams(self, user_logins: list):
+    return [SimpleNamespace(user=SimpleNamespace(id=constants.BROADCASTER_CHANNELS.index(login), name=login)) for login in user_logins]
+
+  async def fetch_users(self, ids: list = None, names: list = None):
+    if names is not None:
+      return [SimpleNamespace(id=constants.BROADCASTER_CHANNELS.index(name), name=name) for name in names]
+    return [SimpleNamespace(id=user_id, name=f'chatter{user_id}') for user_id in ids]
+
+  async def handle_commands(self, message):
+    pass
+
+class StubDiscordBot:
+  def __init__(self, data: BotData):
+    self.data = data
+    self.commands = {}
+    self.checks = []
+    self.guilds = []
+    self.channel = StubChannel()
+
+  def event(self, coro):
+    setattr(self, coro.__name__, coro)
+    return coro
+
+  def check(self, coro):
+    self.checks.append(coro)
+    return coro
+
+  def command(self, name: str):
+    def decorator(coro):
+      self.commands[name] = coro
+      return coro
+    return decorator
+
+  def get_channel(self, channel_id: int):
+    return self.channel
+
+  def get_user(self, user_id: int):
+    return self.channel
+
+  async def fetch_user(self, user_id: int):
+    return self.channel
+
+  async def wait_until_ready(self):
+    pass
+
+  async def process_commands(self, message):
+    pass
+
+class StubTwitterBot:
+  # peony's api.<path>.post(...), for any path
+  def __init__(self):
+    self.posts = 0
+
+  def __getattr__(self, name: str):
+    return self
+
+  async def post(self, **kwargs):
+    self.posts += 1
+
+class StubTwitchContext(context.TwitchContext):
+  def __init__(self, author, message):
+    self.author = author
+    self.message = message
+    self.channel = message.channel
+
+  async def reply(self, content: str):
+    pass
+
+class StubDiscordContext(context.DiscordContext):
+  def __init__(self, bot, author, message):
+    self.bot = bot
+    self.author = author
+    self.message = message
+
+  async def reply(self, content: str, **kwargs):
+    pass
+
+context.ADAPTERS[StubTwitchContext] = context.TwitchCommandContext
+context.ADAPTERS[StubDiscordContext] = context.DiscordCommandContext
+
+NOT_STAFF = SimpleNamespace(view_channel=False)
+
+
+def write_data_file(path: str, users: int, rng: random.Random):
+  data = {}
+  for user_id in range(FIRST_USER_ID, FIRST_USER_ID + users):
+    data[f'bal:{user_id}'] = rng.randint(0, 5000)
+    data[f'partial_bal:{user_id}'] = rng.randrange(constants.PARTIAL_BAL_PER_BAL)
+  for i in range(min(users, ACTIVE_USERS)):
+    data[f'discord:{FIRST_DISCORD_ID + i}'] = FIRST_USER_ID + i
+    data[f'petal:petal{i}'] = FIRST_USER_ID + i
+  data['info:lobby'] = 'ABCD'
+  with open(path, 'w') as f:
+    json.dump(data, f)
+
+def synthetic_twitch(n: int, users: int, rng: random.Random):
+  lines = generate_lines(n, rng, min(users, ACTIVE_USERS))
+  for i, line in enumerate(lines):
+    if rng.random() < COMMAND_RATE:
+      lines[i] = line[:irc.parse(line).text_start] + rng.choice(TWITCH_COMMANDS)
+  return lines
+
+def synthetic_discord(n: int, users: int, rng: random.Random):
+  return [
+    (FIRST_DISCORD_ID + rng.randrange(min(users, ACTIVE_USERS)), rng.choice(DISCORD_COMMANDS))
+    for _ in range(n)
+  ]
+
+def synthetic_petal(n: int, users: int, rng: random.Random):
+  frames = []
+  for _ in range(n):
+    body = rng.choice(TWITCH_COMMANDS) if rng.random() < 0.5 else 'hello from petal'
+    frames.append(json.dumps({'type': 'message', 'name': f'petal{rng.randrange(min(users, ACTIVE_USERS))}', 'body': body}))
+  return frames
+
+def read_lines(path: str):
+  with open(path) as f:
+    return [line.rstrip('\r\n') for line in f if line.strip()]
+
+
+class Replay:
+  def __init__(self, data: BotData, audit_path: str):
+    self.data = data
+    self.twitch_bot = StubTwitchBot(data)
+    self.discord_bot = StubDiscordBot(data)
+    self.petal_bot = PetalBot(data, 'token', 'lynnya_bot', self.twitch_bot, self.discord_bot)
+    self.services = bot.setup(data, self.twitch_bot, self.discord_bot, StubTwitterBot(), self.petal_bot)
+    self.services.ledger.audit_path = audit_path
+    self.prefix = data[constants.TWITCH_PREFIX_KEY]
+    self.channel = SimpleNamespace(name=constants.BROADCASTER_CHANNEL)
+
+  async def twitch(self, lines: list, timings: Series, errors: Counter):
+    for line in lines:
+      message = irc.parse(line)
+      author = SimpleNamespace(
+        id=message.tag('user-id'), name=message.nick, is_mod=False, is_subscriber=message.is_subscriber
+      )
+      source = SimpleNamespace(
+        author=author, channel=self.channel, raw_data=line, content=message.text, echo=False, timestamp=datetime.now()
+      )
+      started = time.perf_counter()
+      try:
+        await self.twitch_bot.event_message(source)
+        if message.text.startswith(self.prefix):
+          name, *args = message.text[len(self.prefix):].split()
+          if (command := self.twitch_bot.commands.get(name)) is not None:
+            await command(StubTwitchContext(author, source), *args)
+      except Exception as exc:
+        failed(errors, exc)
+      timings.observe(time.perf_counter() - started)
+
+  async def discord(self, messages: list, timings: Series, errors: Counter):
+    for discord_id, content in messages:
+      author = SimpleNamespace(id=discord_id, roles=[], permissions_in=lambda channel: NOT_STAFF)
+      source = SimpleNamespace(system_content=content, clean_content=content, created_at=datetime.now())
+      started = time.perf_counter()
+      try:
+        if content.startswith(self.prefix):
+          name, *args = content[len(self.prefix):].split()
+          if (command := self.discord_bot.commands.get(name)) is not None:
+            await command(StubDiscordContext(self.discord_bot, author, source), *args)
+      except Exception as exc:
+        failed(errors, exc)
+      timings.observe(time.perf_counter() - started)
+
+  async def petal(self, frames: list, timings: Series, errors: Counter):
+    for frame in frames:
+      started = time.perf_counter()
+      try:
+        self.petal_bot.handle_frame(frame)
+      except Exception as exc:
+        failed(errors, exc)
+      # commands run as tasks, a frame is done once they finish
+      while self.petal_bot.stats()['commands_running']:
+        await asyncio.sleep(0)
+      timings.observe(time.perf_counter() - started)
+
+  async def drain_scoring(self):
+    pipeline = self.services.scoring_pipeline
+    while pipeline.scored + pipeline.dropped < pipeline.submitted:
+      await asyncio.sleep(0.001)
+
+
+# keyed by exception type and message, so one bug hit a thousand times is one line
+def failed(errors: Counter, exc: Exception):
+  errors[f'{type(exc).__name__}: {exc}'[:160]] += 1
+
+def report_errors(errors: Counter):
+  if errors:
+    print(f'    {sum(errors.values())} handler errors:')
+  for error, count in errors.most_common():
+    print(f'    {count:>8}  {error}')
+
+def report(stage: str, count: int, elapsed: float, timings: Series = None):
+  rate = f'{count / elapsed if elapsed else 0:>10.0f}/s' if count > 1 else ' ' * 12
+  line = f'  {stage:<16} {count:>8}  {rate}'
+  if timings is not None and timings.count:
+    p50, p95, p99 = (value * 1e6 for value in timings.quantiles())
+    line += f'  p50 {p50:>8.1f}µs  p95 {p95:>8.1f}µs  p99 {p99:>9.1f}µs'
+  else:
+    line += f'  total {elapsed * 1000:>9.1f}ms'
+  print(line)
+
+async def timed(coro):
+  started = time.perf_counter()
+  await coro
+  return time.perf_counter() - started
+
+async def run_size(users: int, inputs: dict, workdir: str):
+  rng = random.Random(SEED)
+  data_path = os.path.join(workdir, f'data_{users}.json')
+  write_data_file(data_path, users, rng)
+  print(f'{users} users ({os.path.getsize(data_path) / 1e6:.1f} MB data file)')
+
+  data = BotData(JsonBackend(data_path), write_behind=True)
+  report('data load', 1, await timed(data.load()))
+  started = time.perf_counter()
+  replay = Replay(data, os.path.join(workdir, f'ledger_{users}.jsonl'))
+  report('setup + indexes', 1, time.perf_counter() - started)
+
+  await replay.services.live_status.set_live(True)
+  replay.services.scoring_pipeline.start()
+  twitch = inputs['twitch'] or synthetic_twitch(inputs['messages'], users, rng)
+  discord = inputs['discord'] or synthetic_discord(inputs['messages'] // 10, users, rng)
+  petal = inputs['petal'] or synthetic_petal(inputs['messages'] // 10, users, rng)
+
+  for stage, handler, messages in (('twitch', replay.twitch, twitch), ('discord', replay.discord, discord), ('petal', replay.petal, petal)):
+    timings = Series(len(messages))
+    errors = Counter()
+    elapsed = await timed(handler(messages, timings, errors))
+    report(stage, len(messages), elapsed, timings)
+    report_errors(errors)
+
+  pipeline = replay.services.scoring_pipeline
+  elapsed = await timed(replay.drain_scoring())
+  stats = pipeline.stats()
+  print(f'  {"scoring":<16} {stats["scored"]:>8}  drained in {elapsed * 1000:.1f}ms after the replay, '
+    f'avg latency {stats["latency_avg"] * 1000:.1f}ms, max {stats["latency_max"] * 1000:.1f}ms, {stats["dropped"]} dropped')
+  await pipeline.close()
+  replay.services.scoring_executor.shutdown(wait=False)
+
+  report('ledger commit', replay.services.ledger.stats()['transactions'], await timed(replay.services.ledger.commit()))
+  report('data flush', len(data.dirty_keys), await timed(data.flush()))
+  report('data compact', len(data), await timed(data.backend.compact(data)))
+
+  # allocations: the same handlers again on a sample, under tracemalloc
+  tracemalloc.start()
+  for stage, handler, messages in (('twitch', replay.twitch, twitch), ('discord', replay.discord, discord), ('petal', replay.petal, petal)):
+    sample = messages[:ALLOC_SAMPLE]
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    start_size = tracemalloc.get_traced_memory()[0]
+    await handler(sample, Series(len(sample)), Counter())
+    after = tracemalloc.take_snapshot()
+    diff = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in diff)
+    size = sum(stat.size_diff for stat in diff)
+    peak = tracemalloc.get_traced_memory()[1] - start_size
+    print(f'  {stage + " allocs":<16} {len(sample):>8}  net {size / len(sample):>8.0f} B/msg, '
+      f'{blocks / len(sample):>6.1f} blocks/msg, peak {peak / 1024:.0f} KiB')
+  tracemalloc.stop()
+  await data.backend.close()
+
+async def main():
+  parser = argparse.ArgumentParser(description='replay chat through the bot handlers')
+  parser.add_argument('--users', type=int, nargs='+', default=SIZES)
+  parser.add_argument('--messages', type=int, default=20_000, help='synthetic Twitch lines (Discord and Petal get a tenth each)')
+  parser.add_argument('--twitch')
+  parser.add_argument('--discord')
+  parser.add_argument('--petal')
+  args = parser.parse_args()
+
+  inputs = {
+    'messages': args.messages,
+    'twitch': read_lines(args.twitch) if args.twitch else None,
+    'discord': [(int(user_id), content) for user_id, content in (line.split('\t', 1) for line in read_lines(args.discord))] if args.discord else None,
+    'petal': read_lines(args.petal) if args.petal else None
+  }
+  # the handlers' own logging would drown out the report
+  logger.logger.level = logger.ERROR
+  with tempfile.TemporaryDirectory() as workdir:
+    for users in args.users:
+      await run_size(users, inputs, workdir)
+
+
+if __name__ == '__main__':
+  asyncio.run(main())
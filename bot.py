@@ -1,8 +1,8 @@
 import asyncio
-import json
 import random
-import re
 import time
+from collections import Counter
+from types import SimpleNamespace
 
 from aiofiles import open as aiopen
 from discord import RawReactionActionEvent as DiscordRawReactionActionEvent
@@ -14,186 +14,51 @@ from twitchio.ext import commands as twitch
 VERSION='0.2.5'
 
 import constants
+import irc
+import loot
+import metrics
+import scoring
 import util
 from bot_data import BotData
+from cards import CardRenderer
 from context import Context
 from discord_bot import DiscordBot
+from inventory import ITEMS, InventoryStore
+from leaderboard import Leaderboard
+from ledger import InsufficientFunds, Ledger
+from live_status import LiveStatus, LiveStatusPoller
+from logger import logger
 from petal_bot import PetalBot, PetalContext
+from reminders import DailyReminders
+from storage import create_backend, shard_path
 from twitch_bot import TwitchBot
 
-# load loot box items table
-with open('items.json') as f:
-  LOOT_BOX_ITEMS = json.load(f)
-
-# load English word list TODO: extend this to include common tokens used in chats (uwu, IRL, etc.)
-with open('words.txt') as f:
-  ENGLISH_WORDS = set(f.read().lower().split())
-
-async def main():
-  util.print_box(f'{constants.BOT_NAME} v{VERSION}')
-
-  data = BotData(constants.DATA_PATH)
-  await data.load()
-
-  twitch_bot = TwitchBot(constants.TWITCH_TOKEN, data)
-  discord_bot = DiscordBot(data)
-  twitter_bot = TwitterBot(
-    constants.TWITTER_KEY,
-    constants.TWITTER_SECRET,
-    constants.TWITTER_ACCESS_TOKEN,
-    constants.TWITTER_ACCESS_TOKEN_SECRET
-  )
-  petal_bot = PetalBot(data, constants.PETAL_TOKEN, constants.PETAL_NAME, twitch_bot, discord_bot)
-
-  # on message, do chatter-based logic here
-  @twitch_bot.event()
-  async def event_message(message: TwitchMessage):
-    if message.author is None or message.author.name == twitch_bot.nick or not await is_live(): return
-
-    # everything after "emotes="
-    emote_pre = message.raw_data.split('emotes=', 1)[-1]
-    # ... everything after the message head
-    tokens_str = emote_pre.split(' PRIVMSG ')[-1].split(':')[-1]
-    # ... and everything before the emote value delimiter (;)
-    emote_blob = emote_pre.split(';', 1)[0]
-    num_emotes = 0
-    unique_emotes = []
-
-    if emote_blob:
-      # for emote type in list of unique emotes used
-      for emote_type in emote_blob.split('/'):
-        # find all the ranges the emote was used in
-        ranges_used = emote_type.split(':')[-1].split(',')
-        # +1 for each range
-        num_emotes += len(ranges_used)
-        # use the first available range to record the emote's name for removal later
-        start, stop = map(int, ranges_used[0].split('-'))
-        unique_emotes.append(tokens_str[start : stop + 1])
-
-    # remove emotes
-    for emote in unique_emotes:
-      tokens_str.replace(emote, '')
-
-    # remove symbols, .lower(), then tokenize
-    tokens = re.sub(r'[^\w+]', ' ', tokens_str).lower().split()
-
-    # remove duplicate tokens, then remove tokens that are not known to be English words
-    words = list(t for t in set(tokens) if t in ENGLISH_WORDS)
-    num_words = len(words)
-
-    # find the average of averages for each word's levenshtein distances to other words in the message
-    # NOTE: this is a SOMEWHAT accurate way of determining valuable/conversational messages, but it is not ideal
-    words_score = sum(sum(util.leven(word, w) for w in words) / num_words for word in words) / num_words if num_words else 0
-
-    # calculate total score with the emote score combined
-    total_score = int(words_score + num_emotes ** constants.EMOTE_VALUE_EXPONENT)
-
-    partial_bal_key = f'partial_bal:{message.author.id}'
-    partial_bal = data[partial_bal_key] = data.get(partial_bal_key, 0) + total_score
-
-    if partial_bal >= constants.PARTIAL_BAL_PER_BAL:
-      data[partial_bal_key] = partial_bal - constants.PARTIAL_BAL_PER_BAL
-      bal_key = f'bal:{message.author.id}'
-      data[bal_key] = data.get(bal_key, 0) + 1
-
-    await data.save('chat currency award')
-
-  @discord_bot.event
-  async def on_voice_state_update(member, before, after):
-    if member.id == constants.DISCORD_BROADCASTER_ID:
-      if before.channel is not None and \
-        before.channel.id == constants.DISCORD_LIVE_VOICE_CHANNEL_ID and \
-        (after.channel is None or after.channel.id != constants.DISCORD_LIVE_VOICE_CHANNEL_ID):
-
-        reason = 'broadcaster left LIVE channel'
-        guild = before.channel.guild
-        live_voice_channel = before.channel
-        closed_voice_channel = guild.get_channel(constants.DISCORD_CLOSED_VOICE_CHANNEL_ID)
-
-        discord_bot.log_info('disabling LIVE channel for members')
-        await live_voice_channel.set_permissions(live_voice_channel.guild.default_role, view_channel=False, connect=False, reason=reason)
-        discord_bot.log_done('disabled LIVE channel')
-        if (num_members := len(live_voice_channel.members)):
-          discord_bot.log_info(f'moving {num_members} members')
-          move_gen = (m.move_to(closed_voice_channel, reason=reason) for m in live_voice_channel.members)
-          await asyncio.gather(*move_gen)
-          discord_bot.log_done('moved members')
-
-      elif after.channel is not None and \
-        after.channel.id == constants.DISCORD_LIVE_VOICE_CHANNEL_ID and \
-        (before.channel is None or before.channel.id != constants.DISCORD_LIVE_VOICE_CHANNEL_ID):
-
-        reason = 'broadcaster joined LIVE channel'
-        live_voice_channel = after.channel
-
-        discord_bot.log_info('enabling LIVE channel for members')
-        await live_voice_channel.set_permissions(live_voice_channel.guild.default_role, view_channel=True, connect=False, reason=reason)
-        discord_bot.log_done('enabled LIVE channel')
-
-  async def handle_reaction(reaction: DiscordRawReactionActionEvent):
-    # TODO: add logging
-    if reaction.channel_id == constants.DISCORD_REACTION_ROLES_CHANNEL_ID:
-      role = None
-
-      if reaction.event_type == 'REACTION_ADD':
-        member = reaction.member
-      else:
-        member = await (discord_bot.get_guild(reaction.guild_id)).fetch_member(reaction.user_id)
-
-      if reaction.emoji.name == constants.DISCORD_REACTION_ROLES_ALERTS_EMOJI:
-        role = member.guild.get_role(constants.DISCORD_ALERTS_ROLE_ID)
-      elif reaction.emoji.name == constants.DISCORD_REACTION_ROLES_RESCUE_EMOJI:
-        role = member.guild.get_role(constants.DISCORD_TIMER_ALERTS_ROLE_ID)
-      elif reaction.event_type == 'REACTION_ADD':
-        await (
-          await (
-            discord_bot.get_channel(reaction.channel_id)
-          ).fetch_message(reaction.message_id)
-        ).remove_reaction(reaction.emoji, member)
-
-      if role is not None:
-        if reaction.event_type == 'REACTION_ADD':
-          await member.add_roles(role)
-        else:
-          await member.remove_roles(role)
-
-  @discord_bot.event
-  async def on_member_join(member):
-    # TODO: add logging
-    await member.add_roles(member.guild.get_role(constants.DISCORD_ALERTS_ROLE_ID))
-
-  @discord_bot.event
-  async def on_raw_reaction_add(payload):
-    await handle_reaction(payload)
-
-  @discord_bot.event
-  async def on_raw_reaction_remove(payload):
-    await handle_reaction(payload)
-
-  @discord_bot.check
-  async def __limit_commands_to_channels(ctx: discord.Context):
-    return ctx.guild is not None and ctx.channel.id in constants.DISCORD_CHANNEL_IDS
-
-  async def is_live(channel_name: str = constants.BROADCASTER_CHANNEL):
-    return bool(await twitch_bot.fetch_streams(user_logins=[channel_name]))
+scoring.load_words()
+
+COMMAND_SECONDS = metrics.registry.histogram('command_seconds', 'command handler time', ('command', 'platform'))
+COMMAND_ERRORS = metrics.registry.counter('command_errors_total', 'commands that raised', ('command', 'platform'))
+MESSAGE_SECONDS = metrics.registry.histogram('twitch_message_seconds', 'event_message handler time')
+
+# one channel's economy: its own data shard, indexes, live status and pipelines, and the commands that
+# run against them. Discord, Petal, Twitter and account links stay with the first channel, whose data is `accounts`
+def setup_channel(channel: str, data: BotData, accounts: BotData, twitch_bot: TwitchBot, discord_bot: DiscordBot,
+    twitter_bot: TwitterBot, petal_bot: PetalBot, scoring_executor, loot_table: loot.LootTable, cards: CardRenderer):
+  primary = channel == constants.BROADCASTER_CHANNEL
+  leaderboard = Leaderboard()
+  data.add_index('bal:', leaderboard)
+  inventories = InventoryStore(data)
+  data.add_index('inv:', inventories)
+  live_status = LiveStatus(twitch_bot, channel)
+  ledger = Ledger(data, shard_path(constants.LEDGER_AUDIT_PATH, channel))
+  scoring_pipeline = scoring.ScoringPipeline(ledger, scoring_executor)
+  # reminders go out through Discord, so only the first channel has them
+  daily_reminders = None
+  if primary:
+    daily_reminders = DailyReminders(discord_bot, data, live_status)
+    data.add_index(DailyReminders.timestamp_prefix, daily_reminders)
 
   async def reply_not_linked(ctx: Context):
-    return await ctx.reply(f'This command requires a linked Discord account. Use {data[constants.DISCORD_PREFIX_KEY]}link in Discord to link your accounts.')
-
-  def add_command(coro, name=None):
-    @twitch_bot.command(name=name or coro.__name__.replace('_command', ''))
-    async def __twitch_command(ctx, *args):
-      await coro(Context(twitch_bot, discord_bot, petal_bot, ctx, data), *args)
-
-    @discord_bot.command(name=name or coro.__name__.replace('_command', ''))
-    async def __discord_command(ctx, *args):
-      await coro(Context(twitch_bot, discord_bot, petal_bot, ctx, data), *args)
-
-    petal_bot.add_command(name or coro.__name__.replace('_command', ''), coro)
-
-  def add_commands(*coros):
-    for coro in coros:
-      add_command(coro)
+    return await ctx.reply(f'This command requires a linked Discord account. Use {accounts[constants.DISCORD_PREFIX_KEY]}link in Discord to link your accounts.')
 
   async def basic_command(ctx: Context, key: str, label: str, intro: str, *args, unavailable='n/a'):
     if ctx.is_mod and len(args):
@@ -208,40 +73,10 @@ async def main():
   ### RPG LOGIC ###
   #################
 
-  async def create_loot_box(ctx: Context):
-    roll = random.random()
-
-    box = {
-      'source_canonical_id': ctx.user_id,
-      'source_id': ctx.source_id,
-      'timestamp': ctx.timestamp,
-      'was_subscriber': await ctx.check_sub(),
-      'name': 'Loot Box',
-      'rarity': None
-    }
-
-    if roll < 0.01:
-      box['rarity'] = constants.RARITY_LEGENDARY
-    elif roll < 0.05:
-      box['rarity'] = constants.RARITY_MYTHIC
-    elif roll < 0.15:
-      box['rarity'] = constants.RARITY_RARE
-    elif roll < 0.4:
-      box['rarity'] = constants.RARITY_UNCOMMON
-    else:
-      box['rarity'] = constants.RARITY_COMMON
-
-    return box
-
-  # def resolve_box_rarity(rarity_str: str):
-  #   rarity_str = rarity_str.lower()
-  #   for rarity in ['common', 'uncommon', 'rare', 'mythic', 'legendary']:
-  #     if rarity.startswith(rarity_str):
-  #       return rarity.capitalize()
-  #   return None
-
-  # def items_from_box(box):
-  #   pass
+  def format_opened(opened: list):
+    if len(opened) > constants.LOOT_OPEN_LIST_LIMIT:
+      return loot.format_counts(Counter(f'{rarity} {name}' for name, rarity, _ in opened))
+    return '\n'.join(f'{rarity} {name}  [+{reforge_stat} {ITEMS[name]["stat_type"]}]' for name, rarity, reforge_stat in opened)
 
 
   ################
@@ -288,8 +123,8 @@ async def main():
       if not len(code):
         return await ctx.reply('Twitch name required.')
       code = code[0]
-      data[f'link:discord_{ctx.source_id}'] = code.lower()
-      await data.save(f'Twitch link for {code} started (discord_{ctx.source_id})')
+      accounts[f'link:discord_{ctx.source_id}'] = code.lower()
+      await accounts.save(f'Twitch link for {code} started (discord_{ctx.source_id})')
       await ctx.reply(f'Link started for `{code}`. Use `!link discord_{ctx.source_id}` in Twitch using that account to finish linking.')
     elif ctx.source_type is twitch.Context:
       if not len(code):
@@ -306,27 +141,29 @@ async def main():
         return await ctx.reply('Invalid link code. Use `!link TwitchName` in Discord/Petal to start linking.')
 
       code_key = f'link:{code}'
-      if (twitch_name := data.get(code_key)) is None:
+      # the link may have been started by another bot process sharing the data
+      await accounts.refresh(code_key)
+      if (twitch_name := accounts.get(code_key)) is None:
         return await ctx.reply('Invalid link code. Use `!link TwitchName` in Discord/Petal to start linking.')
       if ctx.source_ctx.author.name != twitch_name:
         return await ctx.reply('This link code was created for a different user. Use `!link TwitchName` in Discord/Petal to start linking.')
-      del data[code_key]
-      data[f'{link_type}:{link_id}'] = ctx.user_id
-      await data.save(f'Link finished for {twitch_name} (Code: {code})')
+      del accounts[code_key]
+      accounts[f'{link_type}:{link_id}'] = ctx.user_id
+      await accounts.save(f'Link finished for {twitch_name} (Code: {code})')
       await ctx.reply(f'{link_type.capitalize()} account linked!')
     elif ctx.source_type is PetalContext:
       if not len(code):
         return await ctx.reply('Link code required. Use `!link TwitchName` in Discord/Petal to start linking.')
       code = code[0]
-      data[f'link:petal_{ctx.source_id}'] = code.lower()
-      await data.save(f'Twitch link for {code} started (petal_{ctx.source_id})')
+      accounts[f'link:petal_{ctx.source_id}'] = code.lower()
+      await accounts.save(f'Twitch link for {code} started (petal_{ctx.source_id})')
       await ctx.reply(f'Link started for `{code}`. Use `!link petal_{ctx.source_id}` in Twitch using that account to finish linking.')
 
   async def status_command(ctx: Context, *args):
-    twitch_channel = await twitch_bot.fetch_channel(constants.BROADCASTER_CHANNEL)
-    online = await is_live()
+    twitch_channel = await twitch_bot.fetch_channel(channel)
+    online = await live_status.check()
     status = '**Online**' if online else 'Offline'
-    stream_link = f'https://twitch.tv/{constants.BROADCASTER_CHANNEL}'
+    stream_link = f'https://twitch.tv/{channel}'
     stream_link_embedded = stream_link if online else f'<{stream_link}/>'
     await ctx.reply(f'''{status}
 **Title:** {twitch_channel.title}
@@ -336,20 +173,20 @@ async def main():
   async def alert_command(ctx: Context, *args):
     # TODO: add logging
     if ctx.is_mod:
-      twitch_channel = await twitch_bot.fetch_channel(constants.BROADCASTER_CHANNEL)
+      twitch_channel = await twitch_bot.fetch_channel(channel)
       alerts_channel = discord_bot.get_channel(constants.DISCORD_ALERTS_CHANNEL_ID)
 
       await alerts_channel.send(constants.DISCORD_ALERT_FORMAT.format(
         constants.DISCORD_ALERTS_ROLE_ID,
         twitch_channel.title,
         twitch_channel.game_name,
-        constants.BROADCASTER_CHANNEL
+        channel
       ))
 
       await twitter_bot.api.statuses.update.post(status=constants.TWITTER_ALERT_FORMAT.format(
         twitch_channel.title,
         twitch_channel.game_name,
-        constants.BROADCASTER_CHANNEL
+        channel
       ))
 
   async def tweet_command(ctx: Context, *args):
@@ -365,7 +202,7 @@ async def main():
       return await ctx.reply('This command can only be used from Discord.')
     if ctx.user_id is None:
       return await reply_not_linked(ctx)
-    data['daily_reminders_list'].append(ctx.source_id)
+    daily_reminders.subscribe(ctx.source_id)
     await data.save('added Discord user to the daily reminders list')
     await ctx.reply(f'I will now send you {data[constants.DISCORD_PREFIX_KEY]}daily reminders! If you want to un-subscribe from daily reminders, use `{data[constants.DISCORD_PREFIX_KEY]}unremind`')
 
@@ -374,35 +211,30 @@ async def main():
       return await ctx.reply('This command can only be used from Discord.')
     if ctx.user_id is None:
       return await reply_not_linked(ctx)
-    data['daily_reminders_list'].remove(ctx.source_id)
-    reminder_key = f'daily_reminder:{ctx.user_id}'
-    if reminder_key in data:
-      del data[reminder_key]
+    daily_reminders.unsubscribe(ctx.source_id)
     await data.save('removed Discord user from the daily reminders list')
     await ctx.reply(f'I will not send you {data[constants.DISCORD_PREFIX_KEY]}daily reminders. If you want to re-subscribe, use `{data[constants.DISCORD_PREFIX_KEY]}remind`')
 
   async def daily_command(ctx: Context, *args):
     if ctx.user_id is None:
       return await reply_not_linked(ctx)
-    if (await is_live()):
+    if await live_status.check():
       timestamp_key = f'daily_ts:{ctx.user_id}'
+      # read-then-write keys are re-read first in case another bot process sharing the data changed them
+      await data.refresh(timestamp_key)
       now = time.time()
       subbed = await ctx.check_sub()
       if subbed is None:
         return await ctx.reply('Daily claims require your sub status to ensure the correct payout. Make sure to chat at least once in Twitch chat so that the sub status can be determined.')
 
       # if 12 hours have passed since the last daily claim
-      if now >= (time_next := (timestamp := data.get(timestamp_key, 0)) + (60 * 60 * 12)):
-        reminder_key = f'daily_reminder:{ctx.user_id}'
-        if reminder_key in data:
-          del data[reminder_key]
-        data[timestamp_key] = now
+      if now >= (time_next := data.get(timestamp_key, 0) + constants.DAILY_COOLDOWN):
         reward = random.randint(10, 100 if subbed else 50)
-        bal_key = f'bal:{ctx.user_id}'
-        bal = data[bal_key] = data.get(bal_key, 0) + reward
-        if timestamp == 0:
-          data['bal:sorted'] = list(sorted(data['bal:sorted'] + [str(ctx.user_id)], key=lambda u: data.get(f'bal:{u}', 0), reverse=True))
-        await data.save('daily claimed')
+        with ledger.transaction('daily claimed') as tx:
+          tx.delete(f'daily_reminder:{ctx.user_id}')
+          tx.set(timestamp_key, now)
+          tx.credit(ctx.user_id, reward)
+        bal = ledger.balance(ctx.user_id)
         emoji = data['currency_emoji']
         await ctx.reply(f'Thanks for claiming your daily! Got {reward}{emoji} {" (sub bonus)" if subbed else ""}, Total: {bal}{emoji}')
       else:
@@ -410,30 +242,31 @@ async def main():
         hours, minutes = map(int, divmod(minutes_remaining, 60))
         await ctx.reply(f'You have already claimed a daily recently. Try again in {hours} hour{"s" if hours != 1 else ""} and {minutes} minute{"s" if minutes != 1 else ""}.')
     else:
-      await ctx.reply(f'Since {constants.BROADCASTER_CHANNEL} is not live, the daily command cannot be used.')
+      await ctx.reply(f'Since {channel} is not live, the daily command cannot be used.')
 
   async def lb_command(ctx: Context, *args):
-    channels = await asyncio.gather(*(twitch_bot.fetch_channel(i) for i in data.get('bal:sorted', [])[:10]))
-    names = (c.user.name for c in channels)
+    user_ids = [user_id for user_id, _ in leaderboard.top(10)]
+    found = await twitch_bot.user_cache.names(user_ids)
+    names = (found.get(user_id, 'unknown') for user_id in user_ids)
     result = ', '.join(f'{i}. {n}' for i, n in enumerate(names, start=1))
     await ctx.reply(f'{data.get("currency_emoji")} leaderboard: {result}')
 
   async def bal_command(ctx: Context, *args):
     if ctx.user_id is None:
       return await reply_not_linked(ctx)
-    bal_key = f'bal:{ctx.user_id}'
     emoji = data['currency_emoji']
-    await ctx.reply(f'You have {data.get(bal_key, 0)}{emoji}')
+    rank = leaderboard.rank(ctx.user_id)
+    await ctx.reply(f'You have {ledger.balance(ctx.user_id)}{emoji}{f" (rank #{rank} of {len(leaderboard)})" if rank else ""}')
 
   async def buybox_command(ctx: Context, *args):
     if ctx.user_id is None:
       return await reply_not_linked(ctx)
-    bal_key = f'bal:{ctx.user_id}'
+    await data.refresh(f'bal:{ctx.user_id}', f'inv:{ctx.user_id}')
     quantity = 1
 
     if (len(args) > 0):
       if (num_argument := args[0]) == 'all':
-        quantity = data.get(bal_key, 0) // 50
+        quantity = ledger.balance(ctx.user_id) // constants.LOOT_BOX_PRICE
         if quantity < 1:
           return await ctx.reply('Insufficient flowers.')
       else:
@@ -444,109 +277,110 @@ async def main():
         except ValueError:
           return await ctx.reply('Invalid number of boxes.')
 
-    if (bal := data.get(bal_key, 0)) >= 50 * quantity:
-      boxes = [await create_loot_box(ctx)]
-      boxes_key = f'boxes:{ctx.user_id}'
-      try:
-        data[boxes_key].append(boxes[0])
-      except KeyError:
-        data[boxes_key] = [boxes[0]]
-      for _ in range(quantity - 1):
-        boxes.append(await create_loot_box(ctx))
-        data[boxes_key].append(boxes[-1])
-
-      data[bal_key] = bal - (50 * quantity)
-      await data.save('box purchased')
-      emoji = data['currency_emoji']
-
-      quantities = {
-        constants.RARITY_COMMON: 0,
-        constants.RARITY_UNCOMMON: 0,
-        constants.RARITY_RARE: 0,
-        constants.RARITY_MYTHIC: 0,
-        constants.RARITY_LEGENDARY: 0
-      }
-
-      for box in boxes:
-        quantities[box['rarity']] += 1
-
-      boxes_str = '\n' + '\n'.join(f'{rarity} ({quantity})' for rarity, quantity in quantities.items() if quantity) + '\n\n'
-
-      await ctx.reply(f'Obtained: {boxes_str}Paid {50 * quantity}{emoji}')
-    else:
-      await ctx.reply('Insufficient flowers.')
+    price = constants.LOOT_BOX_PRICE * quantity
+    try:
+      # one weighted draw for every box; the debit is staged first so a short balance changes nothing
+      with ledger.transaction('box purchased') as tx:
+        tx.debit(ctx.user_id, price)
+        counts = loot.draw_box_rarities(quantity)
+        inventory = inventories.get(ctx.user_id)
+        inventory.add_boxes(counts)
+        inventories.stage(tx, ctx.user_id, inventory)
+    except InsufficientFunds:
+      return await ctx.reply('Insufficient flowers.')
+    emoji = data['currency_emoji']
+
+    await ctx.reply(f'Obtained: \n{loot.format_counts(counts)}\n\nPaid {price}{emoji}')
 
   async def boxes_command(ctx: Context, *args):
     if ctx.user_id is None:
       return await reply_not_linked(ctx)
-    if not (boxes := data.get(f'boxes:{ctx.user_id}')):
+    if not (counts := inventories.get(ctx.user_id).box_counts()):
       return await ctx.reply('Your inventory is empty. :(')
 
-    quantities = {
-      constants.RARITY_COMMON: 0,
-      constants.RARITY_UNCOMMON: 0,
-      constants.RARITY_RARE: 0,
-      constants.RARITY_MYTHIC: 0,
-      constants.RARITY_LEGENDARY: 0
-    }
-
-    for box in boxes:
-      quantities[box['rarity']] += 1
-
-    boxes_str = '\n' + '\n'.join(f'{rarity} ({quantity})' for rarity, quantity in quantities.items() if quantity)
-    await ctx.reply(f'Loot boxes: {boxes_str}')
+    await ctx.reply(f'Loot boxes: \n{loot.format_counts(counts)}')
 
   async def inv_command(ctx: Context, *args):
     if ctx.user_id is None:
       return await reply_not_linked(ctx)
-    if not (items := data.get(f'inv:{ctx.user_id}')):
+    if not len(inventory := inventories.get(ctx.user_id)):
       return await ctx.reply('Your inventory is empty. :(')
 
-    items = (f'{x}. {item["rarity"]} {item["name"]}  [+{item["reforge_stat"]} {item["stat_type"]}]' for x, item in enumerate(items, 0))
-    await ctx.reply(constants.INVENTORY_TEMPLATE.format('\n'.join(items)))
+    items = (f'{x}. {item.rarity} {item.name}  [+{item.reforge_stat} {item.stat_type}]' for x, item in enumerate(inventory.items(), 0))
+    content = constants.INVENTORY_TEMPLATE.format('\n'.join(items))
+    if ctx.reply_file is not None and (card := await cards.inventory_card(inventory)) is not None:
+      return await ctx.reply_file(content, *card)
+    await ctx.reply(content)
 
   async def item_command(ctx: Context, *args):
-    await ctx.reply('Under construction! wait patiently..... or not idc')
-
-  # async def usebox_command(ctx: Context, *args):
-  #   if ctx.user_id is None:
-  #     return await reply_not_linked(ctx)
-
-  #   boxes_key = f'boxes:{ctx.user_id}'
-  #   if not (boxes := data.get(boxes_key)):
-  #     return await ctx.reply('Your inventory is empty. :(')
-
-  #   box_to_open = None
-
-  #   if len(args) > 0:
-  #     rarity = resolve_box_rarity(args[0])
-  #     if rarity is None:
-  #       return await ctx.reply('Invalid box rarity.')
-  #     for box in boxes:
-  #       if box['rarity'] == rarity:
-  #         box_to_open = box
-  #         break
-  #     if box_to_open is None:
-  #       return await ctx.reply('You do not have any boxes of that rarity.')
-
-  #   else:
-  #     # find most recent box
-  #     box_to_open = sorted(boxes, key=lambda b: b['timestamp'])[-1]
+    if ctx.user_id is None:
+      return await reply_not_linked(ctx)
+    if not len(inventory := inventories.get(ctx.user_id)):
+      return await ctx.reply('Your inventory is empty. :(')
 
-  #   boxes.remove(box_to_open)
-  #   data[boxes_key] = boxes
+    try:
+      index = int(args[0]) if len(args) > 0 else len(inventory) - 1
+      if not 0 <= index < len(inventory):
+        raise IndexError(index)
+      item = inventory.item(index)
+    except (ValueError, IndexError):
+      return await ctx.reply(f'Invalid item number, use 0 to {len(inventory) - 1}.')
 
-  #   items = util.items_from_box(box_to_open)
-  #   inv_key = f'inv:{ctx.user_id}'
-  #   try:
-  #     data[inv_key] += [*items]
-  #   except KeyError:
-  #     data[inv_key] = [*items]
-  #   data.save('box opened')
+    content = f'{item.rarity} {item.name}  [+{item.reforge_stat} {item.stat_type}]'
+    if ctx.reply_file is not None and (card := await cards.item_card(item)) is not None:
+      return await ctx.reply_file(content, *card)
+    await ctx.reply(content)
 
-  #   items_str = '\n' + '\n'.join(f'{item["rarity"]} {item["name"]} [+{item["rarity_stat"]} {item["stat_type"]}]' for item in items) + '\n\n'
+  async def usebox_command(ctx: Context, *args):
+    if ctx.user_id is None:
+      return await reply_not_linked(ctx)
+    await data.refresh(f'inv:{ctx.user_id}')
+    inventory = inventories.get(ctx.user_id)
+    if not (boxes := inventory.box_counts()):
+      return await ctx.reply('Your inventory is empty. :(')
 
-  #   await ctx.reply(f'Obtained: {items_str}')
+    # !usebox all | !usebox [rarity] [quantity|all], defaulting to one of the rarest boxes owned
+    if len(args) > 0 and args[0] == 'all':
+      counts = boxes
+    else:
+      rarity = list(boxes)[-1]
+      quantity = 1
+      if len(args) > 0:
+        if (rarity := loot.resolve_rarity(args[0])) is None:
+          return await ctx.reply('Invalid box rarity.')
+        if rarity not in boxes:
+          return await ctx.reply('You do not have any boxes of that rarity.')
+      if len(args) > 1:
+        if args[1] == 'all':
+          quantity = boxes[rarity]
+        else:
+          try:
+            quantity = int(args[1])
+          except ValueError:
+            return await ctx.reply('Invalid number of boxes.')
+          if quantity < 1:
+            return await ctx.reply('Invalid number of boxes.')
+          if quantity > boxes[rarity]:
+            return await ctx.reply(f'You only have {boxes[rarity]} {rarity} box{"es" if boxes[rarity] != 1 else ""}.')
+      counts = {rarity: quantity}
+
+    for rarity, quantity in counts.items():
+      inventory.remove_boxes(rarity, quantity)
+    opened = loot_table.open_boxes(counts)
+    for name, rarity, reforge_stat in opened:
+      inventory.add_item(name, rarity, reforge_stat)
+    inventories.put(ctx.user_id, inventory)
+    await data.save('box opened')
+
+    await ctx.reply(f'Obtained: \n{format_opened(opened)}')
+
+  # !stats for command/handler timings, !stats <data|live|ledger|scoring|reminders|sub_status|petal|bridge|log> for one component
+  # (data_<channel>, live_<channel>, ... for the other channels)
+  async def stats_command(ctx: Context, *args):
+    if ctx.is_mod:
+      if (summary := metrics.registry.summary(args[0] if len(args) else None)) is None:
+        return await ctx.reply(f'Unknown stats, use one of: {", ".join(name.removeprefix(metrics.registry.prefix) for name in metrics.registry.collectors)}')
+      await ctx.reply(summary)
 
   async def sub_command(ctx: Context, *args):
     if await ctx.check_sub():
@@ -558,10 +392,8 @@ async def main():
     else:
       await ctx.reply('wtf why aren\'t you subbed????')
 
-  add_commands(
+  commands = [
     edit_command,
-    alert_command,
-    tweet_command,
     status_command,
     link_command,
     code_command,
@@ -577,8 +409,6 @@ async def main():
     lcsg_command,
     twitter_command,
     youtube_command,
-    remind_command,
-    unremind_command,
     daily_command,
     lb_command,
     bal_command,
@@ -586,26 +416,191 @@ async def main():
     boxes_command,
     inv_command,
     item_command,
-    # usebox_command,
-    sub_command
+    usebox_command,
+    sub_command,
+    stats_command
+  ]
+  if primary:
+    commands += [alert_command, tweet_command, remind_command, unremind_command]
+
+  return SimpleNamespace(
+    channel=channel,
+    data=data,
+    leaderboard=leaderboard,
+    inventories=inventories,
+    live_status=live_status,
+    ledger=ledger,
+    scoring_pipeline=scoring_pipeline,
+    daily_reminders=daily_reminders,
+    commands={coro.__name__.replace('_command', ''): coro for coro in commands}
   )
 
-  async def daily_reminders_task():
-    await discord_bot.wait_until_ready()
+# wires every service, event handler and command onto the given bots and returns the services.
+# main passes the real clients, benchmarks/replay.py passes stand-ins. `channel_data` holds the
+# BotData of every channel after the first, by channel name; the first channel uses `data`
+def setup(data: BotData, twitch_bot: TwitchBot, discord_bot: DiscordBot, twitter_bot: TwitterBot, petal_bot: PetalBot,
+    channel_data: dict = None):
+  # every channel's scoring shares one pool instead of each starting its own workers, and the loot
+  # table and card renderer (with its fonts and card cache) are built once for all of them too
+  scoring_executor = scoring.create_executor()
+  loot_table = loot.LootTable()
+  cards = CardRenderer()
+  channels = {constants.BROADCASTER_CHANNEL: setup_channel(constants.BROADCASTER_CHANNEL, data, data, twitch_bot, discord_bot,
+    twitter_bot, petal_bot, scoring_executor, loot_table, cards)}
+  for channel, shard in (channel_data or {}).items():
+    channels[channel] = setup_channel(channel, shard, data, twitch_bot, discord_bot, twitter_bot, petal_bot, scoring_executor,
+      loot_table, cards)
+  primary = channels[constants.BROADCASTER_CHANNEL]
+  live_poller = LiveStatusPoller(twitch_bot)
+  for services in channels.values():
+    live_poller.add(services.live_status)
+
+  # the first channel's components keep their names, the others get their channel appended
+  for channel, services in channels.items():
+    suffix = '' if services is primary else f'_{channel}'
+    metrics.registry.add_collector(f'data{suffix}', services.data.stats)
+    metrics.registry.add_collector(f'live{suffix}', services.live_status.stats)
+    metrics.registry.add_collector(f'ledger{suffix}', services.ledger.stats)
+    metrics.registry.add_collector(f'scoring{suffix}', services.scoring_pipeline.stats)
+    if services.daily_reminders is not None:
+      metrics.registry.add_collector(f'reminders{suffix}', services.daily_reminders.stats)
+    if (bridge := petal_bot.bridges.get(channel)) is not None:
+      metrics.registry.add_collector(f'bridge{suffix}', bridge.stats, label='destination')
+  metrics.registry.add_collector('sub_status', twitch_bot.sub_status.stats)
+  metrics.registry.add_collector('petal', petal_bot.stats)
+  metrics.registry.add_collector('log', logger.stats)
+
+  # on message, do chatter-based logic here
+  @twitch_bot.event()
+  async def event_message(message: TwitchMessage):
+    if message.author is None or message.author.name == twitch_bot.nick: return
+    if message.channel is None or (services := channels.get(message.channel.name)) is None: return
+    started = time.perf_counter()
+    twitch_bot.user_cache.remember(message.author.id, message.author.name)
+    if services is primary:
+      twitch_bot.sub_status.observe_message(irc.parse(message.raw_data))
+    if services.live_status.is_live():
+      services.scoring_pipeline.submit(message.author.id, message.raw_data)
+    MESSAGE_SECONDS.observe(time.perf_counter() - started)
+
+  @discord_bot.event
+  async def on_voice_state_update(member, before, after):
+    if member.id == constants.DISCORD_BROADCASTER_ID:
+      if before.channel is not None and \
+        before.channel.id == constants.DISCORD_LIVE_VOICE_CHANNEL_ID and \
+        (after.channel is None or after.channel.id != constants.DISCORD_LIVE_VOICE_CHANNEL_ID):
+
+        reason = 'broadcaster left LIVE channel'
+        guild = before.channel.guild
+        live_voice_channel = before.channel
+        closed_voice_channel = guild.get_channel(constants.DISCORD_CLOSED_VOICE_CHANNEL_ID)
+
+        discord_bot.log_info('disabling LIVE channel for members')
+        await live_voice_channel.set_permissions(live_voice_channel.guild.default_role, view_channel=False, connect=False, reason=reason)
+        discord_bot.log_done('disabled LIVE channel')
+        if (num_members := len(live_voice_channel.members)):
+          discord_bot.log_info(f'moving {num_members} members')
+          move_gen = (m.move_to(closed_voice_channel, reason=reason) for m in live_voice_channel.members)
+          await asyncio.gather(*move_gen)
+          discord_bot.log_done('moved members')
+
+      elif after.channel is not None and \
+        after.channel.id == constants.DISCORD_LIVE_VOICE_CHANNEL_ID and \
+        (before.channel is None or before.channel.id != constants.DISCORD_LIVE_VOICE_CHANNEL_ID):
+
+        reason = 'broadcaster joined LIVE channel'
+        live_voice_channel = after.channel
+
+        discord_bot.log_info('enabling LIVE channel for members')
+        await live_voice_channel.set_permissions(live_voice_channel.guild.default_role, view_channel=True, connect=False, reason=reason)
+        discord_bot.log_done('enabled LIVE channel')
+
+  async def handle_reaction(reaction: DiscordRawReactionActionEvent):
+    # TODO: add logging
+    if reaction.channel_id == constants.DISCORD_REACTION_ROLES_CHANNEL_ID:
+      role = None
+
+      if reaction.event_type == 'REACTION_ADD':
+        member = reaction.member
+      else:
+        member = await (discord_bot.get_guild(reaction.guild_id)).fetch_member(reaction.user_id)
+
+      if reaction.emoji.name == constants.DISCORD_REACTION_ROLES_ALERTS_EMOJI:
+        role = member.guild.get_role(constants.DISCORD_ALERTS_ROLE_ID)
+      elif reaction.emoji.name == constants.DISCORD_REACTION_ROLES_RESCUE_EMOJI:
+        role = member.guild.get_role(constants.DISCORD_TIMER_ALERTS_ROLE_ID)
+      elif reaction.event_type == 'REACTION_ADD':
+        await (
+          await (
+            discord_bot.get_channel(reaction.channel_id)
+          ).fetch_message(reaction.message_id)
+        ).remove_reaction(reaction.emoji, member)
+
+      if role is not None:
+        if reaction.event_type == 'REACTION_ADD':
+          await member.add_roles(role)
+        else:
+          await member.remove_roles(role)
 
-    while discord_bot.is_ready():
-      if await is_live():
-        for discord_id in data['daily_reminders_list']:
-          twitch_id = data[f'discord:{discord_id}']
-          reminder_key = f'daily_reminder:{twitch_id}'
-          if data.get(reminder_key) is not None:
-            continue
+  @discord_bot.event
+  async def on_member_join(member):
+    # TODO: add logging
+    await member.add_roles(member.guild.get_role(constants.DISCORD_ALERTS_ROLE_ID))
+
+  @discord_bot.event
+  async def on_member_update(before, after):
+    if before.roles != after.roles:
+      twitch_bot.sub_status.observe_member_update(before, after)
+
+  @discord_bot.event
+  async def on_raw_reaction_add(payload):
+    await handle_reaction(payload)
+
+  @discord_bot.event
+  async def on_raw_reaction_remove(payload):
+    await handle_reaction(payload)
+
+  @discord_bot.check
+  async def __limit_commands_to_channels(ctx: discord.Context):
+    return ctx.guild is not None and ctx.channel.id in constants.DISCORD_CHANNEL_IDS
+
+
+  # times every run of a command (and counts the ones that raise) per platform
+  def instrument(coro, name: str, platform: str):
+    async def __instrumented(ctx: Context, *args):
+      started = time.perf_counter()
+      try:
+        await coro(ctx, *args)
+      except Exception:
+        COMMAND_ERRORS.inc(name, platform)
+        raise
+      finally:
+        COMMAND_SECONDS.observe(time.perf_counter() - started, name, platform)
+    return __instrumented
+
+  # Twitch commands run against the economy of the channel they were sent in, Discord and Petal
+  # ones against the first channel's. commands missing from a channel (alert, tweet...) are ignored there
+  def add_command(name: str):
+    twitch_coros = {
+      channel: instrument(services.commands[name], name, 'twitch')
+      for channel, services in channels.items() if name in services.commands
+    }
+    discord_coro = instrument(primary.commands[name], name, 'discord')
+
+    @twitch_bot.command(name=name)
+    async def __twitch_command(ctx, *args):
+      if (twitch_coro := twitch_coros.get(ctx.channel.name)) is not None:
+        await twitch_coro(Context(twitch_bot, discord_bot, petal_bot, ctx, data), *args)
+
+    @discord_bot.command(name=name)
+    async def __discord_command(ctx, *args):
+      await discord_coro(Context(twitch_bot, discord_bot, petal_bot, ctx, data), *args)
+
+    petal_bot.add_command(name, instrument(primary.commands[name], name, 'petal'))
+
+  for name in primary.commands:
+    add_command(name)
 
-          if time.time() >= data.get(f'daily_ts:{twitch_id}', 0) + (60 * 60 * 12):
-            await (await discord_bot.fetch_user(discord_id)).send('You can use the daily command again!')
-            data[reminder_key] = True
-            await data.save('stored reminder flag')
-      await asyncio.sleep(60)
 
   # async def subathon_task():
   #   await discord_bot.wait_until_ready()
@@ -632,35 +627,82 @@ async def main():
   #         sent_timer_alert = False
   #       await asyncio.sleep(constants.SUBATHON_TIMER_ALERT_TIMEOUT)
 
-  async def live_indicator_task():
+  @primary.live_status.add_listener
+  async def update_live_indicator(live: bool):
     # TODO: add logging
     await discord_bot.wait_until_ready()
 
     live_voice_channel = discord_bot.get_channel(constants.DISCORD_LIVE_VOICE_CHANNEL_ID)
-    live_indicator_active = False
-
-    while discord_bot.is_ready():
-      if await is_live():
-        if not live_indicator_active:
-          await twitter_bot.api.account.update_profile.post(
-            name=constants.TWITTER_LIVE_DISPLAY_NAME
-          )
-          await live_voice_channel.guild.edit(name=constants.DISCORD_LIVE_GUILD_NAME)
-          live_indicator_active = True
-      elif live_indicator_active:
-        await twitter_bot.api.account.update_profile.post(
-          name=constants.TWITTER_DISPLAY_NAME
-        )
-        await live_voice_channel.guild.edit(name=constants.DISCORD_GUILD_NAME)
-        live_indicator_active = False
-      await asyncio.sleep(constants.LIVE_INDICATOR_TIMEOUT)
+
+    if live:
+      await twitter_bot.api.account.update_profile.post(
+        name=constants.TWITTER_LIVE_DISPLAY_NAME
+      )
+      await live_voice_channel.guild.edit(name=constants.DISCORD_LIVE_GUILD_NAME)
+    else:
+      await twitter_bot.api.account.update_profile.post(
+        name=constants.TWITTER_DISPLAY_NAME
+      )
+      await live_voice_channel.guild.edit(name=constants.DISCORD_GUILD_NAME)
+
+  async def warm_up_sub_status():
+    await discord_bot.wait_until_ready()
+    twitch_bot.sub_status.warm_up(discord_bot.guilds)
+
+  return SimpleNamespace(
+    leaderboard=primary.leaderboard,
+    inventories=primary.inventories,
+    live_status=primary.live_status,
+    ledger=primary.ledger,
+    scoring_pipeline=primary.scoring_pipeline,
+    scoring_executor=scoring_executor,
+    daily_reminders=primary.daily_reminders,
+    warm_up_sub_status=warm_up_sub_status,
+    channels=channels,
+    live_poller=live_poller
+  )
+
+async def main():
+  util.print_box(f'{constants.BOT_NAME} v{VERSION}')
+
+  data = BotData(create_backend())
+  # every channel after the first has its own store, loaded alongside
+  channel_data = {channel: BotData(create_backend(channel=channel), channel=channel) for channel in constants.BROADCASTER_CHANNELS[1:]}
+  await asyncio.gather(data.load(), *(shard.load() for shard in channel_data.values()))
+  data.start()
+  for shard in channel_data.values():
+    shard.start()
+
+  twitch_bot = TwitchBot(constants.TWITCH_TOKEN, data)
+  discord_bot = DiscordBot(data)
+  twitter_bot = TwitterBot(
+    constants.TWITTER_KEY,
+    constants.TWITTER_SECRET,
+    constants.TWITTER_ACCESS_TOKEN,
+    constants.TWITTER_ACCESS_TOKEN_SECRET
+  )
+  petal_bot = PetalBot(data, constants.PETAL_TOKEN, constants.PETAL_NAME, twitch_bot, discord_bot)
+  services = setup(data, twitch_bot, discord_bot, twitter_bot, petal_bot, channel_data)
 
   await discord_bot.login(constants.DISCORD_TOKEN)
-  asyncio.create_task(daily_reminders_task())
+  services.daily_reminders.start()
   # asyncio.create_task(subathon_task())
-  asyncio.create_task(live_indicator_task())
+  asyncio.create_task(services.live_poller.run())
+  asyncio.create_task(services.warm_up_sub_status())
+  for channel in services.channels.values():
+    channel.ledger.start()
+    channel.scoring_pipeline.start()
+  await metrics.registry.serve()
   asyncio.create_task(petal_bot.login())
-  await asyncio.gather(*(bot.connect() for bot in [twitch_bot, discord_bot]))
+  try:
+    await asyncio.gather(*(bot.connect() for bot in [twitch_bot, discord_bot]))
+  finally:
+    for channel in services.channels.values():
+      await channel.scoring_pipeline.close()
+      await channel.ledger.close()
+      await channel.data.close()
+    services.scoring_executor.shutdown(wait=False)
+    await metrics.registry.close()
 
 if __name__ == '__main__':
   try:
@@ -1,10 +1,16 @@
-import json
-
-from aiofiles import open as aiopen
-from aiofiles.threadpool.text import AsyncTextIOWrapper
+import asyncio
+import os
+import time
 
 import constants
+import metrics
 from loggable import Loggable
+from storage import JsonBackend, StorageBackend, shard_path
+
+SAVES = metrics.registry.counter('data_saves_total', 'BotData.save calls')
+FLUSH_SECONDS = metrics.registry.histogram('data_flush_seconds', 'time to write dirty keys to the backend')
+FLUSHED_KEYS = metrics.registry.counter('data_flushed_keys_total', 'keys written to the backend')
+FLUSH_ERRORS = metrics.registry.counter('data_flush_errors_total', 'failed backend writes')
 
 
 class BotData(dict, Loggable):
@@ -14,49 +20,200 @@ class BotData(dict, Loggable):
     constants.DISCORD_PREFIX_KEY: constants.DEFAULT_PREFIX,
     constants.PETAL_PREFIX_KEY: constants.DEFAULT_PREFIX,
     'currency_emoji': constants.DEFAULT_CURRENCY_EMOJI,
-    'bal:sorted': [],
     'daily_reminders_list': []
   }
 
-  def __init__(self, path: str):
+  def __init__(self, backend: StorageBackend, write_behind: bool = constants.DATA_WRITE_BEHIND,
+      flush_interval: float = constants.DATA_FLUSH_INTERVAL, flush_threshold: int = constants.DATA_FLUSH_THRESHOLD,
+      channel: str = None):
     super().__init__()
-    self.path = path
+    self.backend = backend
+    # whose economy this is. the first channel's data (channel None) also holds the Discord/Petal links and user caches
+    self.channel = channel
+    self.name = f'{channel} data' if channel is not None and channel != constants.BROADCASTER_CHANNEL else 'data'
+    self.write_behind = write_behind
+    self.flush_interval = flush_interval
+    self.flush_threshold = flush_threshold
+    self.dirty = 0
+    self.dirty_reasons = set()
+    self.dirty_keys = set()
+    # key -> amount added since the last flush, for counters on a shared backend (see increment)
+    self.dirty_deltas = {}
+    self.indexes = []
+    self.__flush_requested = asyncio.Event()
+    self.__flush_lock = asyncio.Lock()
+    self.__flusher = None
+
+  # key-level change tracking. values mutated in place (lists, dicts) must be touch()ed
+  # a plain write replaces any increments still pending for the key
+  def __setitem__(self, key, value):
+    super().__setitem__(key, value)
+    self.dirty_keys.add(key)
+    if self.dirty_deltas:
+      self.dirty_deltas.pop(key, None)
+    self.__index_set(key, value)
+  def __delitem__(self, key):
+    super().__delitem__(key)
+    self.dirty_keys.add(key)
+    if self.dirty_deltas:
+      self.dirty_deltas.pop(key, None)
+    self.__index_discard(key)
+  def pop(self, key, *default):
+    if key in self:
+      self.dirty_keys.add(key)
+      if self.dirty_deltas:
+        self.dirty_deltas.pop(key, None)
+      self.__index_discard(key)
+    return super().pop(key, *default)
+  def touch(self, key):
+    self.dirty_keys.add(key)
+
+  def __index_set(self, key, value):
+    for prefix, index in self.indexes:
+      if key.startswith(prefix):
+        index.set(key[len(prefix):], value)
+  def __index_discard(self, key):
+    for prefix, index in self.indexes:
+      if key.startswith(prefix):
+        index.discard(key[len(prefix):])
 
-  async def __read_dict_from_file(self, aiof: AsyncTextIOWrapper):
-    return self.defaults | json.loads(await aiof.read())
-  async def __write_dict_to_file(self, obj: dict, aiof: AsyncTextIOWrapper):
-    await aiof.write(json.dumps(obj, indent=2, sort_keys=True))
+  # integer counters (balances). on a shared backend the flush sends the amount added rather than the
+  # value, so increments from several processes add up instead of the last writer winning
+  def increment(self, key: str, amount: int):
+    value = self.get(key, 0) + amount
+    if not self.backend.shared or key in self.dirty_keys:
+      self[key] = value
+    else:
+      super().__setitem__(key, value)
+      self.dirty_deltas[key] = self.dirty_deltas.get(key, 0) + amount
+      self.__index_set(key, value)
+    return value
+
+  # keeps `index` (set/discard/rebuild) in sync with every key under `prefix`
+  def add_index(self, prefix: str, index):
+    self.indexes.append((prefix, index))
+    index.rebuild((key[len(prefix):], value) for key, value in self.items() if key.startswith(prefix))
 
   async def load(self):
-    self.log_info('loading data')
+    self.log_info(f'loading {self.name} ({type(self.backend).__name__})')
     try:
-      async with aiopen(self.path) as aiof:
-        self.clear()
-        self.update(await self.__read_dict_from_file(aiof))
-      self.log_done('loaded data')
-    except FileNotFoundError:
-      self.log_error('file not found, creating a new data file')
-      async with aiopen(self.path, 'w') as aiof:
-        await self.__write_dict_to_file(self.defaults, aiof)
-        self.clear()
-      self.log_done('created file')
+      loaded = await self.backend.load()
     except Exception as exc:
       self.log_error('an unexpected error occurred while loading data:')
       raise exc
 
+    if not loaded and not isinstance(self.backend, JsonBackend) and os.path.exists(import_path := shard_path(constants.DATA_PATH, self.channel)):
+      self.log_info(f'backend is empty, importing {import_path}')
+      loaded = await JsonBackend(import_path).load()
+      await self.backend.write(loaded, set(loaded))
+
+    self.clear()
+    self.update(self.defaults | loaded)
+    self.dirty_keys.clear()
+    # the balance leaderboard used to be persisted as a list of every user ID
+    self.pop('bal:sorted', None)
+    for prefix, index in self.indexes:
+      index.rebuild((key[len(prefix):], value) for key, value in self.items() if key.startswith(prefix))
+    self.log_done(f'loaded {self.name} ({len(self)} keys)')
+
+  async def refresh(self, *keys: str):
+    # re-read keys that another process sharing the backend may have written. keys with changes
+    # of our own still waiting for a flush keep their in-memory value
+    if not self.backend.shared:
+      return
+    values = await self.backend.get_many(keys)
+    for key in keys:
+      if key in self.dirty_keys or key in self.dirty_deltas:
+        continue
+      if key in values:
+        super().__setitem__(key, values[key])
+        self.__index_set(key, values[key])
+      elif key in self.defaults:
+        super().__setitem__(key, self.defaults[key])
+      elif key in self:
+        super().pop(key)
+        self.__index_discard(key)
+
   async def save(self, reason=None):
-    self.log_info(f'saving data ({reason if reason else "unspecified reason"})')
+    SAVES.inc()
+    self.dirty += 1
+    self.dirty_reasons.add(reason if reason else 'unspecified reason')
 
-    async with aiopen(self.path) as aiof:
-      backup = await self.__read_dict_from_file(aiof)
+    if not self.write_behind:
+      await self.flush()
+    elif self.dirty >= self.flush_threshold:
+      self.__flush_requested.set()
 
-    try:
-      async with aiopen(self.path, 'w') as aiof:
-        await self.__write_dict_to_file(self, aiof)
-      self.log_done('saved data')
-    except Exception as exc:
-      async with aiopen(self.path, 'w') as aiof:
-        await self.__write_dict_to_file(backup, aiof)
+  # writes whatever changed, whether or not a save() asked for it: the save counter only decides
+  # when a write-behind flush is due
+  async def flush(self):
+    async with self.__flush_lock:
+      if not self.dirty_keys and not self.dirty_deltas:
+        self.dirty = 0
+        self.dirty_reasons = set()
+        return
 
-      self.log_error('an error occurred while saving data:')
-      raise exc
+      changes, reasons, keys, deltas = self.dirty, self.dirty_reasons, self.dirty_keys, self.dirty_deltas
+      self.dirty, self.dirty_reasons, self.dirty_keys, self.dirty_deltas = 0, set(), set(), {}
+      self.log_info(f'saving {self.name} ({", ".join(sorted(reasons)) or "unsaved changes"}{f", {changes} changes" if changes > 1 else ""})')
+      flushed = len(keys) + len(deltas)
+
+      started = time.perf_counter()
+      try:
+        if keys:
+          await self.backend.write(self, keys)
+          keys = set()
+        if deltas:
+          totals = await self.backend.increment(deltas)
+          # the backend's totals include other processes' increments; anything added locally while
+          # this was in flight is still pending on top of them
+          for key, total in totals.items():
+            if key not in self.dirty_keys:
+              value = total + self.dirty_deltas.get(key, 0)
+              super().__setitem__(key, value)
+              self.__index_set(key, value)
+          deltas = {}
+        FLUSH_SECONDS.observe(time.perf_counter() - started)
+        FLUSHED_KEYS.inc(amount=flushed)
+        self.log_done(f'saved {self.name}')
+      except Exception as exc:
+        FLUSH_ERRORS.inc()
+        self.dirty += changes
+        self.dirty_reasons |= reasons
+        self.dirty_keys |= keys
+        for key, amount in deltas.items():
+          if key not in self.dirty_keys:
+            self.dirty_deltas[key] = self.dirty_deltas.get(key, 0) + amount
+        self.log_error(f'an error occurred while saving {self.name}:')
+        raise exc
+
+  async def __flush_task(self):
+    while True:
+      try:
+        await asyncio.wait_for(self.__flush_requested.wait(), self.flush_interval)
+      except asyncio.TimeoutError:
+        pass
+      self.__flush_requested.clear()
+      try:
+        # shielded so close() cancelling this task never interrupts a write halfway
+        await asyncio.shield(self.flush())
+      except Exception as exc:
+        self.log_error(f'failed to flush {self.name}', exc=exc)
+
+  def stats(self):
+    return {
+      'keys': len(self),
+      'pending_saves': self.dirty,
+      'dirty_keys': len(self.dirty_keys)
+    }
+
+  def start(self):
+    if self.write_behind and self.__flusher is None:
+      self.__flusher = asyncio.create_task(self.__flush_task())
+
+  async def close(self):
+    if self.__flusher is not None:
+      self.__flusher.cancel()
+      self.__flusher = None
+    await self.flush()
+    await self.backend.close()
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from collections import deque
+
+import constants
+import metrics
+from loggable import Loggable
+
+SEND_SECONDS = metrics.registry.histogram('bridge_send_seconds', 'time to send one relayed message', ('destination',))
+
+
+class TokenBucket:
+  def __init__(self, rate: int, per: float, burst: int = None):
+    self.rate = rate / per
+    self.capacity = burst or rate
+    self.tokens = self.capacity
+    self.updated_at = time.monotonic()
+
+  def __refill(self):
+    now = time.monotonic()
+    self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+    self.updated_at = now
+
+  def try_acquire(self):
+    self.__refill()
+    if self.tokens >= 1:
+      self.tokens -= 1
+      return True
+    return False
+
+  async def acquire(self):
+    while not self.try_acquire():
+      await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class BridgeDestination(Loggable):
+  # one outbound queue per platform. lines that pile up while waiting on the rate limit are
+  # merged into a single message with `separator` when the platform allows it (None disables merging)
+  def __init__(self, name: str, send, rate: int, per: float, max_length: int, separator: str = None,
+      queue_size: int = constants.BRIDGE_QUEUE_SIZE):
+    self.name = name
+    self.send = send
+    self.bucket = TokenBucket(rate, per)
+    self.max_length = max_length
+    self.separator = separator
+    self.queue_size = queue_size
+    self.pending = deque()
+    self.__pending_event = asyncio.Event()
+    self.sent = 0
+    self.merged = 0
+    self.dropped = 0
+    self.failed = 0
+
+  def put(self, line: str):
+    if len(self.pending) >= self.queue_size:
+      self.dropped += 1
+      return
+    self.pending.append(line[:self.max_length])
+    self.__pending_event.set()
+
+  def __next_message(self):
+    line = self.pending.popleft()
+    if self.separator is None:
+      return line
+    while self.pending and len(merged := f'{line}{self.separator}{self.pending[0]}') <= self.max_length:
+      self.pending.popleft()
+      line = merged
+      self.merged += 1
+    return line
+
+  async def run(self):
+    while True:
+      if not self.pending:
+        self.__pending_event.clear()
+        await self.__pending_event.wait()
+        continue
+      await self.bucket.acquire()
+      started = time.perf_counter()
+      try:
+        await self.send(self.__next_message())
+        SEND_SECONDS.observe(time.perf_counter() - started, self.name)
+        self.sent += 1
+      except Exception as exc:
+        self.failed += 1
+        self.log_error(f'bridge send to {self.name} failed: {exc!r}', sample=f'bridge send {self.name}')
+
+  def stats(self):
+    return {
+      'queued': len(self.pending),
+      'sent': self.sent,
+      'merged': self.merged,
+      'dropped': self.dropped,
+      'failed': self.failed
+    }
+
+
+class Bridge(Loggable):
+  def __init__(self, report_interval: float = constants.BRIDGE_REPORT_INTERVAL):
+    self.destinations = {}
+    self.report_interval = report_interval
+    self.__tasks = []
+
+  def add_destination(self, destination: BridgeDestination):
+    self.destinations[destination.name] = destination
+
+  # relay(discord='...', petal='...') queues each platform's formatted line without waiting on any send
+  def relay(self, **lines: str):
+    for name, line in lines.items():
+      self.destinations[name].put(line)
+
+  def stats(self):
+    return {name: destination.stats() for name, destination in self.destinations.items()}
+
+  async def __report(self):
+    last = None
+    while True:
+      await asyncio.sleep(self.report_interval)
+      stats = self.stats()
+      if stats != last:
+        self.log_info('bridge: ' + ', '.join(
+          f'{name} {s["sent"]} sent / {s["merged"]} merged / {s["dropped"]} dropped'
+          for name, s in stats.items()
+        ))
+        last = stats
+
+  def start(self):
+    if not self.__tasks:
+      self.__tasks = [asyncio.create_task(d.run()) for d in self.destinations.values()]
+      self.__tasks.append(asyncio.create_task(self.__report()))
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import re
+import threading
+from io import BytesIO
+
+import constants
+from inventory import RARITY_CODES
+from loggable import Loggable
+from util import LRU
+
+# Pillow is optional: without it inv/item just reply with text
+try:
+  from PIL import Image, ImageDraw
+except ImportError:
+  Image = None
+
+# item names whose sprites are named differently in assets/
+SPRITE_NAMES = {
+  'Magic Missile': 'magic_missle'
+}
+# the left character holds melee and armor, the right one magic and rings
+SLOT_SIDES = {
+  'melee': 'left',
+  'armor': 'left',
+  'magic': 'right',
+  'ring': 'right'
+}
+RARITY_COLORS = {
+  constants.RARITY_COMMON: (200, 200, 200),
+  constants.RARITY_UNCOMMON: (90, 200, 90),
+  constants.RARITY_RARE: (80, 140, 240),
+  constants.RARITY_MYTHIC: (180, 90, 230),
+  constants.RARITY_LEGENDARY: (250, 170, 40)
+}
+SPRITE_FILE = re.compile(r'^(?P<sprite>\w+?)_(?P<side>left|right)(?:_(?P<frame>\d+))?\.png$')
+CAPTION_LINE_HEIGHT = 14
+
+
+def sprite_name(item_name: str):
+  return SPRITE_NAMES.get(item_name, item_name.lower().replace(' ', '_'))
+
+
+class CardRenderer(Loggable):
+  # composites item sprites onto bg1.jpg + cats.png. sprites are indexed once at startup and decoded
+  # lazily into an LRU keyed by (sprite, side, frame); finished cards are cached by what they show
+  # (an inventory's digest or a single item) and rendered in a worker thread so the loop never blocks
+  def __init__(self, assets_path: str = constants.ASSETS_PATH, sprite_cache_size: int = constants.CARD_SPRITE_CACHE_SIZE,
+      card_cache_size: int = constants.CARD_CACHE_SIZE):
+    self.assets_path = assets_path
+    self.sprites = LRU(sprite_cache_size)
+    self.__sprites_lock = threading.Lock()
+    self.cards = LRU(card_cache_size)
+    self.frame_counts = {}
+    # (sprite, side) keys whose files carry a _N frame suffix, even when there is only one frame
+    self.numbered = set()
+    self.base = None
+
+    if not self.available:
+      self.log_info('Pillow is not installed, inventory cards are disabled')
+      return
+
+    for filename in os.listdir(assets_path):
+      if match := SPRITE_FILE.match(filename):
+        key = (match['sprite'], match['side'])
+        self.frame_counts[key] = max(self.frame_counts.get(key, 1), int(match['frame'] or 1))
+        if match['frame']:
+          self.numbered.add(key)
+
+    with Image.open(os.path.join(assets_path, 'bg1.jpg')) as background, Image.open(os.path.join(assets_path, 'cats.png')) as cats:
+      self.base = background.convert('RGBA')
+      self.base.alpha_composite(cats.convert('RGBA'))
+
+  @property
+  def available(self):
+    return Image is not None
+
+  def sprite_path(self, sprite: str, side: str, frame: int):
+    filename = f'{sprite}_{side}_{frame}.png' if (sprite, side) in self.numbered else f'{sprite}_{side}.png'
+    return os.path.join(self.assets_path, filename)
+
+  def __sprite(self, sprite: str, side: str, frame: int):
+    # renders run in worker threads, so the sprite LRU is shared between them
+    key = (sprite, side, frame)
+    with self.__sprites_lock:
+      image = self.sprites.get(key)
+    if image is None:
+      with Image.open(self.sprite_path(sprite, side, frame)) as f:
+        image = f.convert('RGBA')
+      with self.__sprites_lock:
+        self.sprites.put(key, image)
+    return image
+
+  # items is a list of (name, rarity, reforge_stat, slot, stat_type); returns (filename, bytes)
+  def __render(self, items: list):
+    layers = []
+    for name, _, _, slot, _ in items:
+      key = (sprite_name(name), SLOT_SIDES.get(slot, 'left'))
+      if key in self.frame_counts:
+        layers.append((*key, self.frame_counts[key]))
+
+    caption = [(f'{rarity} {name}  +{reforge_stat} {stat_type}', RARITY_COLORS.get(rarity)) for name, rarity, reforge_stat, _, stat_type in items]
+    frames = []
+    for frame in range(1, max((count for _, _, count in layers), default=1) + 1):
+      image = self.base.copy()
+      for sprite, side, count in layers:
+        # sprites with fewer frames loop within the longest animation
+        image.alpha_composite(self.__sprite(sprite, side, (frame - 1) % count + 1))
+      draw = ImageDraw.Draw(image)
+      y = image.height - 6 - CAPTION_LINE_HEIGHT * len(caption)
+      for line, color in caption:
+        draw.text((8, y), line, fill=color, stroke_width=1, stroke_fill=(0, 0, 0))
+        y += CAPTION_LINE_HEIGHT
+      frames.append(image.convert('RGB'))
+
+    out = BytesIO()
+    if len(frames) == 1:
+      frames[0].save(out, 'PNG', optimize=True)
+      return 'card.png', out.getvalue()
+    frames[0].save(out, 'GIF', save_all=True, append_images=frames[1:], duration=constants.CARD_FRAME_DURATION, loop=0)
+    return 'card.gif', out.getvalue()
+
+  # `describe` builds the item list only on a miss, so cached cards cost one digest and a dict lookup
+  async def __cached(self, key, describe):
+    if (card := self.cards.get(key)) is None:
+      items = [(item.name, item.rarity, item.reforge_stat, item.slot, item.stat_type) for item in describe()]
+      card = await asyncio.to_thread(self.__render, items)
+      self.cards.put(key, card)
+    return card
+
+  # one card for a whole inventory: the best item (rarity, then reforge stat) of each slot
+  async def inventory_card(self, inventory):
+    if not self.available or not len(inventory):
+      return None
+
+    def best_items():
+      best = {}
+      for item in inventory.items():
+        if (current := best.get(item.slot)) is None or \
+            (RARITY_CODES[item.rarity], item.reforge_stat) > (RARITY_CODES[current.rarity], current.reforge_stat):
+          best[item.slot] = item
+      return best.values()
+
+    return await self.__cached(('inv', inventory.digest()), best_items)
+
+  async def item_card(self, item):
+    if not self.available:
+      return None
+    return await self.__cached(('item', item.name, item.rarity, item.reforge_stat), lambda: [item])
+
+  def stats(self):
+    return {
+      'sprites': len(self.sprites),
+      'sprite_hits': self.sprites.hits,
+      'sprite_misses': self.sprites.misses,
+      'cards': len(self.cards),
+      'card_hits': self.cards.hits,
+      'card_misses': self.cards.misses
+    }
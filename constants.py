@@ -6,6 +6,16 @@ load_dotenv()
 
 BOT_NAME = getenv('BOT_NAME')
 
+# console (the column-aligned lines) or json, one object per line
+LOG_FORMAT = getenv('LOG_FORMAT', 'console')
+# debug, info or error
+LOG_LEVEL = getenv('LOG_LEVEL', 'info')
+# lines waiting for the writer thread; more than this are dropped rather than blocking the bot
+LOG_QUEUE_SIZE = int(getenv('LOG_QUEUE_SIZE', 10000))
+# sampled lines (per-message errors and the like): at most LOG_SAMPLE_BURST per key every LOG_SAMPLE_INTERVAL seconds
+LOG_SAMPLE_INTERVAL = float(getenv('LOG_SAMPLE_INTERVAL', 60))
+LOG_SAMPLE_BURST = int(getenv('LOG_SAMPLE_BURST', 5))
+LOG_PREFIX_DEBUG = getenv('LOG_PREFIX_DEBUG', '·')
 LOG_PREFIX_INFO = getenv('LOG_PREFIX_INFO')
 LOG_PREFIX_DONE = getenv('LOG_PREFIX_DONE')
 LOG_PREFIX_ERROR = getenv('LOG_PREFIX_ERROR')
@@ -13,7 +23,7 @@ LOG_COLUMN_WIDTH = int(getenv('LOG_COLUMN_WIDTH'))
 LOG_DATA_AS = getenv('LOG_DATA_AS')
 LOG_TWITCH_AS = getenv('LOG_TWITCH_AS')
 LOG_DISCORD_AS = getenv('LOG_DISCORD_AS')
-LOG_PETAL_AS = getenv('LOG_PETAL_AS')
+LOG_PETAL_AS = getenv('LOG_PETAL_AS', 'PETAL')
 LOG_GENERAL_AS = getenv('LOG_GENERAL_AS')
 LOG_COLUMN_WIDTH = int(getenv('LOG_COLUMN_WIDTH'))
 LOGIN_ATTEMPT_MESSAGE = getenv('LOGIN_ATTEMPT_MESSAGE')
@@ -21,10 +31,41 @@ LOGIN_SUCCESS_MESSAGE = getenv('LOGIN_SUCCESS_MESSAGE')
 LOGIN_AUTH_ERROR_MESSAGE = getenv('LOGIN_AUTH_ERROR_MESSAGE')
 LOGIN_ERROR_MESSAGE = getenv('LOGIN_ERROR_MESSAGE')
 
+DATA_BACKEND = getenv('DATA_BACKEND', 'json')
 DATA_PATH = getenv('DATA_PATH')
+DATA_SQLITE_PATH = getenv('DATA_SQLITE_PATH', 'data.sqlite3')
+DATA_REDIS_URL = getenv('DATA_REDIS_URL', 'redis://localhost:6379/0')
+DATA_REDIS_PREFIX = getenv('DATA_REDIS_PREFIX', 'lynnya_bot:')
+DATA_WRITE_BEHIND = getenv('DATA_WRITE_BEHIND', 'true').lower() == 'true'
+# in seconds
+DATA_FLUSH_INTERVAL = float(getenv('DATA_FLUSH_INTERVAL', 5))
+DATA_FLUSH_THRESHOLD = int(getenv('DATA_FLUSH_THRESHOLD', 500))
+# opt-in, it changes what is on disk next to DATA_PATH
+DATA_JOURNAL = getenv('DATA_JOURNAL', 'false').lower() == 'true'
+# in bytes
+DATA_JOURNAL_COMPACT_SIZE = int(getenv('DATA_JOURNAL_COMPACT_SIZE', 4 * 1024 * 1024))
+
+# local Prometheus endpoint (GET /metrics), port 0 disables it. timing quantiles cover the last METRICS_WINDOW samples
+METRICS_HOST = getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(getenv('METRICS_PORT', 9108))
+METRICS_WINDOW = int(getenv('METRICS_WINDOW', 1024))
 
 TWITCH_TOKEN = getenv('TWITCH_TOKEN')
-BROADCASTER_CHANNEL = getenv('BROADCASTER_CHANNEL')
+# comma separated Twitch channels, each with its own economy. the first one also owns the Discord
+# server, Petal and Twitter, and keeps the unsuffixed data store. BROADCASTER_CHANNEL alone still works
+BROADCASTER_CHANNELS = list(dict.fromkeys(
+  name.strip().lower().lstrip('#') for name in getenv('BROADCASTER_CHANNELS', getenv('BROADCASTER_CHANNEL', '')).split(',') if name.strip()
+))
+if not BROADCASTER_CHANNELS:
+  raise ValueError('BROADCASTER_CHANNELS (or BROADCASTER_CHANNEL) must name at least one Twitch channel')
+BROADCASTER_CHANNEL = BROADCASTER_CHANNELS[0]
+
+USER_CACHE_SIZE = int(getenv('USER_CACHE_SIZE', 10000))
+# in seconds
+USER_CACHE_TTL = float(getenv('USER_CACHE_TTL', 7 * 24 * 60 * 60))
+SUB_STATUS_SIZE = int(getenv('SUB_STATUS_SIZE', 10000))
+# in seconds
+SUB_STATUS_TTL = float(getenv('SUB_STATUS_TTL', 24 * 60 * 60))
 
 DISCORD_GUILD_NAME = getenv('DISCORD_GUILD_NAME')
 DISCORD_LIVE_GUILD_NAME = getenv('DISCORD_LIVE_GUILD_NAME')
@@ -52,12 +93,55 @@ TWITTER_ACCESS_TOKEN_SECRET = getenv('TWITTER_ACCESS_TOKEN_SECRET')
 TWITTER_DISPLAY_NAME = getenv('TWITTER_DISPLAY_NAME')
 TWITTER_LIVE_DISPLAY_NAME = getenv('TWITTER_LIVE_DISPLAY_NAME')
 
-LIVE_INDICATOR_TIMEOUT = int(getenv('LIVE_INDICATOR_TIMEOUT'))
+# in seconds
+LIVE_STATUS_POLL_INTERVAL = float(getenv('LIVE_STATUS_POLL_INTERVAL', 30))
+LIVE_STATUS_MAX_AGE = float(getenv('LIVE_STATUS_MAX_AGE', 120))
 
 PETAL_EMOJI = '🌺'
 PETAL_SERVER = getenv('PETAL_SERVER')
 PETAL_NAME = getenv('PETAL_NAME')
 PETAL_TOKEN = getenv('PETAL_TOKEN')
+# in seconds
+PETAL_RECONNECT_MIN_DELAY = float(getenv('PETAL_RECONNECT_MIN_DELAY', 1))
+PETAL_RECONNECT_MAX_DELAY = float(getenv('PETAL_RECONNECT_MAX_DELAY', 60))
+# the backoff only starts over once a connection has stayed up this long
+PETAL_RECONNECT_RESET_AFTER = float(getenv('PETAL_RECONNECT_RESET_AFTER', 30))
+PETAL_PING_INTERVAL = float(getenv('PETAL_PING_INTERVAL', 30))
+PETAL_SEND_QUEUE_SIZE = int(getenv('PETAL_SEND_QUEUE_SIZE', 1000))
+PETAL_USER_CONCURRENCY = int(getenv('PETAL_USER_CONCURRENCY', 1))
+
+# bridge relay: outbound messages per destination are rate limited to (messages, per seconds),
+# and queued lines are merged up to the platform's message length
+BRIDGE_QUEUE_SIZE = int(getenv('BRIDGE_QUEUE_SIZE', 100))
+# in seconds
+BRIDGE_REPORT_INTERVAL = float(getenv('BRIDGE_REPORT_INTERVAL', 300))
+# 20 per 30 seconds for regular chatters, 100 if the bot is a moderator
+BRIDGE_TWITCH_RATE = (int(getenv('BRIDGE_TWITCH_RATE', 20)), 30)
+BRIDGE_DISCORD_RATE = (5, 5)
+BRIDGE_PETAL_RATE = (10, 1)
+
+def _bridge_channels(value: str):
+  channels = {}
+  for pair in value.split(','):
+    if not pair.strip():
+      continue
+    name, _, channel_id = pair.partition(':')
+    if not name.strip() or not channel_id.strip().isdigit():
+      raise ValueError(f'BRIDGE_CHANNELS entries must look like channel:discord_channel_id, got {pair.strip()!r}')
+    channels[name.strip().lower().lstrip('#')] = int(channel_id)
+  return channels
+
+# which Discord channel each Twitch channel is bridged with, as channel:discord_channel_id pairs.
+# the first channel defaults to DISCORD_BRIDGE_CHANNEL_ID and is the only one bridged with Petal
+BRIDGE_CHANNELS = _bridge_channels(getenv('BRIDGE_CHANNELS', ''))
+BRIDGE_CHANNELS.setdefault(BROADCASTER_CHANNEL, DISCORD_BRIDGE_CHANNEL_ID)
+if (unknown := [name for name in BRIDGE_CHANNELS if name not in BROADCASTER_CHANNELS]):
+  raise ValueError(f'BRIDGE_CHANNELS names channels missing from BROADCASTER_CHANNELS: {", ".join(unknown)}')
+if len(set(BRIDGE_CHANNELS.values())) < len(BRIDGE_CHANNELS):
+  raise ValueError('BRIDGE_CHANNELS bridges more than one Twitch channel with the same Discord channel')
+TWITCH_MESSAGE_LENGTH = 500
+DISCORD_MESSAGE_LENGTH = 2000
+PETAL_MESSAGE_LENGTH = 2000
 
 DISCORD_ALERT_FORMAT = '<@&{}>\n\n{} ({})\n\nhttps://twitch.tv/{}'
 TWITTER_ALERT_FORMAT = '{} ({})\n\nhttps://twitch.tv/{}'
@@ -69,8 +153,31 @@ DISCORD_PREFIX_KEY = 'prefix:discord'
 TWITCH_PREFIX_KEY = 'prefix:twitch'
 PETAL_PREFIX_KEY = 'prefix:petal'
 
+# word lists for chat rewards, compiled into WORDS_COMPILED_PATH on startup when they change
+WORDS_PATH = getenv('WORDS_PATH', 'words.txt')
+WORDS_SLANG_PATH = getenv('WORDS_SLANG_PATH', 'slang.txt')
+WORDS_COMPILED_PATH = getenv('WORDS_COMPILED_PATH', 'words.bin')
+
 EMOTE_VALUE_EXPONENT = 0.5
+# unique words scored per message, and word pairs kept in the distance cache
+SCORING_MAX_WORDS = int(getenv('SCORING_MAX_WORDS', 100))
+SCORING_CACHE_SIZE = int(getenv('SCORING_CACHE_SIZE', 65536))
+# chat scoring worker pool: thread or process
+SCORING_EXECUTOR = getenv('SCORING_EXECUTOR', 'thread')
+SCORING_WORKERS = int(getenv('SCORING_WORKERS', 2))
+SCORING_QUEUE_SIZE = int(getenv('SCORING_QUEUE_SIZE', 5000))
+SCORING_BATCH_SIZE = int(getenv('SCORING_BATCH_SIZE', 200))
 PARTIAL_BAL_PER_BAL = 10
+# append-only log of every balance change, coalesced per user and reason each tick
+LEDGER_AUDIT_PATH = getenv('LEDGER_AUDIT_PATH', 'ledger.jsonl')
+# in seconds, how long balance changes are batched before one audit append + save
+LEDGER_TICK = float(getenv('LEDGER_TICK', 0.5))
+# in seconds
+DAILY_COOLDOWN = 60 * 60 * 12
+# reminder DMs per second
+REMINDER_RATE = (int(getenv('REMINDER_RATE', 5)), 1)
+# in seconds, before retrying a reminder DM that failed
+REMINDER_RETRY_DELAY = float(getenv('REMINDER_RETRY_DELAY', 300))
 
 RARITY_COMMON = 'Common'
 RARITY_UNCOMMON = 'Uncommon'
@@ -85,6 +192,30 @@ RARITY_STATS = {
   RARITY_LEGENDARY: 5
 }
 
+LOOT_BOX_PRICE = 50
+LOOT_BOX_ODDS = {
+  RARITY_COMMON: 0.6,
+  RARITY_UNCOMMON: 0.25,
+  RARITY_RARE: 0.1,
+  RARITY_MYTHIC: 0.04,
+  RARITY_LEGENDARY: 0.01
+}
+
+# each step an item's tier is away from the box rarity makes it this many times less likely
+LOOT_TIER_FALLOFF = float(getenv('LOOT_TIER_FALLOFF', 0.5))
+# fixed seed for box opening and reforging, unset for system randomness
+LOOT_SEED = getenv('LOOT_SEED') or None
+# opening more boxes than this at once replies with item counts instead of every item
+LOOT_OPEN_LIST_LIMIT = 10
+
+ASSETS_PATH = getenv('ASSETS_PATH', 'assets')
+CARD_SPRITE_CACHE_SIZE = int(getenv('CARD_SPRITE_CACHE_SIZE', 256))
+CARD_CACHE_SIZE = int(getenv('CARD_CACHE_SIZE', 512))
+# in milliseconds, per frame of animated cards
+CARD_FRAME_DURATION = int(getenv('CARD_FRAME_DURATION', 150))
+
+# decoded inventories kept in memory between commands
+INVENTORY_CACHE_SIZE = int(getenv('INVENTORY_CACHE_SIZE', 4096))
 INVENTORY_TEMPLATE = 'Inventory:\n```md\n{}\n```'
 
 SUBATHON_TIMER_FILE = getenv('SUBATHON_TIMER_FILE')
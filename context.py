@@ -1,17 +1,50 @@
-import json
 import time
+from io import BytesIO
 
+from discord import File as DiscordFile
 from discord.ext.commands import Bot as DiscordBot
 from discord.ext.commands import Context as DiscordContext
 from twitchio.ext.commands import Bot as TwitchBot
 from twitchio.ext.commands import Context as TwitchContext
-from websockets.client import WebSocketClientProtocol
 
 import constants
 from bot_data import BotData
 
+# sentinel for lazily computed attributes that may legitimately be None
+UNSET = object()
+
+
+# markdown that plain-text chats can't show is dropped and lines are joined with " | ". each pass
+# only runs when its marker is present: most replies have none, and str.replace beat a single
+# regex substitution on the ones that do (see benchmarks/dispatch.py)
+def format_plain_text(content: str):
+  if '*' in content:
+    content = content.replace('***', '').replace('**', '')
+  if '`' in content:
+    content = content.replace('`', '')
+  if '<http' in content:
+    content = content.replace('<http', 'http')
+  if '/>' in content:
+    content = content.replace('/>', '')
+  if '\n' in content:
+    content = ' | '.join(filter(None, content.split('\n')))
+  return content
+
 
 class Context:
+  # Context(...) returns the adapter for the source context's type (see ADAPTERS below). adapters
+  # only store what they were given; everything else is computed on first access
+  __slots__ = ('twitch_bot', 'discord_bot', 'petal_bot', 'source_ctx', 'data')
+  source_type = None
+  # only set where the platform can attach images
+  reply_file = None
+
+  def __new__(cls, twitch_bot: TwitchBot, discord_bot: DiscordBot, petal_bot, ctx, data: BotData):
+    if cls is Context:
+      if (cls := ADAPTERS.get(type(ctx))) is None:
+        raise RuntimeError(f'unsupported context type: {type(ctx)}')
+    return super().__new__(cls)
+
   def __init__(self, twitch_bot: TwitchBot, discord_bot: DiscordBot, petal_bot, ctx, data: BotData):
     self.twitch_bot = twitch_bot
     self.discord_bot = discord_bot
@@ -19,127 +52,170 @@ class Context:
     self.source_ctx = ctx
     self.data = data
 
-    self.source_id = None
-    self.source_type = type(ctx)
-    self.system_content = None
-    self.clean_content = None
-    self.is_mod = None
-    self.is_subscriber = None
-
-    self.user_id = None
-    self.reply = None
-
-    if self.source_type is TwitchContext:
-      self.source_id = int(ctx.author.id)
-      self.is_mod = ctx.author.is_mod
+  @property
+  def prefix(self):
+    raise RuntimeError(f'unknown prefix for source type: {self.source_type}')
 
-      async def check_sub():
-        return ctx.author.is_subscriber
 
-      self.check_sub = check_sub
+class TwitchCommandContext(Context):
+  __slots__ = ()
+  source_type = TwitchContext
 
-      self.system_content = ctx.message.raw_data
-      self.clean_content = ctx.message.raw_data
-      self.timestamp = ctx.message.timestamp.timestamp()
+  @property
+  def source_id(self):
+    return int(self.source_ctx.author.id)
 
-      self.user_id = self.source_id
+  @property
+  def user_id(self):
+    return self.source_id
 
-      async def __reply(content: str):
-        formatted = ' | '.join(filter(
-          None, content\
-            .replace('***', '')\
-            .replace('**', '')\
-            .replace('`', '')\
-            .replace('<http', 'http')\
-            .replace('/>', '')\
-            .split('\n')
-        ))
-        await ctx.reply(formatted)
+  @property
+  def is_mod(self):
+    return self.source_ctx.author.is_mod
 
-      self.reply = __reply
+  @property
+  def system_content(self):
+    return self.source_ctx.message.raw_data
 
-    # context check to populate user_id
-    elif self.source_type is DiscordContext:
-      self.source_id = ctx.author.id
-      self.is_mod = ctx.author.permissions_in(ctx.bot.get_channel(constants.DISCORD_STAFF_CHANNEL_ID)).view_channel
+  @property
+  def clean_content(self):
+    return self.source_ctx.message.raw_data
 
-      self.system_content = ctx.message.system_content
-      self.clean_content = ctx.message.clean_content
-      self.timestamp = ctx.message.created_at.timestamp()
+  @property
+  def timestamp(self):
+    return self.source_ctx.message.timestamp.timestamp()
 
-      discord_to_twitch_key = f'discord:{self.source_id}'
-      if discord_to_twitch_key in data:
-        self.user_id = data[discord_to_twitch_key]
+  @property
+  def prefix(self):
+    return self.data[constants.TWITCH_PREFIX_KEY]
 
-      async def check_sub():
-        return any(role.id == constants.DISCORD_SUBSCRIBER_ROLE_ID for role in ctx.author.roles)
+  async def check_sub(self):
+    return self.source_ctx.author.is_subscriber
 
-      self.check_sub = check_sub
+  async def reply(self, content: str):
+    await self.source_ctx.reply(format_plain_text(content))
 
-      async def __reply(content: str):
-        formatted = content.replace('/>', '>')
-        await ctx.reply(formatted)
 
-      self.reply = __reply
+class DiscordCommandContext(Context):
+  __slots__ = ('__is_mod', '__user_id')
+  source_type = DiscordContext
 
-    # raw dict payloads are received from Petal
-    elif self.source_type is PetalContext:
-      self.source_id = ctx.author
-      self.is_mod = False
+  def __init__(self, *args):
+    super().__init__(*args)
+    self.__is_mod = None
+    self.__user_id = UNSET
 
-      self.system_content = ctx.body
-      self.clean_content = ctx.body
-      self.timestamp = time.time()
+  @property
+  def source_id(self):
+    return self.source_ctx.author.id
 
-      petal_to_twitch_key = f'petal:{self.source_id}'
-      if petal_to_twitch_key in data:
-        self.user_id = data[petal_to_twitch_key]
+  # linked Twitch ID, looked up only by commands that need it
+  @property
+  def user_id(self):
+    if self.__user_id is UNSET:
+      self.__user_id = self.data.get(f'discord:{self.source_id}')
+    return self.__user_id
 
-      async def check_sub():
-        if self.user_id is not None:
-          chatter_name = (await self.twitch_bot.fetch_channel(str(self.user_id))).user.channel.name
-          chatter = self.twitch_bot.get_channel(constants.BROADCASTER_CHANNEL).get_chatter(chatter_name)
-          if chatter is None:
-            return None
-          else:
-            return chatter.is_subscriber
+  # members who can see the staff channel are mods
+  @property
+  def is_mod(self):
+    if self.__is_mod is None:
+      ctx = self.source_ctx
+      self.__is_mod = ctx.author.permissions_in(ctx.bot.get_channel(constants.DISCORD_STAFF_CHANNEL_ID)).view_channel
+    return self.__is_mod
 
-      self.check_sub = check_sub
+  @property
+  def system_content(self):
+    return self.source_ctx.message.system_content
 
-      async def __reply(content: str):
-        formatted = ' | '.join(filter(
-          None, content\
-            .replace('***', '')\
-            .replace('**', '')\
-            .replace('`', '')\
-            .replace('<http', 'http')\
-            .replace('/>', '')\
-            .split('\n')
-        ))
-        await ctx.reply(formatted)
+  @property
+  def clean_content(self):
+    return self.source_ctx.message.clean_content
 
-      self.reply = __reply
-
-    else:
-      raise RuntimeError(f'unsupported context type: {type(ctx)}')
+  @property
+  def timestamp(self):
+    return self.source_ctx.message.created_at.timestamp()
 
   @property
   def prefix(self):
-    if self.source_type is DiscordContext:
-      return self.data[constants.DISCORD_PREFIX_KEY]
-    elif self.source_type is TwitchContext:
-      return self.data[constants.TWITCH_PREFIX_KEY]
-    else:
-      raise RuntimeError(f'unknown prefix for source type: {type(self.source_type)}')
+    return self.data[constants.DISCORD_PREFIX_KEY]
+
+  async def check_sub(self):
+    if (subscribed := self.twitch_bot.sub_status.get(self.user_id)) is not None:
+      return subscribed
+    return any(role.id == constants.DISCORD_SUBSCRIBER_ROLE_ID for role in self.source_ctx.author.roles)
+
+  async def reply(self, content: str):
+    await self.source_ctx.reply(content.replace('/>', '>'))
+
+  async def reply_file(self, content: str, filename: str, file_bytes: bytes):
+    await self.source_ctx.reply(content.replace('/>', '>'), file=DiscordFile(BytesIO(file_bytes), filename))
+
 
 class PetalContext:
-  def __init__(self, ws: WebSocketClientProtocol, author: str, body: str):
-    self.ws = ws
+  __slots__ = ('petal_bot', 'author', 'body', 'received_at')
+
+  def __init__(self, petal_bot, author: str, body: str):
+    self.petal_bot = petal_bot
     self.author = author
     self.body = body
+    self.received_at = time.time()
 
   async def reply(self, body: str):
-    await self.ws.send(json.dumps({
-      'type': 'message',
-      'body': body
-    }))
+    await self.petal_bot.send(type='message', body=body)
+
+
+class PetalCommandContext(Context):
+  __slots__ = ('__user_id',)
+  source_type = PetalContext
+  is_mod = False
+
+  def __init__(self, *args):
+    super().__init__(*args)
+    self.__user_id = UNSET
+
+  @property
+  def source_id(self):
+    return self.source_ctx.author
+
+  @property
+  def user_id(self):
+    if self.__user_id is UNSET:
+      self.__user_id = self.data.get(f'petal:{self.source_id}')
+    return self.__user_id
+
+  @property
+  def system_content(self):
+    return self.source_ctx.body
+
+  @property
+  def clean_content(self):
+    return self.source_ctx.body
+
+  @property
+  def timestamp(self):
+    return self.source_ctx.received_at
+
+  @property
+  def prefix(self):
+    return self.data[constants.PETAL_PREFIX_KEY]
+
+  async def check_sub(self):
+    if (subscribed := self.twitch_bot.sub_status.get(self.user_id)) is not None:
+      return subscribed
+    # not seen within the TTL: fall back to the channel's chatter list
+    if self.user_id is not None:
+      # failed lookup or deleted account
+      if (chatter_name := await self.twitch_bot.user_cache.name(self.user_id)) is None:
+        return None
+      chatter = self.twitch_bot.get_channel(constants.BROADCASTER_CHANNEL).get_chatter(chatter_name)
+      if chatter is None:
+        return None
+      else:
+        return chatter.is_subscriber
+
+  async def reply(self, content: str):
+    await self.source_ctx.reply(format_plain_text(content))
+
+
+ADAPTERS = {adapter.source_type: adapter for adapter in (TwitchCommandContext, DiscordCommandContext, PetalCommandContext)}
@@ -0,0 +1,91 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from zlib import crc32
+
+import constants
+from util import log
+
+MAGIC = b'LYWD'
+VERSION = 1
+# magic, version, byte order, padding, word count, table size
+HEADER = struct.Struct('<4sBBxxII')
+
+
+def read_words(*paths: str):
+  words = set()
+  for path in paths:
+    if os.path.exists(path):
+      with open(path) as f:
+        for line in f:
+          words.update(line.split('#', 1)[0].lower().split())
+  return words
+
+# compiled format: header, then an open-addressing hash table of uint32 offsets (0 = empty slot)
+# into a blob of length-prefixed UTF-8 words. nothing is parsed on load, the file is just mapped
+def build(dst: str, *sources: str):
+  words = sorted(w for w in (word.encode() for word in read_words(*sources)) if len(w) < 256)
+  table_size = 1 << max(4, (2 * len(words)).bit_length())
+  mask = table_size - 1
+  table = array('I', bytes(4 * table_size))
+  blob = bytearray()
+  base = HEADER.size + 4 * table_size
+
+  for word in words:
+    slot = crc32(word) & mask
+    while table[slot]:
+      slot = (slot + 1) & mask
+    table[slot] = base + len(blob)
+    blob.append(len(word))
+    blob += word
+
+  tmp_path = f'{dst}.tmp'
+  with open(tmp_path, 'wb') as f:
+    f.write(HEADER.pack(MAGIC, VERSION, sys.byteorder == 'little', len(words), table_size))
+    f.write(table.tobytes())
+    f.write(blob)
+  os.replace(tmp_path, dst)
+  return len(words)
+
+
+class WordDictionary:
+  def __init__(self, path: str):
+    with open(path, 'rb') as f:
+      self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, little, self.count, table_size = HEADER.unpack_from(self.mm)
+    if magic != MAGIC or version != VERSION or little != (sys.byteorder == 'little'):
+      self.mm.close()
+      raise ValueError(f'{path} is not a compatible compiled word list')
+    self.mask = table_size - 1
+    self.table = memoryview(self.mm)[HEADER.size : HEADER.size + 4 * table_size].cast('I')
+
+  def __len__(self):
+    return self.count
+
+  def __contains__(self, word: str):
+    word = word.encode()
+    mm, table, mask = self.mm, self.table, self.mask
+    slot = crc32(word) & mask
+    while offset := table[slot]:
+      if mm[offset] == len(word) and mm[offset + 1 : offset + 1 + len(word)] == word:
+        return True
+      slot = (slot + 1) & mask
+    return False
+
+
+# rebuilds the compiled list whenever a source file is newer than it, then maps it
+def load(compiled_path: str = constants.WORDS_COMPILED_PATH, *sources: str):
+  sources = sources or (constants.WORDS_PATH, constants.WORDS_SLANG_PATH)
+  compiled_mtime = os.path.getmtime(compiled_path) if os.path.exists(compiled_path) else -1
+  if any(os.path.exists(path) and os.path.getmtime(path) > compiled_mtime for path in sources):
+    log('info', constants.LOG_GENERAL_AS, f'compiling word list into {compiled_path}')
+    count = build(compiled_path, *sources)
+    log('done', constants.LOG_GENERAL_AS, f'compiled {count} words')
+
+  try:
+    return WordDictionary(compiled_path)
+  except ValueError:
+    build(compiled_path, *sources)
+    return WordDictionary(compiled_path)
@@ -0,0 +1,205 @@
+import json
+import sys
+from array import array
+from base64 import b64decode, b64encode
+from hashlib import blake2b
+
+import constants
+from util import LRU
+
+# load loot box items table
+with open('items.json') as f:
+  ITEMS = {item['name']: item for item in json.load(f)}
+
+RARITIES = list(constants.RARITY_STATS)
+RARITY_CODES = {rarity: code for code, rarity in enumerate(RARITIES)}
+ENCODING_VERSION = 1
+
+
+class ItemCodes:
+  # item name <-> small integer code. codes are assigned once and persisted under `key`, so
+  # reordering or extending items.json never changes what a stored code means
+  key = 'item_codes'
+
+  def __init__(self, data):
+    self.data = data
+    self.names = list(data.get(self.key, []))
+    self.codes = {name: code for code, name in enumerate(self.names)}
+    for name in ITEMS:
+      self.code(name)
+
+  def code(self, name: str):
+    if (code := self.codes.get(name)) is None:
+      code = self.codes[name] = len(self.names)
+      self.names.append(name)
+      self.data[self.key] = list(self.names)
+    return code
+
+
+class Item:
+  __slots__ = ('name', 'rarity', 'reforge_stat')
+
+  def __init__(self, name: str, rarity: str, reforge_stat: int):
+    self.name = name
+    self.rarity = rarity
+    self.reforge_stat = reforge_stat
+
+  # legacy items may name something that has since been removed from items.json
+  @property
+  def slot(self):
+    return ITEMS.get(self.name, {}).get('slot')
+
+  @property
+  def stat_type(self):
+    return ITEMS.get(self.name, {}).get('stat_type', 'stat')
+
+
+class Inventory:
+  # one user's boxes and items. boxes are a count per rarity code; items are three parallel
+  # columns (item code, rarity code, reforge stat) rather than one dict per item
+  __slots__ = ('codes', 'boxes', 'item_codes', 'rarity_codes', 'reforge_stats', 'item_rarity_counts')
+
+  def __init__(self, codes: ItemCodes):
+    self.codes = codes
+    self.boxes = array('I', [0] * len(RARITIES))
+    self.item_codes = array('H')
+    self.rarity_codes = array('B')
+    self.reforge_stats = array('H')
+    self.item_rarity_counts = array('I', [0] * len(RARITIES))
+
+  def __len__(self):
+    return len(self.item_codes)
+
+  def box_counts(self):
+    return {rarity: self.boxes[code] for code, rarity in enumerate(RARITIES) if self.boxes[code]}
+
+  def add_boxes(self, counts: dict):
+    for rarity, quantity in counts.items():
+      self.boxes[RARITY_CODES[rarity]] += quantity
+
+  def remove_boxes(self, rarity: str, quantity: int = 1):
+    code = RARITY_CODES[rarity]
+    if self.boxes[code] < quantity:
+      raise ValueError(f'not enough {rarity} boxes')
+    self.boxes[code] -= quantity
+
+  def add_item(self, name: str, rarity: str, reforge_stat: int):
+    rarity_code = RARITY_CODES[rarity]
+    self.item_codes.append(self.codes.code(name))
+    self.rarity_codes.append(rarity_code)
+    self.reforge_stats.append(reforge_stat)
+    self.item_rarity_counts[rarity_code] += 1
+
+  def item(self, index: int):
+    return Item(self.codes.names[self.item_codes[index]], RARITIES[self.rarity_codes[index]], self.reforge_stats[index])
+
+  def items(self):
+    names = self.codes.names
+    for item_code, rarity_code, reforge_stat in zip(self.item_codes, self.rarity_codes, self.reforge_stats):
+      yield Item(names[item_code], RARITIES[rarity_code], reforge_stat)
+
+  def item_counts(self):
+    return {rarity: self.item_rarity_counts[code] for code, rarity in enumerate(RARITIES) if self.item_rarity_counts[code]}
+
+  # changes whenever any item is added, removed or reforged; boxes are not included
+  def digest(self):
+    digest = blake2b(digest_size=16)
+    for column in (self.item_codes, self.rarity_codes, self.reforge_stats):
+      digest.update(column.tobytes())
+    return digest.hexdigest()
+
+  def encode(self):
+    columns = b''
+    for column in (self.item_codes, self.rarity_codes, self.reforge_stats):
+      if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+      columns += column.tobytes()
+    return [ENCODING_VERSION, list(self.boxes), b64encode(columns).decode()]
+
+  @classmethod
+  def decode(cls, codes: ItemCodes, encoded: list):
+    inventory = cls(codes)
+    _version, boxes, columns = encoded
+    inventory.boxes = array('I', boxes)
+    columns = b64decode(columns)
+    count = len(columns) // 5
+    offset = 0
+    for name, size in (('item_codes', 2), ('rarity_codes', 1), ('reforge_stats', 2)):
+      column = getattr(inventory, name)
+      column.frombytes(columns[offset : offset + count * size])
+      if sys.byteorder == 'big':
+        column.byteswap()
+      offset += count * size
+    for rarity_code in inventory.rarity_codes:
+      inventory.item_rarity_counts[rarity_code] += 1
+    return inventory
+
+
+class InventoryStore:
+  # inv:{user_id} holds Inventory.encode(); decoded inventories are kept in memory between commands
+  def __init__(self, data, cache_size: int = constants.INVENTORY_CACHE_SIZE):
+    self.data = data
+    self.codes = ItemCodes(data)
+    self.cache = LRU(cache_size)
+    # user_id -> (encoded, inventory) staged in a ledger transaction, see stage
+    self.staged = {}
+
+  def get(self, user_id):
+    user_id = str(user_id)
+    if (inventory := self.cache.get(user_id)) is not None:
+      return inventory
+
+    stored = self.data.get(f'inv:{user_id}')
+    if stored is None or isinstance(stored, list) and (not stored or isinstance(stored[0], dict)):
+      inventory = self.__migrate(user_id, stored or [])
+    else:
+      inventory = Inventory.decode(self.codes, stored)
+    self.cache.put(user_id, inventory)
+    return inventory
+
+  def put(self, user_id, inventory: Inventory):
+    user_id = str(user_id)
+    self.data[f'inv:{user_id}'] = inventory.encode()
+    self.cache.put(user_id, inventory)
+
+  # writes the inventory as part of a ledger transaction, so it lands together with the debit or
+  # not at all. the decoded copy leaves the cache until the transaction applies
+  def stage(self, tx, user_id, inventory: Inventory):
+    user_id = str(user_id)
+    encoded = inventory.encode()
+    self.cache.pop(user_id, None)
+    self.staged[user_id] = (encoded, inventory)
+    tx.set(f'inv:{user_id}', encoded)
+
+  # BotData index interface for inv:, so a write from anywhere else (BotData.refresh) drops the decoded copy
+  def set(self, user_id: str, value):
+    staged = self.staged.pop(user_id, None)
+    if staged is not None and staged[0] is value:
+      self.cache.put(user_id, staged[1])
+    else:
+      self.cache.pop(user_id, None)
+  def discard(self, user_id: str):
+    self.staged.pop(user_id, None)
+    self.cache.pop(user_id, None)
+  def rebuild(self, items):
+    self.staged.clear()
+    self.cache.clear()
+
+  # folds the old formats (a dict per item under inv:, boxes: as a dict per box or per-rarity counts) into one record
+  def __migrate(self, user_id: str, legacy_items: list):
+    inventory = Inventory(self.codes)
+    for item in legacy_items:
+      inventory.add_item(item['name'], item['rarity'], item['reforge_stat'])
+
+    boxes = self.data.get(f'boxes:{user_id}')
+    if isinstance(boxes, list):
+      for box in boxes:
+        inventory.add_boxes({box['rarity']: 1})
+    elif isinstance(boxes, dict):
+      inventory.add_boxes(boxes)
+
+    if legacy_items or boxes is not None:
+      self.data.pop(f'boxes:{user_id}', None)
+      self.put(user_id, inventory)
+    return inventory
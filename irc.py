@@ -0,0 +1,225 @@
+# single-pass parsing of raw Twitch IRC lines (@tags :prefix COMMAND params :trailing). everything is
+# located by index into the original string; tag values, badges, emotes and the cleaned text are
+# only sliced out when asked for, so callers that need one field never pay for the others
+
+# IRC tag value escapes, see https://ircv3.net/specs/extensions/message-tags#escaping-values
+TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+SUBSCRIBER_BADGES = ('subscriber', 'founder')
+# tag name -> ('name=', ';name='), so tag_span doesn't format them on every call
+TAG_NEEDLES = {}
+
+
+def unescape_tag(value: str):
+  if '\\' not in value:
+    return value
+  out = []
+  i = 0
+  while i < len(value):
+    c = value[i]
+    if c == '\\' and i + 1 < len(value):
+      out.append(TAG_ESCAPES.get(value[i + 1], value[i + 1]))
+      i += 2
+    else:
+      out.append(c)
+      i += 1
+  return ''.join(out)
+
+# text without the [start, stop) ranges, which may come in any order
+def cut_ranges(text: str, ranges: list):
+  # most messages use one emote once
+  if len(ranges) == 1:
+    start, stop = ranges[0]
+    return text[:start] + text[stop:]
+  ranges.sort()
+  pieces = []
+  pos = 0
+  for start, stop in ranges:
+    if start > pos:
+      pieces.append(text[pos:start])
+    if stop > pos:
+      pos = stop
+  pieces.append(text[pos:])
+  return ''.join(pieces)
+
+
+class IrcMessage:
+  # only the tag section's end and the trailing text's start are located up front, with two or three
+  # str.find calls; everything else is found from those when asked for
+  __slots__ = ('raw', 'tags_end', 'text_start')
+
+  def __init__(self, raw: str):
+    self.raw = raw
+    # @tags span raw[1:tags_end] (tags_end is 0 when there are none)
+    if raw.startswith('@'):
+      if (tags_end := raw.find(' ')) == -1:
+        tags_end = len(raw)
+      text_start = raw.find(' :', tags_end + 1)
+    else:
+      tags_end = 0
+      text_start = raw.find(' :')
+    self.tags_end = tags_end
+    # the trailing parameter is everything after the first " :" following the tags. the :nick!user@host
+    # prefix has no space before its ":" once the search starts past the one ending the tags
+    self.text_start = len(raw) if text_start == -1 else text_start + 2
+
+  def __prefix_span(self):
+    start = self.tags_end + 1 if self.tags_end else 0
+    if not self.raw.startswith(':', start):
+      return start, start
+    end = self.raw.find(' ', start)
+    return start + 1, len(self.raw) if end == -1 else end
+
+  @property
+  def nick(self):
+    start, end = self.__prefix_span()
+    if start == end:
+      return None
+    bang = self.raw.find('!', start, end)
+    return self.raw[start : end if bang == -1 else bang]
+
+  @property
+  def command(self):
+    start = self.__prefix_span()[1]
+    if start and self.raw[start] == ' ':
+      start += 1
+    end = self.raw.find(' ', start)
+    return self.raw[start : len(self.raw) if end == -1 else end]
+
+  @property
+  def text(self):
+    text = self.raw[self.text_start:]
+    return text.rstrip('\r\n') if text.endswith('\n') else text
+
+  def tag_span(self, name: str):
+    # (start, end) of a tag's raw value, without copying the tag section
+    if not self.tags_end:
+      return None
+    if (needles := TAG_NEEDLES.get(name)) is None:
+      needles = TAG_NEEDLES[name] = (f'{name}=', f';{name}=')
+    raw = self.raw
+    # Twitch sends badge-info first, so look behind a ";" before checking the first tag
+    if (start := raw.find(needles[1], 1, self.tags_end)) != -1:
+      start += 1
+    elif raw.startswith(needles[0], 1):
+      start = 1
+    else:
+      return None
+    start += len(needles[0])
+    end = raw.find(';', start, self.tags_end)
+    return start, self.tags_end if end == -1 else end
+
+  def tag(self, name: str, default=None):
+    if (span := self.tag_span(name)) is None:
+      return default
+    return unescape_tag(self.raw[span[0] : span[1]])
+
+  @property
+  def tags(self):
+    if not self.tags_end:
+      return {}
+    tags = {}
+    for pair in self.raw[1 : self.tags_end].split(';'):
+      key, _, value = pair.partition('=')
+      tags[key] = unescape_tag(value)
+    return tags
+
+  # {badge: version}, e.g. {'subscriber': '12', 'premium': '1'}
+  @property
+  def badges(self):
+    badges = {}
+    if (span := self.tag_span('badges')) is not None and span[0] != span[1]:
+      for badge in self.raw[span[0] : span[1]].split(','):
+        name, _, version = badge.partition('/')
+        badges[name] = version
+    return badges
+
+  @property
+  def is_subscriber(self):
+    if (span := self.tag_span('badges')) is None:
+      return False
+    raw = self.raw
+    return any(raw.find(badge, *span) != -1 for badge in SUBSCRIBER_BADGES)
+
+  # [(start, end, emote_id)] in message order, with end inclusive as in the tag; one entry per use
+  @property
+  def emotes(self):
+    emotes = []
+    if (span := self.tag_span('emotes')) is not None and span[0] != span[1]:
+      for emote in self.raw[span[0] : span[1]].split('/'):
+        colon = emote.find(':')
+        emote_id = emote[:colon]
+        for used in emote[colon + 1:].split(','):
+          dash = used.find('-')
+          emotes.append((int(used[:dash]), int(used[dash + 1:]), emote_id))
+      emotes.sort()
+    return emotes
+
+  # counted straight off the tag: one use per "," inside a group plus one per group
+  @property
+  def emote_count(self):
+    if (span := self.tag_span('emotes')) is None or span[0] == span[1]:
+      return 0
+    raw = self.raw
+    return raw.count('/', *span) + raw.count(',', *span) + 1
+
+  # each emote's text, read from the first range of its group
+  @property
+  def emote_names(self):
+    text = self.text
+    if (span := self.tag_span('emotes')) is None or span[0] == span[1]:
+      return []
+    names = []
+    for group in self.raw[span[0] : span[1]].split('/'):
+      start, _, stop = group[group.find(':') + 1:].partition(',')[0].partition('-')
+      names.append(text[int(start) : int(stop) + 1])
+    return names
+
+  # the message text with every emote use cut out by its range, so an emote's name inside another
+  # word ("LUL" in "LULW") is left alone
+  @property
+  def clean_text(self):
+    return self.strip_emotes()[1]
+
+  # (emote uses, text with every emote removed), see strip_emotes below
+  def strip_emotes(self):
+    return strip_emotes(self.raw)
+
+def parse(raw: str):
+  return IrcMessage(raw)
+
+# (emote uses, text with every emote removed) from one walk over the emotes tag, without building an
+# IrcMessage: scoring needs nothing else from the line and runs this for every chat message, so the
+# lookups IrcMessage.__init__ and tag_span do are repeated inline here. the text is only sliced, never searched
+def strip_emotes(raw: str):
+  if raw.startswith('@'):
+    if (tags_end := raw.find(' ')) == -1:
+      tags_end = len(raw)
+    text_start = raw.find(' :', tags_end + 1)
+  else:
+    tags_end = 0
+    text_start = raw.find(' :')
+  text = raw[text_start + 2:] if text_start != -1 else ''
+  if text.endswith('\n'):
+    text = text.rstrip('\r\n')
+
+  if (start := raw.find(';emotes=', 1, tags_end)) != -1:
+    start += 8
+  elif tags_end and raw.startswith('emotes=', 1):
+    start = 8
+  else:
+    return 0, text
+  if (end := raw.find(';', start, tags_end)) == -1:
+    end = tags_end
+  if start == end:
+    return 0, text
+  emotes = raw[start:end]
+  # most messages use one emote once: "id:first-last"
+  if '/' not in emotes and ',' not in emotes:
+    first, _, last = emotes[emotes.find(':') + 1:].partition('-')
+    return 1, text[:int(first)] + text[int(last) + 1:]
+  ranges = []
+  for group in emotes.split('/'):
+    for used in group[group.find(':') + 1:].split(','):
+      first, _, last = used.partition('-')
+      ranges.append((int(first), int(last) + 1))
+  return len(ranges), cut_ranges(text, ranges)
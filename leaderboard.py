@@ -0,0 +1,99 @@
+from bisect import bisect_left, insort
+from itertools import islice
+
+
+class SortedList:
+  # bucketed sorted list: bisect over bucket maxes, then within a small bucket. inserts and removals
+  # only shift one bucket, which keeps them close to O(log n) at the sizes a chat economy reaches
+  bucket_size = 512
+
+  def __init__(self, values=()):
+    self.buckets = []
+    self.maxes = []
+    self.size = 0
+    self.update(values)
+
+  def update(self, values):
+    values = sorted(list(self) + list(values))
+    self.buckets = [values[i : i + self.bucket_size] for i in range(0, len(values), self.bucket_size)]
+    self.maxes = [bucket[-1] for bucket in self.buckets]
+    self.size = len(values)
+
+  def add(self, value):
+    if not self.buckets:
+      self.buckets.append([value])
+      self.maxes.append(value)
+      self.size += 1
+      return
+    if (i := bisect_left(self.maxes, value)) == len(self.maxes):
+      self.buckets[-1].append(value)
+      self.maxes[-1] = value
+      i -= 1
+    else:
+      insort(self.buckets[i], value)
+
+    if len(bucket := self.buckets[i]) > 2 * self.bucket_size:
+      self.buckets[i : i + 1] = [bucket[:self.bucket_size], bucket[self.bucket_size:]]
+      self.maxes[i : i + 1] = [bucket[self.bucket_size - 1], bucket[-1]]
+    self.size += 1
+
+  def remove(self, value):
+    i = bisect_left(self.maxes, value)
+    if i == len(self.maxes) or (bucket := self.buckets[i])[j := bisect_left(bucket, value)] != value:
+      raise ValueError(f'{value!r} not in list')
+    del bucket[j]
+    if bucket:
+      self.maxes[i] = bucket[-1]
+    else:
+      del self.buckets[i], self.maxes[i]
+    self.size -= 1
+
+  def index(self, value):
+    i = bisect_left(self.maxes, value)
+    if i == len(self.maxes) or (bucket := self.buckets[i])[j := bisect_left(bucket, value)] != value:
+      raise ValueError(f'{value!r} not in list')
+    return sum(len(b) for b in self.buckets[:i]) + j
+
+  def __len__(self):
+    return self.size
+
+  def __iter__(self):
+    for bucket in self.buckets:
+      yield from bucket
+
+
+class Leaderboard:
+  # ranked view over bal:{user_id} keys, ordered by balance (highest first) then user ID.
+  # it is derived from the balances, so it is rebuilt on load instead of being persisted
+  def __init__(self):
+    self.entries = SortedList()
+    self.balances = {}
+
+  def __len__(self):
+    return len(self.balances)
+
+  def set(self, user_id: str, balance: int):
+    if not user_id.isdigit() or not isinstance(balance, int):
+      return
+    if (old := self.balances.get(user_id)) is not None:
+      if old == balance:
+        return
+      self.entries.remove((-old, int(user_id)))
+    self.entries.add((-balance, int(user_id)))
+    self.balances[user_id] = balance
+
+  def discard(self, user_id: str):
+    if (old := self.balances.pop(user_id, None)) is not None:
+      self.entries.remove((-old, int(user_id)))
+
+  def rebuild(self, items):
+    self.balances = {user_id: balance for user_id, balance in items if user_id.isdigit() and isinstance(balance, int)}
+    self.entries = SortedList((-balance, int(user_id)) for user_id, balance in self.balances.items())
+
+  def top(self, k: int = 10):
+    return [(str(user_id), -balance) for balance, user_id in islice(self.entries, k)]
+
+  def rank(self, user_id: str):
+    if (balance := self.balances.get(str(user_id))) is None:
+      return None
+    return self.entries.index((-balance, int(user_id))) + 1
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import os
+import time
+
+import constants
+from loggable import Loggable
+
+# marks a key staged for deletion in a transaction
+DELETE = object()
+
+
+class InsufficientFunds(Exception):
+  def __init__(self, user_id: str, balance: int, amount: int):
+    super().__init__(f'{user_id} has {balance}, needs {amount}')
+    self.user_id = user_id
+    self.balance = balance
+    self.amount = amount
+
+
+class Transaction:
+  # stages balance deltas and plain key writes, then applies all of them at once when the `with`
+  # block exits cleanly. nothing inside the block may await, which is what makes it atomic
+  __slots__ = ('ledger', 'reason', 'deltas', 'writes')
+
+  def __init__(self, ledger, reason: str):
+    self.ledger = ledger
+    self.reason = reason
+    self.deltas = {}
+    self.writes = {}
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    if exc_type is None:
+      self.ledger.apply(self)
+
+  def balance(self, user_id):
+    user_id = str(user_id)
+    return self.ledger.balance(user_id) + self.deltas.get(user_id, 0)
+
+  def credit(self, user_id, amount: int):
+    user_id = str(user_id)
+    self.deltas[user_id] = self.deltas.get(user_id, 0) + amount
+
+  def debit(self, user_id, amount: int):
+    user_id = str(user_id)
+    if (balance := self.balance(user_id)) < amount:
+      raise InsufficientFunds(user_id, balance, amount)
+    self.deltas[user_id] = self.deltas.get(user_id, 0) - amount
+
+  def set(self, key: str, value):
+    self.writes[key] = value
+
+  def delete(self, key: str):
+    self.writes[key] = DELETE
+
+
+class Ledger(Loggable):
+  # every currency change goes through here. transactions apply to BotData immediately (so reads
+  # are always current), while the audit entries are coalesced per (user, reason) and committed,
+  # together with one data.save, once per tick
+  log_as = constants.LOG_DATA_AS
+
+  def __init__(self, data, audit_path: str = constants.LEDGER_AUDIT_PATH, tick: float = constants.LEDGER_TICK):
+    self.data = data
+    self.audit_path = audit_path
+    self.tick = tick
+    # (user_id, reason) -> [delta, transactions]
+    self.pending = {}
+    self.pending_reasons = set()
+    # audit lines whose append failed, written ahead of the next commit's
+    self.unwritten = []
+    self.transactions = 0
+    self.commits = 0
+    self.__pending_event = asyncio.Event()
+    self.__commit_lock = asyncio.Lock()
+    self.__task = None
+
+  def balance(self, user_id):
+    return self.data.get(f'bal:{user_id}', 0)
+
+  def transaction(self, reason: str):
+    return Transaction(self, reason)
+
+  def credit(self, user_id, amount: int, reason: str):
+    with self.transaction(reason) as tx:
+      tx.credit(user_id, amount)
+
+  def debit(self, user_id, amount: int, reason: str):
+    with self.transaction(reason) as tx:
+      tx.debit(user_id, amount)
+
+  # chat scores build up in partial_bal, paying out at most one unit of currency per message
+  def accrue(self, user_id, score: int):
+    partial_bal_key = f'partial_bal:{user_id}'
+    partial_bal = self.data.get(partial_bal_key, 0) + score
+    with self.transaction('chat currency award') as tx:
+      if partial_bal >= constants.PARTIAL_BAL_PER_BAL:
+        partial_bal -= constants.PARTIAL_BAL_PER_BAL
+        tx.credit(user_id, 1)
+      tx.set(partial_bal_key, partial_bal)
+
+  def apply(self, tx: Transaction):
+    for key, value in tx.writes.items():
+      if value is DELETE:
+        self.data.pop(key, None)
+      else:
+        self.data[key] = value
+
+    for user_id, delta in tx.deltas.items():
+      if not delta:
+        continue
+      self.data.increment(f'bal:{user_id}', delta)
+      if (entry := self.pending.get((user_id, tx.reason))) is None:
+        self.pending[user_id, tx.reason] = [delta, 1]
+      else:
+        entry[0] += delta
+        entry[1] += 1
+
+    self.transactions += 1
+    self.pending_reasons.add(tx.reason)
+    self.__pending_event.set()
+
+  def __append(self, lines: list):
+    with open(self.audit_path, 'a') as f:
+      f.writelines(lines)
+      f.flush()
+      os.fsync(f.fileno())
+
+  # the commit point: one audit append and one save for everything applied since the last commit
+  async def commit(self):
+    async with self.__commit_lock:
+      if not self.pending_reasons and not self.unwritten:
+        return
+      pending, reasons = self.pending, self.pending_reasons
+      self.pending, self.pending_reasons = {}, set()
+
+      now = round(time.time(), 3)
+      # [time, user_id, delta, balance at commit, reason, transactions]
+      lines = self.unwritten + [
+        json.dumps([now, user_id, delta, self.balance(user_id), reason, count], ensure_ascii=False) + '\n'
+        for (user_id, reason), (delta, count) in pending.items()
+      ]
+      self.unwritten = []
+      try:
+        if lines:
+          await asyncio.to_thread(self.__append, lines)
+      except Exception as exc:
+        # keep them for the next tick rather than losing the audit trail
+        self.unwritten = lines
+        self.__pending_event.set()
+        self.log_error(f'failed to append {len(lines)} ledger entries, retrying next tick: {exc!r}')
+      self.commits += 1
+      if reasons:
+        await self.data.save(', '.join(sorted(reasons)))
+
+  async def run(self):
+    while True:
+      await self.__pending_event.wait()
+      # let the rest of this tick's changes pile up before committing
+      await asyncio.sleep(self.tick)
+      self.__pending_event.clear()
+      try:
+        # shielded so close() cancelling this task lets a commit in flight finish before its own
+        await asyncio.shield(self.commit())
+      except Exception as exc:
+        self.log_error(f'ledger commit failed: {exc!r}')
+
+  def start(self):
+    if self.__task is None:
+      self.__task = asyncio.create_task(self.run())
+
+  async def close(self):
+    if self.__task is not None:
+      self.__task.cancel()
+      self.__task = None
+    await self.commit()
+
+  def stats(self):
+    return {
+      'transactions': self.transactions,
+      'commits': self.commits,
+      'pending': len(self.pending),
+      'unwritten': len(self.unwritten)
+    }
@@ -0,0 +1,135 @@
+import asyncio
+import time
+
+import constants
+import metrics
+from loggable import Loggable
+from user_cache import HELIX_BATCH_SIZE
+
+REFRESH_SECONDS = metrics.registry.histogram('live_status_refresh_seconds', 'time to poll Helix for the live status')
+
+
+class LiveStatus(Loggable):
+  log_as = constants.LOG_TWITCH_AS
+
+  def __init__(self, twitch_bot, channel_name: str = constants.BROADCASTER_CHANNEL,
+      max_age: float = constants.LIVE_STATUS_MAX_AGE):
+    self.twitch_bot = twitch_bot
+    self.channel_name = channel_name
+    self.max_age = max_age
+    self.live = False
+    self.updated_at = 0.0
+    self.listeners = []
+    # set by LiveStatusPoller.add, refreshes then go through its batched request
+    self.poller = None
+    # replaced on every update, so waiters only ever see the next one
+    self.__updated = asyncio.Event()
+    self.__listener_tasks = set()
+
+  @property
+  def age(self):
+    return time.monotonic() - self.updated_at
+
+  def is_live(self, max_age: float = None):
+    # never blocks: a value older than the staleness bound is treated as offline
+    return self.live and self.age <= (self.max_age if max_age is None else max_age)
+
+  async def check(self, max_age: float = None):
+    # for callers that can afford to wait on a stale value (commands, not the chat path)
+    if self.age > (self.max_age if max_age is None else max_age):
+      await self.refresh()
+    return self.live
+
+  async def wait_until_updated(self):
+    await self.__updated.wait()
+
+  def add_listener(self, coro):
+    self.listeners.append(coro)
+    return coro
+
+  async def set_live(self, live: bool):
+    # entry point for push sources (EventSub / stream.online) as well as the poller
+    live = bool(live)
+    changed = live != self.live
+    self.live = live
+    self.updated_at = time.monotonic()
+    updated, self.__updated = self.__updated, asyncio.Event()
+    updated.set()
+
+    if changed:
+      self.log_info(f'{self.channel_name} is now {"live" if live else "offline"}')
+      # listeners call out to Discord and Twitter, check() and the poller don't wait on them
+      for listener in self.listeners:
+        task = asyncio.create_task(listener(live))
+        self.__listener_tasks.add(task)
+        task.add_done_callback(self.__listener_done)
+
+  def __listener_done(self, task: asyncio.Task):
+    self.__listener_tasks.discard(task)
+    if not task.cancelled() and (exc := task.exception()) is not None:
+      self.log_error('live status listener failed', exc=exc)
+
+  async def refresh(self):
+    if self.poller is not None:
+      return await self.poller.refresh()
+    with REFRESH_SECONDS.time():
+      streams = await self.twitch_bot.fetch_streams(user_logins=[self.channel_name])
+    await self.set_live(streams)
+
+  def stats(self):
+    return {
+      'live': self.live,
+      'age': self.age
+    }
+
+
+class LiveStatusPoller(Loggable):
+  # one Helix streams request for every channel's LiveStatus (per HELIX_BATCH_SIZE channels) instead of one each
+  log_as = constants.LOG_TWITCH_AS
+
+  def __init__(self, twitch_bot, interval: float = constants.LIVE_STATUS_POLL_INTERVAL):
+    self.twitch_bot = twitch_bot
+    self.interval = interval
+    self.statuses = {}
+    # login -> user ID. streams only carry the display name, which can differ from the login
+    self.user_ids = {}
+    self.__refreshing = None
+
+  def add(self, live_status: LiveStatus):
+    self.statuses[live_status.channel_name] = live_status
+    live_status.poller = self
+
+  async def __refresh(self):
+    logins = list(self.statuses)
+    # logins that didn't resolve (a typo, a renamed or suspended account) are looked up again next poll
+    if (missing := [login for login in logins if login not in self.user_ids]):
+      for i in range(0, len(missing), HELIX_BATCH_SIZE):
+        for user in await self.twitch_bot.fetch_users(names=missing[i : i + HELIX_BATCH_SIZE]):
+          self.user_ids[user.name.lower()] = int(user.id)
+      if (unresolved := [login for login in missing if login not in self.user_ids]):
+        self.log_error(f'no Twitch user for {", ".join(unresolved)}, retrying next poll', sample='live unresolved')
+
+    with REFRESH_SECONDS.time():
+      streams = []
+      for i in range(0, len(logins), HELIX_BATCH_SIZE):
+        streams += await self.twitch_bot.fetch_streams(user_logins=logins[i : i + HELIX_BATCH_SIZE])
+    live_ids = {int(stream.user.id) for stream in streams}
+    await asyncio.gather(*(
+      status.set_live(self.user_ids.get(login) in live_ids) for login, status in self.statuses.items()
+    ))
+
+  async def refresh(self):
+    # stale check()s from several channels at once share one request
+    if self.__refreshing is None or self.__refreshing.done():
+      self.__refreshing = asyncio.create_task(self.__refresh())
+    await asyncio.shield(self.__refreshing)
+
+  async def run(self):
+    await self.twitch_bot.ready_event.wait()
+
+    while True:
+      try:
+        await self.refresh()
+      except Exception as exc:
+        self.log_error(f'failed to refresh live status: {exc!r}')
+      await asyncio.sleep(self.interval)
@@ -0,0 +1,351 @@
+# python -m loadtest.run [--rates 50 200 1000 3000] [--seconds 10] [--chatters 2000] [--commands 0.02] [...]
+# end-to-end load test: the real TwitchBot, PetalBot and peony client, wired by bot.setup, talk to the
+# fakes in loadtest.servers (Discord is the replay stand-in, there is no gateway fake). the fakes and
+# the load generator run on their own event loop in a second thread, so the bot's loop only does the
+# bot's work. each stage pushes chat at a fixed rate for --seconds and reports how much of it the bot
+# handled in time, command reply latency (sent by the fake TMI until the bot's reply reaches it),
+# Petal command round trips, event loop lag and errors. the first stage where the bot handles less
+# than SATURATED of what was offered, or loses replies, is reported as the saturation point
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import aiohttp
+import peony.general
+import twitchio.http
+import twitchio.websocket
+from peony import PeonyClient
+from twitchio.cooldowns import RateBucket
+
+import constants
+import logger
+from benchmarks.irc_parse import generate_lines
+from benchmarks.replay import SEED, StubDiscordBot, write_data_file
+from bot_data import BotData
+from loadtest.servers import FakeHelix, FakePetal, FakeTmi, FakeTwitter, Faults
+from metrics import Series
+from petal_bot import PetalBot
+from storage import JsonBackend
+from twitch_bot import TwitchBot
+
+import bot
+
+TEMPLATES = 5000
+COMMANDS = ['!bal', '!bal', '!daily', '!lb', '!status', '!boxes', '!sub']
+# seconds between load generator ticks and event loop lag probes
+TICK = 0.01
+LAG_INTERVAL = 0.01
+# seconds between Petal command probes, and how long one may take before it counts as lost
+PROBE_INTERVAL = 0.25
+PROBE_TIMEOUT = 5
+# after each stage, how long to wait for the bot to catch up and for late replies
+DRAIN_TIMEOUT = 30
+REPLY_GRACE = 2
+SATURATED = 0.95
+WINDOW = 100_000
+
+
+class ServerThread:
+  # the fakes and the load generator share an event loop on a second thread
+  def __init__(self):
+    self.loop = asyncio.new_event_loop()
+    self.thread = threading.Thread(target=self.loop.run_forever, name='loadtest', daemon=True)
+    self.thread.start()
+
+  async def run(self, coro):
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+  def stop(self):
+    self.loop.call_soon_threadsafe(self.loop.stop)
+    self.thread.join()
+
+
+class Chat:
+  # the benchmark's generated chatter lines, addressed to `channel`, each sent with a fresh message
+  # id so replies can be matched to it; `command_rate` of them are commands instead
+  def __init__(self, channel: str, chatters: int, command_rate: float, rng: random.Random):
+    self.rng = rng
+    self.command_rate = command_rate
+    self.templates = []
+    for line in generate_lines(TEMPLATES, rng, chatters):
+      head, _, rest = line.partition(';id=')
+      rest = rest.partition(';')[2].replace(' PRIVMSG #lynnya_tv :', f' PRIVMSG #{channel} :', 1)
+      middle, _, text = rest.partition(f' PRIVMSG #{channel} :')
+      self.templates.append((f'{head};id=', f';{middle} PRIVMSG #{channel} :', text))
+
+  def line(self, msg_id: str):
+    head, middle, text = self.templates[self.rng.randrange(len(self.templates))]
+    is_command = self.rng.random() < self.command_rate
+    return f'{head}{msg_id}{middle}{self.rng.choice(COMMANDS) if is_command else text}', is_command
+
+
+class LoadGenerator:
+  # runs on the server thread: paces chat into the fake TMI, matches the bot's replies to the
+  # commands that were sent and probes Petal with one command at a time
+  def __init__(self, tmi: FakeTmi, petal: FakePetal, chat: Chat, channel: str):
+    self.tmi = tmi
+    self.petal = petal
+    self.chat = chat
+    self.channel = channel
+    self.seq = 0
+    # msg id -> sent at, for commands still waiting on a reply
+    self.pending = {}
+    self.unmatched = 0
+    self.replies = Series(WINDOW)
+    self.petal_replies = Series(WINDOW)
+    self.petal_lost = 0
+    self.__probe = None
+    tmi.on_privmsg = self.__on_privmsg
+    petal.on_frame = self.__on_frame
+
+  def __on_privmsg(self, channel: str, text: str, parent_id: str):
+    if parent_id is not None and (sent_at := self.pending.pop(parent_id, None)) is not None:
+      self.replies.observe(time.perf_counter() - sent_at)
+    else:
+      self.unmatched += 1
+
+  def __on_frame(self, payload: dict):
+    # bridged chat starts with "[twitch]" / "[discord]", anything else answers the probe
+    if self.__probe is not None and not self.__probe.done() and not payload.get('body', '').startswith('['):
+      self.__probe.set_result(time.perf_counter())
+
+  async def __probe_petal(self, seconds: float):
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+      self.__probe = asyncio.get_running_loop().create_future()
+      sent_at = time.perf_counter()
+      self.petal.broadcast(type='message', name='petal0', body='!bal')
+      try:
+        self.petal_replies.observe(await asyncio.wait_for(self.__probe, PROBE_TIMEOUT) - sent_at)
+      except asyncio.TimeoutError:
+        self.petal_lost += 1
+      await asyncio.sleep(PROBE_INTERVAL)
+
+  async def __send_chat(self, rate: float, seconds: float):
+    started = time.perf_counter()
+    sent = commands = 0
+    while (elapsed := time.perf_counter() - started) < seconds:
+      lines = []
+      now = time.perf_counter()
+      for _ in range(int(rate * elapsed) - sent):
+        self.seq += 1
+        msg_id = f'lt-{self.seq}'
+        line, is_command = self.chat.line(msg_id)
+        if is_command:
+          self.pending[msg_id] = now
+          commands += 1
+        lines.append(line)
+      if lines:
+        self.tmi.inject(self.channel, lines)
+        sent += len(lines)
+      await asyncio.sleep(TICK)
+    return sent, commands, time.perf_counter() - started
+
+  async def stage(self, rate: float, seconds: float):
+    self.replies = Series(WINDOW)
+    self.petal_replies = Series(WINDOW)
+    self.petal_lost = 0
+    self.unmatched = 0
+    probe = asyncio.create_task(self.__probe_petal(seconds))
+    sent, commands, elapsed = await self.__send_chat(rate, seconds)
+    await probe
+    return sent, commands, elapsed
+
+  async def collect_replies(self, grace: float):
+    deadline = time.perf_counter() + grace
+    while self.pending and time.perf_counter() < deadline:
+      await asyncio.sleep(0.05)
+    lost = len(self.pending)
+    self.pending.clear()
+    return lost
+
+
+async def start_fakes(args, bot_login: str):
+  tmi = await FakeTmi(Faults(args.tmi_latency, limit=args.tmi_limit, window=30), mod=not args.not_mod).start()
+  helix = await FakeHelix(bot_login, {constants.BROADCASTER_CHANNEL.lower()}, Faults(args.helix_latency, limit=args.helix_limit)).start()
+  petal = await FakePetal(Faults(args.petal_latency)).start()
+  twitter = await FakeTwitter(Faults(args.twitter_latency, limit=args.twitter_limit, window=900)).start()
+  return tmi, helix, petal, twitter
+
+async def close_fakes(*fakes):
+  for fake in fakes:
+    await fake.close()
+
+def redirect(tmi: FakeTmi, helix: FakeHelix, petal: FakePetal, twitter: FakeTwitter):
+  # twitchio and peony keep their hosts in module and class attributes, read on each connect/request
+  twitchio.websocket.HOST = tmi.url
+  twitchio.http.Route.BASE_URL = f'{helix.url}/helix'
+  peony.general.twitter_base_api_url = f'{twitter.url}/{{version}}'
+  constants.PETAL_SERVER = petal.url
+
+  # TwitchHTTP.validate has the id.twitch.tv URL inline, this is the same call against the fake
+  async def validate(http: twitchio.http.TwitchHTTP, *, token: str = None):
+    if not http.session:
+      http.session = aiohttp.ClientSession()
+    async with http.session.get(f'{helix.url}/oauth2/validate', headers={'Authorization': f'OAuth {token or http.token}'}) as resp:
+      data = await resp.json()
+    if not http.nick:
+      http.nick = data.get('login')
+      http.client_id = data.get('client_id')
+    return data
+  twitchio.http.TwitchHTTP.validate = validate
+
+async def monitor_lag(series: list):
+  # series[0] is swapped for a fresh Series each stage
+  while True:
+    started = time.perf_counter()
+    await asyncio.sleep(LAG_INTERVAL)
+    series[0].observe(time.perf_counter() - started - LAG_INTERVAL)
+
+async def wait_for(predicate, timeout: float):
+  deadline = time.perf_counter() + timeout
+  while not predicate():
+    if time.perf_counter() > deadline:
+      return False
+    await asyncio.sleep(0.05)
+  return True
+
+def command_errors():
+  return sum(value for (_, platform), value in bot.COMMAND_ERRORS.values.items() if platform == 'twitch')
+
+def ms(series: Series):
+  return [f'{value * 1000:>7.1f}' if series.count else '      -' for value in series.quantiles()]
+
+
+async def main():
+  parser = argparse.ArgumentParser(description='load test the bot against in-process fake Twitch, Helix, Petal and Twitter servers')
+  parser.add_argument('--rates', type=float, nargs='+', default=[50, 200, 1000, 3000], help='chat messages per second, one stage each')
+  parser.add_argument('--seconds', type=float, default=10, help='length of each stage')
+  parser.add_argument('--chatters', type=int, default=2000)
+  parser.add_argument('--commands', type=float, default=0.02, help='share of chat lines that are commands')
+  parser.add_argument('--not-mod', action='store_true', help='join without moderator status (20 instead of 100 messages per 30s)')
+  parser.add_argument('--irc-limit', type=int, help="override twitchio's per-channel send limit, to measure replies past Twitch's")
+  parser.add_argument('--tmi-latency', type=float, default=0.0)
+  parser.add_argument('--tmi-limit', type=int, help='messages per 30s the fake TMI accepts before msg_ratelimit')
+  parser.add_argument('--helix-latency', type=float, default=0.05)
+  parser.add_argument('--helix-limit', type=int, default=800, help='requests per minute before 429')
+  parser.add_argument('--petal-latency', type=float, default=0.0)
+  parser.add_argument('--twitter-latency', type=float, default=0.1)
+  parser.add_argument('--twitter-limit', type=int, help='requests per 15 minutes before 429')
+  parser.add_argument('--poll-interval', type=float, default=1.0, help='live status poll interval')
+  args = parser.parse_args()
+
+  # the handlers' own logging would drown out the report
+  logger.logger.level = logger.ERROR
+  if args.irc_limit is not None:
+    RateBucket.IRCLIMIT = RateBucket.MODLIMIT = args.irc_limit
+  channel = constants.BROADCASTER_CHANNEL.lower()
+  bot_login = 'lynnya_bot'
+
+  servers = ServerThread()
+  tmi, helix, petal, twitter = await servers.run(start_fakes(args, bot_login))
+  redirect(tmi, helix, petal, twitter)
+  generator = LoadGenerator(tmi, petal, Chat(channel, args.chatters, args.commands, random.Random(SEED)), channel)
+
+  with tempfile.TemporaryDirectory() as workdir:
+    data_path = os.path.join(workdir, 'data.json')
+    write_data_file(data_path, args.chatters, random.Random(SEED))
+    data = BotData(JsonBackend(data_path), write_behind=True)
+    await data.load()
+    data.start()
+
+    twitch_bot = TwitchBot(constants.TWITCH_TOKEN, data)
+    # twitchio prints a traceback per failed command, at these rates they are counted instead
+    errors = Counter()
+    async def event_error(error: Exception, data: str = None):
+      errors[type(getattr(error, 'original', error)).__name__] += 1
+    twitch_bot.event_error = event_error
+    discord_bot = StubDiscordBot(data)
+    twitter_bot = PeonyClient(
+      constants.TWITTER_KEY,
+      constants.TWITTER_SECRET,
+      constants.TWITTER_ACCESS_TOKEN,
+      constants.TWITTER_ACCESS_TOKEN_SECRET
+    )
+    petal_bot = PetalBot(data, constants.PETAL_TOKEN, constants.PETAL_NAME, twitch_bot, discord_bot)
+    services = bot.setup(data, twitch_bot, discord_bot, twitter_bot, petal_bot)
+    services.live_poller.interval = args.poll_interval
+    services.ledger.audit_path = os.path.join(workdir, 'ledger.jsonl')
+
+    lag = [Series(WINDOW)]
+    tasks = [
+      asyncio.create_task(services.live_poller.run()),
+      asyncio.create_task(petal_bot.login()),
+      asyncio.create_task(monitor_lag(lag))
+    ]
+    services.ledger.start()
+    services.scoring_pipeline.start()
+    await twitch_bot.connect()
+
+    try:
+      if not await wait_for(lambda: twitch_bot.ready_event.is_set() and services.live_status.is_live() and petal_bot.stats()['connected'], 10):
+        print(f'bot did not come up: twitch ready {twitch_bot.ready_event.is_set()}, live {services.live_status.is_live()}, petal {petal_bot.stats()["connected"]}')
+        return
+
+      print(f'{args.chatters} chatters, {args.commands:.0%} commands, helix {args.helix_latency * 1000:.0f}ms / {args.helix_limit} per min, '
+        f'{"mod" if not args.not_mod else "not mod"}{f", irc limit {args.irc_limit}" if args.irc_limit is not None else ""}')
+      print(f'  {"offered/s":>9} {"sent/s":>8} {"handled/s":>9} {"drain":>7}  {"replies":>11}  '
+        f'{"reply p50":>9} {"p95":>7} {"p99":>7}  {"petal p50":>9} {"p99":>7}  {"lag p99":>7}  errors')
+      saturation = None
+      for rate in args.rates:
+        handled_before = bot.MESSAGE_SECONDS.labels().count
+        errors_before = command_errors()
+        shed_before = services.scoring_pipeline.dropped
+        errors.clear()
+        lag[0] = Series(WINDOW)
+
+        sent, commands, elapsed = await servers.run(generator.stage(rate, args.seconds))
+        handled = bot.MESSAGE_SECONDS.labels().count - handled_before
+        started = time.perf_counter()
+        await wait_for(lambda: bot.MESSAGE_SECONDS.labels().count - handled_before >= sent, DRAIN_TIMEOUT)
+        drain = time.perf_counter() - started
+        lost = await servers.run(generator.collect_replies(REPLY_GRACE))
+        shed = services.scoring_pipeline.dropped - shed_before
+
+        failed = [f'{name} {count}' for name, count in errors.most_common()] or [f'{command_errors() - errors_before}']
+        if shed:
+          failed.append(f'scoring shed {shed}')
+        replies, petal_replies, lag_ms = ms(generator.replies), ms(generator.petal_replies), ms(lag[0])
+        print(f'  {rate:>9.0f} {sent / elapsed:>8.0f} {handled / elapsed:>9.0f} {drain:>6.1f}s  {f"{generator.replies.count}/{commands}":>11}  '
+          f'{replies[0]:>9} {replies[1]} {replies[2]}  {petal_replies[0]:>9} {petal_replies[2]}  {lag_ms[2]}  {", ".join(failed)}')
+
+        reasons = []
+        if handled < SATURATED * sent:
+          reasons.append(f'handled {handled / sent:.0%} of the chat while it was sent')
+        if lost > (1 - SATURATED) * commands:
+          reasons.append(f'{lost} of {commands} command replies never arrived')
+        if shed > (1 - SATURATED) * sent:
+          reasons.append(f'scoring shed {shed / sent:.0%} of the chat')
+        if saturation is None and reasons:
+          saturation = (rate, reasons)
+
+      if saturation is None:
+        print(f'not saturated up to {args.rates[-1]:.0f} messages/s')
+      else:
+        print(f'saturated at {saturation[0]:.0f} messages/s: {"; ".join(saturation[1])}')
+      print(f'  tmi: {tmi.received} bot messages, {tmi.dropped} over the limit; helix: {sum(helix.requests.values())} requests, '
+        f'{helix.faults.limited} rate limited; twitter: {sum(twitter.requests.values())} requests, {twitter.faults.limited} rate limited; '
+        f'petal: {petal.received} frames')
+    finally:
+      for task in tasks:
+        task.cancel()
+      await services.scoring_pipeline.close()
+      services.scoring_executor.shutdown(wait=False)
+      await services.ledger.close()
+      # twitch_bot.close() would stop this loop, so its socket and session are closed by hand
+      twitch_bot._connection._keeper.cancel()
+      await twitch_bot._connection._websocket.close()
+      await twitch_bot._http.session.close()
+      await twitter_bot.close()
+      await data.close()
+      await servers.run(close_fakes(tmi, helix, petal, twitter))
+      servers.stop()
+
+
+if __name__ == '__main__':
+  asyncio.run(main())
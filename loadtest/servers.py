@@ -0,0 +1,371 @@
+# in-process stand-ins for the services the bots talk to: Twitch chat (TMI over websocket), the Helix
+# endpoints the bot calls, the Petal websocket server and the two Twitter endpoints it posts to.
+# each takes a Faults for added latency and rate-limit responses, and binds to a free local port
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import parse_qsl, urlsplit
+
+import websockets
+from websockets.exceptions import ConnectionClosed
+
+HOST = '127.0.0.1'
+FIRST_USER_ID = 100000
+
+
+class Faults:
+  # `latency` seconds (plus up to `jitter`) before each request or inbound line is handled, and at
+  # most `limit` of them per `window` seconds before the server answers with its rate-limit response
+  def __init__(self, latency: float = 0.0, jitter: float = 0.0, limit: int = None, window: float = 60.0):
+    self.latency = latency
+    self.jitter = jitter
+    self.limit = limit
+    self.window = window
+    self.window_started = time.time()
+    self.used = 0
+    self.limited = 0
+
+  async def delay(self):
+    if self.latency or self.jitter:
+      await asyncio.sleep(self.latency + random.uniform(0, self.jitter))
+
+  @property
+  def reset_at(self):
+    return self.window_started + self.window
+
+  @property
+  def remaining(self):
+    return max(0, self.limit - self.used) if self.limit is not None else 1
+
+  # fixed window, like Twitch's and Twitter's buckets
+  def take(self):
+    now = time.time()
+    if now >= self.reset_at:
+      self.window_started = now
+      self.used = 0
+    if self.limit is not None and self.used >= self.limit:
+      self.limited += 1
+      return False
+    self.used += 1
+    return True
+
+
+class HttpServer:
+  # just enough HTTP/1.1 for aiohttp: keep-alive, Content-Length bodies, JSON responses.
+  # subclasses fill in `routes` ({(method, path): handler(query, body)}) and the 429 response
+  def __init__(self, faults: Faults = None):
+    self.faults = faults or Faults()
+    self.routes = {}
+    self.requests = Counter()
+    self.connections = set()
+    self.server = None
+    self.port = None
+
+  @property
+  def url(self):
+    return f'http://{HOST}:{self.port}'
+
+  def rate_limited(self):
+    return 429, {}, {'error': 'Too Many Requests', 'status': 429, 'message': 'rate limited'}
+
+  async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    self.connections.add(writer)
+    try:
+      while (request := await reader.readline()):
+        headers = {}
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+          name, _, value = line.decode('latin-1').partition(':')
+          headers[name.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+        method, target = request.decode('latin-1').split()[:2]
+        url = urlsplit(target)
+        self.requests[url.path] += 1
+
+        await self.faults.delay()
+        if (handler := self.routes.get((method, url.path))) is None:
+          status, extra_headers, payload = 404, {}, {'error': 'Not Found', 'status': 404}
+        elif not self.faults.take():
+          status, extra_headers, payload = self.rate_limited()
+        else:
+          status, extra_headers, payload = 200, {}, handler(parse_qsl(url.query), parse_qsl(body.decode()))
+
+        content = json.dumps(payload).encode()
+        head = [f'HTTP/1.1 {status} {"OK" if status == 200 else "Error"}', 'Content-Type: application/json; charset=utf-8', f'Content-Length: {len(content)}']
+        head.extend(f'{name}: {value}' for name, value in (self.limit_headers() | extra_headers).items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + content)
+        await writer.drain()
+        if headers.get('connection', '').lower() == 'close':
+          break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+      pass
+    finally:
+      self.connections.discard(writer)
+      writer.close()
+
+  def limit_headers(self):
+    return {}
+
+  async def start(self, port: int = 0):
+    self.server = await asyncio.start_server(self.__handle, HOST, port)
+    self.port = self.server.sockets[0].getsockname()[1]
+    return self
+
+  async def close(self):
+    self.server.close()
+    # keep-alive connections outlive the listening socket
+    for writer in list(self.connections):
+      writer.close()
+    await self.server.wait_closed()
+
+
+class FakeHelix(HttpServer):
+  # /oauth2/validate plus the Helix users, channels and streams lookups. users are made up on
+  # demand: chatterN has id FIRST_USER_ID + N like the generated chat, anything else gets the next free id
+  def __init__(self, bot_login: str, live: set = (), faults: Faults = None):
+    super().__init__(faults)
+    self.bot_login = bot_login
+    self.live = set(live)
+    self.started_at = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    self.ids = {}
+    self.logins = {}
+    self.routes = {
+      ('GET', '/oauth2/validate'): self.validate,
+      ('GET', '/helix/users'): self.users,
+      ('GET', '/helix/channels'): self.channels,
+      ('GET', '/helix/streams'): self.streams
+    }
+
+  def user_id(self, login: str):
+    if (user_id := self.ids.get(login)) is None:
+      if login.startswith('chatter') and login[7:].isdigit():
+        user_id = str(FIRST_USER_ID + int(login[7:]))
+      else:
+        user_id = str(len(self.ids) + 1)
+      self.ids[login] = user_id
+      self.logins[user_id] = login
+    return user_id
+
+  def login(self, user_id: str):
+    if (login := self.logins.get(user_id)) is None:
+      login = f'chatter{int(user_id) - FIRST_USER_ID}' if int(user_id) >= FIRST_USER_ID else f'user{user_id}'
+      self.ids[login] = user_id
+      self.logins[user_id] = login
+    return login
+
+  def user(self, user_id: str, login: str):
+    return {
+      'id': user_id, 'login': login, 'display_name': login, 'type': '', 'broadcaster_type': '',
+      'description': '', 'profile_image_url': '', 'offline_image_url': '', 'view_count': 0,
+      'created_at': '2020-01-01T00:00:00Z'
+    }
+
+  def validate(self, query: list, form: list):
+    return {'client_id': 'loadtest', 'login': self.bot_login, 'user_id': self.user_id(self.bot_login), 'scopes': ['chat:read', 'chat:edit'], 'expires_in': 5000000}
+
+  def users(self, query: list, form: list):
+    users = [self.user(value, self.login(value)) for key, value in query if key == 'id']
+    users += [self.user(self.user_id(value.lower()), value.lower()) for key, value in query if key == 'login']
+    return {'data': users}
+
+  def channels(self, query: list, form: list):
+    return {'data': [{
+      'broadcaster_id': value, 'broadcaster_login': self.login(value), 'broadcaster_name': self.login(value),
+      'broadcaster_language': 'en', 'game_id': '1', 'game_name': 'DDNet', 'title': 'load test', 'delay': 0
+    } for key, value in query if key == 'broadcaster_id']}
+
+  def streams(self, query: list, form: list):
+    logins = [value.lower() for key, value in query if key == 'user_login' and value.lower() in self.live]
+    return {'data': [{
+      'id': self.user_id(login), 'user_id': self.user_id(login), 'user_login': login, 'user_name': login,
+      'game_id': '1', 'game_name': 'DDNet', 'type': 'live', 'title': 'load test', 'viewer_count': 0,
+      'started_at': self.started_at, 'language': 'en', 'thumbnail_url': '', 'tag_ids': [], 'is_mature': False
+    } for login in logins], 'pagination': {}}
+
+  # twitchio's bucket reads these from every response and waits out the reset once remaining hits 0
+  def limit_headers(self):
+    if self.faults.limit is None:
+      return {}
+    return {
+      'Ratelimit-Limit': self.faults.limit,
+      'Ratelimit-Remaining': self.faults.remaining,
+      'Ratelimit-Reset': int(self.faults.reset_at) + 1
+    }
+
+
+class FakeTwitter(HttpServer):
+  # the v1.1 endpoints bot.py posts to, plus verify_credentials which PeonyClient calls on creation
+  def __init__(self, faults: Faults = None):
+    super().__init__(faults)
+    self.name = 'lynnya_bot'
+    self.tweets = []
+    self.routes = {
+      ('GET', '/1.1/account/verify_credentials.json'): self.verify_credentials,
+      ('POST', '/1.1/account/update_profile.json'): self.update_profile,
+      ('POST', '/1.1/statuses/update.json'): self.update_status
+    }
+
+  def verify_credentials(self, query: list, form: list):
+    return {'id': 1, 'id_str': '1', 'screen_name': 'lynnya_bot', 'name': self.name}
+
+  def update_profile(self, query: list, form: list):
+    self.name = dict(form).get('name', self.name)
+    return self.verify_credentials(query, form)
+
+  def update_status(self, query: list, form: list):
+    self.tweets.append(dict(form).get('status', ''))
+    return {'id': len(self.tweets), 'id_str': str(len(self.tweets)), 'text': self.tweets[-1]}
+
+  # peony raises RateLimitExceeded for error code 88 and sleeps until x-rate-limit-reset
+  def rate_limited(self):
+    return 429, {}, {'errors': [{'code': 88, 'message': 'Rate limit exceeded'}]}
+
+  def limit_headers(self):
+    if self.faults.limit is None:
+      return {}
+    return {
+      'x-rate-limit-limit': self.faults.limit,
+      'x-rate-limit-remaining': self.faults.remaining,
+      'x-rate-limit-reset': int(self.faults.reset_at) + 1
+    }
+
+
+class FakeTmi:
+  # Twitch chat over websocket, as twitchio speaks it: the login numerics, CAP ACKs, JOIN with NAMES
+  # and a USERSTATE (mod=1 unless told otherwise), PING/PONG. chat is pushed in with inject().
+  # Faults delays the bot's own lines, and its limit is Twitch's per-channel message limit: PRIVMSGs
+  # over it get the msg_ratelimit NOTICE and are dropped. on_privmsg(channel, text, parent_id) sees the rest
+  def __init__(self, faults: Faults = None, mod: bool = True):
+    self.faults = faults or Faults(window=30)
+    self.mod = mod
+    self.clients = {}
+    self.on_privmsg = None
+    self.received = 0
+    self.dropped = 0
+    self.server = None
+    self.port = None
+
+  @property
+  def url(self):
+    return f'ws://{HOST}:{self.port}'
+
+  async def __send(self, ws, *lines: str):
+    try:
+      await ws.send('\r\n'.join(lines) + '\r\n')
+    except ConnectionClosed:
+      pass
+
+  async def __line(self, ws, line: str):
+    tags, _, rest = line[1:].partition(' ') if line.startswith('@') else ('', '', line)
+    command, _, params = rest.partition(' ')
+    client = self.clients[ws]
+    nick = client['nick']
+
+    if command == 'PASS':
+      pass
+    elif command == 'NICK':
+      client['nick'] = nick = params.strip()
+      await self.__send(ws, *(f':tmi.twitch.tv {code} {nick} :{text}' for code, text in (
+        ('001', 'Welcome, GLHF!'), ('002', 'Your host is tmi.twitch.tv'), ('003', 'This server is rather new'),
+        ('004', '-'), ('375', '-'), ('372', 'You are in a great big load test'), ('376', '>')
+      )))
+    elif command == 'CAP':
+      await self.__send(ws, f':tmi.twitch.tv CAP * ACK {params.partition(" ")[2]}')
+    elif command == 'PING':
+      await self.__send(ws, f':tmi.twitch.tv PONG tmi.twitch.tv {params}')
+    elif command == 'JOIN':
+      for channel in params.strip().lstrip('#').split(',#'):
+        client['channels'].add(channel)
+        await self.__send(ws,
+          f':{nick}!{nick}@{nick}.tmi.twitch.tv JOIN #{channel}',
+          f':{nick}.tmi.twitch.tv 353 {nick} = #{channel} :{nick}',
+          f':{nick}.tmi.twitch.tv 366 {nick} #{channel} :End of /NAMES list',
+          f'@badge-info=;badges={"moderator/1" if self.mod else ""};color=;display-name={nick};emote-sets=0;'
+          f'mod={int(self.mod)};subscriber=0;user-type={"mod" if self.mod else ""} :tmi.twitch.tv USERSTATE #{channel}'
+        )
+    elif command == 'PART':
+      client['channels'].discard(params.strip().lstrip('#'))
+    elif command == 'PRIVMSG':
+      channel, _, text = params.partition(' :')
+      channel = channel.lstrip('#')
+      if not self.faults.take():
+        self.dropped += 1
+        return await self.__send(ws, f'@msg-id=msg_ratelimit :tmi.twitch.tv NOTICE #{channel} :Your message was not sent because you are sending messages too quickly.')
+      self.received += 1
+      parent_id = None
+      for tag in tags.split(';'):
+        if tag.startswith('reply-parent-msg-id='):
+          parent_id = tag[20:]
+      if self.on_privmsg is not None:
+        self.on_privmsg(channel, text.rstrip(), parent_id)
+
+  async def __handle(self, ws):
+    self.clients[ws] = {'nick': None, 'channels': set()}
+    try:
+      async for frame in ws:
+        for line in frame.split('\r\n'):
+          if line:
+            await self.faults.delay()
+            await self.__line(ws, line)
+    except ConnectionClosed:
+      pass
+    finally:
+      del self.clients[ws]
+
+  # raw lines (tags and all) into every connection that joined `channel`, in one frame like TMI batches them
+  def inject(self, channel: str, lines: list):
+    for ws, client in list(self.clients.items()):
+      if channel in client['channels']:
+        asyncio.create_task(self.__send(ws, *lines))
+
+  async def start(self, port: int = 0):
+    self.server = await websockets.serve(self.__handle, HOST, port)
+    self.port = self.server.sockets[0].getsockname()[1]
+    return self
+
+  async def close(self):
+    self.server.close()
+    await self.server.wait_closed()
+
+
+class FakePetal:
+  # accepts any auth-token, hands every frame the bot sends to on_frame(payload) and pushes
+  # frames to the bot with broadcast(). Faults delays the bot's frames
+  def __init__(self, faults: Faults = None):
+    self.faults = faults or Faults()
+    self.clients = set()
+    self.on_frame = None
+    self.received = 0
+    self.server = None
+    self.port = None
+
+  @property
+  def url(self):
+    return f'ws://{HOST}:{self.port}'
+
+  async def __handle(self, ws):
+    self.clients.add(ws)
+    try:
+      async for frame in ws:
+        await self.faults.delay()
+        self.received += 1
+        payload = json.loads(frame)
+        if payload.get('type') != 'auth-token' and self.on_frame is not None:
+          self.on_frame(payload)
+    except ConnectionClosed:
+      pass
+    finally:
+      self.clients.discard(ws)
+
+  def broadcast(self, **payload):
+    websockets.broadcast(self.clients, json.dumps(payload))
+
+  async def start(self, port: int = 0):
+    self.server = await websockets.serve(self.__handle, HOST, port)
+    self.port = self.server.sockets[0].getsockname()[1]
+    return self
+
+  async def close(self):
+    self.server.close()
+    await self.server.wait_closed()
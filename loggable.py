@@ -1,13 +1,18 @@
 import constants
-from util import log
+from logger import logger
 
 
 class Loggable:
   log_as = constants.LOG_GENERAL_AS
 
-  def log_info(self, *info):
-    log(constants.LOG_PREFIX_INFO, self.log_as, *info)
-  def log_done(self, *info):
-    log(constants.LOG_PREFIX_DONE, self.log_as, *info)
-  def log_error(self, *info):
-    log(constants.LOG_PREFIX_ERROR, self.log_as, *info)
+  # extra keyword arguments become structured fields; `sample` rate limits lines sharing that key,
+  # for anything that can fire once per chat message or frame
+  def log_debug(self, *info, sample: str = None, **fields):
+    logger.log('debug', self.log_as, info, fields, sample=sample)
+  def log_info(self, *info, sample: str = None, **fields):
+    logger.log('info', self.log_as, info, fields, sample=sample)
+  def log_done(self, *info, sample: str = None, **fields):
+    logger.log('done', self.log_as, info, fields, sample=sample)
+  # exc is rendered with its traceback by the log writer
+  def log_error(self, *info, exc: BaseException = None, sample: str = None, **fields):
+    logger.log('error', self.log_as, info, fields, exc, sample)
@@ -0,0 +1,191 @@
+import atexit
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+
+import constants
+
+DEBUG = 10
+INFO = 20
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'error': ERROR}
+# each kind of line: (level, console prefix)
+KINDS = {
+  'debug': (DEBUG, constants.LOG_PREFIX_DEBUG),
+  'info': (INFO, constants.LOG_PREFIX_INFO),
+  'done': (INFO, constants.LOG_PREFIX_DONE),
+  'error': (ERROR, constants.LOG_PREFIX_ERROR),
+  # written as-is by the console renderer (the startup banner)
+  'raw': (INFO, '')
+}
+
+
+class Record:
+  # captured on the event loop as-is; joining, formatting and tracebacks happen on the writer thread
+  __slots__ = ('kind', 'origin', 'info', 'fields', 'exc', 'created_at')
+
+  def __init__(self, kind: str, origin: str, info: tuple, fields: dict, exc: BaseException = None):
+    self.kind = kind
+    self.origin = origin
+    self.info = info
+    self.fields = fields or {}
+    self.exc = exc
+    self.created_at = time.time()
+
+  @property
+  def message(self):
+    return ''.join(map(str, self.info))
+
+  @property
+  def traceback(self):
+    if self.exc is None:
+      return None
+    return ''.join(traceback.format_exception(type(self.exc), self.exc, self.exc.__traceback__)).rstrip('\n')
+
+
+# the original column-aligned format: "● DATA        saved data"
+class ConsoleRenderer:
+  def __init__(self, column_width: int = constants.LOG_COLUMN_WIDTH):
+    self.column_width = column_width
+
+  def render(self, record: Record):
+    if record.kind == 'raw':
+      return record.message
+    line = f'{KINDS[record.kind][1]} {record.origin}{" " * max(1, self.column_width - len(record.origin))}{record.message}'
+    if record.fields:
+      line += ' ' + ' '.join(f'{key}={value}' for key, value in record.fields.items())
+    if (tb := record.traceback) is not None:
+      line += '\n' + tb
+    return line
+
+# one JSON object per line, for journald / docker log collectors
+class JsonRenderer:
+  def render(self, record: Record):
+    entry = {
+      'ts': round(record.created_at, 3),
+      'level': record.kind,
+      'origin': record.origin,
+      'message': record.message
+    }
+    entry.update(record.fields)
+    if (tb := record.traceback) is not None:
+      entry['exc'] = tb
+    return json.dumps(entry, ensure_ascii=False, default=str)
+
+RENDERERS = {'console': ConsoleRenderer, 'json': JsonRenderer}
+
+
+class Sampler:
+  # per-key rate limit for noisy lines: `burst` per `interval` seconds, then they are counted and
+  # the count goes out with the next line allowed through
+  def __init__(self, interval: float = constants.LOG_SAMPLE_INTERVAL, burst: int = constants.LOG_SAMPLE_BURST):
+    self.interval = interval
+    self.burst = burst
+    # key -> [window started at, allowed in window, suppressed]
+    self.windows = {}
+
+  def allow(self, key: str):
+    now = time.monotonic()
+    if (window := self.windows.get(key)) is None or now - window[0] >= self.interval:
+      suppressed = window[2] if window is not None else 0
+      self.windows[key] = [now, 1, 0]
+      return True, suppressed
+    if window[1] < self.burst:
+      window[1] += 1
+      return True, 0
+    window[2] += 1
+    return False, 0
+
+
+class Logger:
+  # logging never blocks the event loop: records go on a bounded queue (dropped, and counted, when
+  # it is full) and a daemon thread renders them and writes every line it has in one go
+  def __init__(self, renderer, stream=None, level: int = INFO, queue_size: int = constants.LOG_QUEUE_SIZE):
+    self.renderer = renderer
+    self.stream = stream
+    self.level = level
+    self.queue_size = queue_size
+    self.sampler = Sampler()
+    self.dropped = 0
+    self.written = 0
+    self.__reported_dropped = 0
+    self.__start()
+    # a forked worker (the process scoring pool) gets its own queue and writer
+    os.register_at_fork(after_in_child=self.__start)
+
+  def __start(self):
+    # SimpleQueue is lock-free on the put side, the bound is enforced by hand in log()
+    self.queue = queue.SimpleQueue()
+    self.__thread = threading.Thread(target=self.__write_loop, name='logger', daemon=True)
+    self.__thread.start()
+
+  def log(self, kind: str, origin: str, info: tuple, fields: dict = None, exc: BaseException = None, sample: str = None):
+    if KINDS[kind][0] < self.level:
+      return
+    if sample is not None:
+      allowed, suppressed = self.sampler.allow(sample)
+      if not allowed:
+        return
+      if suppressed:
+        fields = (fields or {}) | {'suppressed': suppressed}
+    if self.queue.qsize() >= self.queue_size:
+      self.dropped += 1
+      return
+    self.queue.put(Record(kind, origin, info, fields, exc))
+
+  def __write_loop(self):
+    while True:
+      records = [self.queue.get()]
+      while True:
+        try:
+          records.append(self.queue.get_nowait())
+        except queue.Empty:
+          break
+
+      lines = []
+      closing = False
+      for record in records:
+        if record is None:
+          closing = True
+          continue
+        try:
+          lines.append(self.renderer.render(record))
+        except Exception as exc:
+          lines.append(f'failed to render log record from {record.origin}: {exc!r}')
+      if (dropped := self.dropped - self.__reported_dropped):
+        self.__reported_dropped += dropped
+        lines.append(self.renderer.render(Record(
+          'error', constants.LOG_GENERAL_AS, (f'{dropped} log lines dropped, the log queue was full',), None
+        )))
+
+      if lines:
+        stream = self.stream or sys.stdout
+        try:
+          stream.write('\n'.join(lines) + '\n')
+          stream.flush()
+        except Exception:
+          pass
+        self.written += len(lines)
+      if closing:
+        return
+
+  # blocks until everything queued so far is written, then stops the writer
+  def close(self):
+    if self.__thread.is_alive():
+      self.queue.put(None)
+      self.__thread.join()
+
+  def stats(self):
+    return {
+      'queued': self.queue.qsize(),
+      'written': self.written,
+      'dropped': self.dropped
+    }
+
+
+logger = Logger(RENDERERS[constants.LOG_FORMAT](), level=LEVELS[constants.LOG_LEVEL])
+atexit.register(logger.close)
@@ -0,0 +1,138 @@
+import random
+from collections import Counter, defaultdict
+
+import constants
+from inventory import ITEMS
+
+RARITIES = list(constants.RARITY_STATS)
+
+
+class AliasTable:
+  # Vose's alias method: O(n) to build, then every sample is one random() call and one table lookup
+  __slots__ = ('values', 'weights', 'prob', 'alias')
+
+  def __init__(self, weights: dict):
+    self.values = list(weights)
+    self.weights = dict(weights)
+    n = len(self.values)
+    total = sum(weights.values())
+    scaled = [weight * n / total for weight in weights.values()]
+    self.prob = [1.0] * n
+    self.alias = list(range(n))
+
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+      s, l = small.pop(), large.pop()
+      self.prob[s] = scaled[s]
+      self.alias[s] = l
+      scaled[l] -= 1 - scaled[s]
+      (small if scaled[l] < 1 else large).append(l)
+    # whatever is left over is 1 up to float error and keeps prob 1.0
+
+  def __len__(self):
+    return len(self.values)
+
+  def odds(self):
+    total = sum(self.weights.values())
+    return {value: weight / total for value, weight in self.weights.items()}
+
+  def sample(self, rng: random.Random = random):
+    # the integer part of u picks a column, the fractional part decides between it and its alias
+    u = rng.random() * len(self.values)
+    i = int(u)
+    return self.values[i if u - i < self.prob[i] else self.alias[i]]
+
+  def sample_many(self, k: int, rng: random.Random = random):
+    values, prob, alias, n, rand = self.values, self.prob, self.alias, len(self.values), rng.random
+    samples = []
+    for _ in range(k):
+      u = rand() * n
+      i = int(u)
+      samples.append(values[i if u - i < prob[i] else alias[i]])
+    return samples
+
+
+BOX_RARITY_TABLE = AliasTable({rarity: constants.LOOT_BOX_ODDS[rarity] for rarity in RARITIES})
+
+# all rarities for `quantity` boxes in one weighted draw, as {rarity: count} in RARITY_STATS order
+def draw_box_rarities(quantity: int, rng: random.Random = random):
+  drawn = Counter(BOX_RARITY_TABLE.sample_many(quantity, rng))
+  return {rarity: drawn[rarity] for rarity in RARITIES if drawn[rarity]}
+
+def format_counts(counts: dict):
+  return '\n'.join(f'{rarity} ({quantity})' for rarity, quantity in counts.items() if quantity)
+
+def resolve_rarity(rarity_str: str):
+  rarity_str = rarity_str.lower()
+  for rarity in RARITIES:
+    if rarity.lower().startswith(rarity_str):
+      return rarity
+  return None
+
+
+# an item's tier within its slot: its base_stat's position among the slot's distinct base stats,
+# spread over the rarity stats (1..5). slots where every item has the same base_stat have no tiers
+def item_tiers(items: list):
+  tiers = {}
+  by_slot = defaultdict(list)
+  for item in items:
+    by_slot[item['slot']].append(item)
+
+  top = max(constants.RARITY_STATS.values())
+  for slot_items in by_slot.values():
+    stats = sorted({item['base_stat'] for item in slot_items})
+    for item in slot_items:
+      if len(stats) == 1:
+        tiers[item['name']] = None
+      else:
+        tiers[item['name']] = 1 + round(stats.index(item['base_stat']) * (top - 1) / (len(stats) - 1))
+  return tiers
+
+
+class LootTable:
+  # items.json compiled for opening boxes: one alias table over slots, then one per (slot, rarity)
+  # over that slot's items. an item is LOOT_TIER_FALLOFF times less likely per step its tier is away
+  # from the box's rarity stat, so better boxes lean towards better items of each slot
+  def __init__(self, items: dict = ITEMS, falloff: float = constants.LOOT_TIER_FALLOFF, rng: random.Random = None):
+    self.items = items
+    self.rng = rng or random.Random(constants.LOOT_SEED)
+    tiers = item_tiers(list(items.values()))
+
+    slots = defaultdict(list)
+    for item in items.values():
+      slots[item['slot']].append(item['name'])
+    self.slot_table = AliasTable({slot: 1 for slot in slots})
+
+    self.item_tables = {}
+    for slot, names in slots.items():
+      for rarity, rarity_stat in constants.RARITY_STATS.items():
+        self.item_tables[slot, rarity] = AliasTable({
+          name: 1 if tiers[name] is None else falloff ** abs(tiers[name] - rarity_stat)
+          for name in names
+        })
+
+  # exact probability of each item coming out of a box of `rarity`
+  def odds(self, rarity: str):
+    odds = Counter()
+    for slot, slot_odds in self.slot_table.odds().items():
+      for name, item_odds in self.item_tables[slot, rarity].odds().items():
+        odds[name] += slot_odds * item_odds
+    return dict(odds)
+
+  # reforged stat range for an item of `rarity`: base_stat * rarity stat up to base_stat * (rarity stat + 1)
+  def reforge(self, name: str, rarity: str, rng: random.Random = None):
+    base_stat = self.items[name]['base_stat']
+    rarity_stat = constants.RARITY_STATS[rarity]
+    return (rng or self.rng).randint(base_stat * rarity_stat, base_stat * (rarity_stat + 1))
+
+  # opens every box in {rarity: count} in one pass and returns (name, rarity, reforge_stat) tuples
+  def open_boxes(self, counts: dict, rng: random.Random = None):
+    rng = rng or self.rng
+    opened = []
+    for rarity, quantity in counts.items():
+      slots = Counter(self.slot_table.sample_many(quantity, rng))
+      for slot in self.slot_table.values:
+        for name in self.item_tables[slot, rarity].sample_many(slots[slot], rng):
+          opened.append((name, rarity, self.reforge(name, rarity, rng)))
+    return opened
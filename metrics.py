@@ -0,0 +1,234 @@
+import asyncio
+import time
+from collections import deque
+
+import constants
+from loggable import Loggable
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def format_labels(names: tuple, values: tuple, extra: str = ''):
+  pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+  if extra:
+    pairs.append(extra)
+  return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def format_value(value):
+  if isinstance(value, dict):
+    return '(' + ', '.join(f'{key} {format_value(inner)}' for key, inner in value.items()) + ')'
+  if isinstance(value, float):
+    return f'{value:.3g}'
+  return str(value)
+
+
+class Counter:
+  __slots__ = ('name', 'help', 'label_names', 'values')
+  kind = 'counter'
+
+  def __init__(self, name: str, help: str, label_names: tuple = ()):
+    self.name = name
+    self.help = help
+    self.label_names = label_names
+    self.values = {}
+
+  def inc(self, *labels, amount: float = 1):
+    self.values[labels] = self.values.get(labels, 0) + amount
+
+  def get(self, *labels):
+    return self.values.get(labels, 0)
+
+  def render(self):
+    for labels, value in self.values.items():
+      yield f'{self.name}{format_labels(self.label_names, labels)} {value}'
+
+
+class Timer:
+  # `with histogram.time(...):`, observes the block's duration even when it raises
+  __slots__ = ('series', 'started')
+
+  def __init__(self, series):
+    self.series = series
+
+  def __enter__(self):
+    self.started = time.perf_counter()
+    return self
+
+  def __exit__(self, exc_type, exc, tb):
+    self.series.observe(time.perf_counter() - self.started)
+
+
+class Series:
+  # one labelled histogram: total count and sum, plus the most recent `window` samples that the
+  # quantiles are computed from. observing is two additions and a deque append; sorting only
+  # happens when the quantiles are read
+  __slots__ = ('count', 'sum', 'samples')
+
+  def __init__(self, window: int):
+    self.count = 0
+    self.sum = 0.0
+    self.samples = deque(maxlen=window)
+
+  def observe(self, value: float):
+    self.count += 1
+    self.sum += value
+    self.samples.append(value)
+
+  def quantiles(self, quantiles: tuple = QUANTILES):
+    if not self.samples:
+      return [0.0 for _ in quantiles]
+    ordered = sorted(self.samples)
+    return [ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in quantiles]
+
+
+class Histogram:
+  # exported as a Prometheus summary, with p50/p95/p99 over the last `window` observations
+  __slots__ = ('name', 'help', 'label_names', 'window', 'series')
+  kind = 'summary'
+
+  def __init__(self, name: str, help: str, label_names: tuple = (), window: int = constants.METRICS_WINDOW):
+    self.name = name
+    self.help = help
+    self.label_names = label_names
+    self.window = window
+    self.series = {}
+
+  def labels(self, *labels):
+    if (series := self.series.get(labels)) is None:
+      series = self.series[labels] = Series(self.window)
+    return series
+
+  def observe(self, value: float, *labels):
+    if (series := self.series.get(labels)) is None:
+      series = self.labels(*labels)
+    series.observe(value)
+
+  def time(self, *labels):
+    return Timer(self.labels(*labels))
+
+  def render(self):
+    for labels, series in self.series.items():
+      for q, value in zip(QUANTILES, series.quantiles()):
+        quantile = f'quantile="{q}"'
+        yield f'{self.name}{format_labels(self.label_names, labels, quantile)} {value}'
+      yield f'{self.name}_count{format_labels(self.label_names, labels)} {series.count}'
+      yield f'{self.name}_sum{format_labels(self.label_names, labels)} {series.sum}'
+
+
+class Metrics(Loggable):
+  # process-wide registry. modules create their counters and histograms at import time, and
+  # components with a stats() method are added as collectors: their numeric values are exported as
+  # gauges (store sizes, queue depths), read only when scraped
+  def __init__(self, prefix: str = 'lynnya_bot_'):
+    self.prefix = prefix
+    self.metrics = {}
+    self.collectors = {}
+    self.__server = None
+
+  def __add(self, metric):
+    return self.metrics.setdefault(metric.name, metric)
+
+  def counter(self, name: str, help: str, label_names: tuple = ()):
+    return self.__add(Counter(self.prefix + name, help, label_names))
+
+  def histogram(self, name: str, help: str, label_names: tuple = ()):
+    return self.__add(Histogram(self.prefix + name, help, label_names))
+
+  # stats() may be nested one level ({destination: {...}}), the outer key becomes the `label` label
+  def add_collector(self, name: str, stats, label: str = None):
+    self.collectors[self.prefix + name] = (stats, label)
+
+  def __collect(self):
+    for name, (stats, label) in self.collectors.items():
+      try:
+        values = stats()
+      except Exception as exc:
+        self.log_error(f'metrics collector {name} failed: {exc!r}')
+        continue
+      samples = {}
+      for key, value in values.items():
+        if isinstance(value, dict) and label is not None:
+          for inner_key, inner_value in value.items():
+            samples.setdefault(f'{name}_{inner_key}', []).append((format_labels((label,), (key,)), inner_value))
+        else:
+          samples.setdefault(f'{name}_{key}', []).append(('', value))
+      for metric_name, values in samples.items():
+        values = [(labels, float(value)) for labels, value in values if isinstance(value, (int, float))]
+        if values:
+          yield metric_name, values
+
+  # Prometheus text exposition format 0.0.4
+  def render(self):
+    lines = []
+    for metric in self.metrics.values():
+      lines.append(f'# HELP {metric.name} {metric.help}')
+      lines.append(f'# TYPE {metric.name} {metric.kind}')
+      try:
+        lines.extend(metric.render())
+      except Exception as exc:
+        self.log_error(f'failed to render {metric.name}: {exc!r}')
+    for name, values in self.__collect():
+      lines.append(f'# TYPE {name} gauge')
+      lines.extend(f'{name}{labels} {value}' for labels, value in values)
+    return '\n'.join(lines) + '\n'
+
+  # short text for chat: every timing with its quantiles in ms (all label values merged), or one
+  # collector's current values
+  def summary(self, collector: str = None):
+    if collector is not None:
+      if (entry := self.collectors.get(self.prefix + collector)) is None:
+        return None
+      values = entry[0]()
+      return ', '.join(f'{key} {format_value(value)}' for key, value in values.items())
+
+    lines = []
+    for metric in self.metrics.values():
+      if not isinstance(metric, Histogram) or not metric.series:
+        continue
+      merged = Series(metric.window * len(metric.series))
+      for series in metric.series.values():
+        merged.samples.extend(series.samples)
+        merged.count += series.count
+      p50, p95, p99 = (value * 1000 for value in merged.quantiles())
+      name = metric.name[len(self.prefix):].removesuffix('_seconds')
+      lines.append(f'{name}: {merged.count}x, p50 {p50:.1f}ms, p95 {p95:.1f}ms, p99 {p99:.1f}ms')
+    return '\n'.join(lines) or 'nothing measured yet'
+
+  async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+      request = await asyncio.wait_for(reader.readline(), 5)
+      # the rest of the request head is ignored
+      while await asyncio.wait_for(reader.readline(), 5) not in (b'\r\n', b'\n', b''):
+        pass
+      parts = request.decode('latin-1').split()
+      if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?', 1)[0] == '/metrics':
+        status, body = '200 OK', self.render().encode()
+      else:
+        status, body = '404 Not Found', b'not found\n'
+      writer.write(
+        f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+        f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body
+      )
+      await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+      pass
+    finally:
+      writer.close()
+
+  # local scrape endpoint, GET /metrics
+  async def serve(self, host: str = constants.METRICS_HOST, port: int = constants.METRICS_PORT):
+    if self.__server is None and port:
+      try:
+        self.__server = await asyncio.start_server(self.__handle, host, port)
+      except OSError as exc:
+        return self.log_error(f'failed to serve metrics on {host}:{port}: {exc!r}')
+      self.log_done(f'serving metrics on http://{host}:{port}/metrics')
+
+  async def close(self):
+    if self.__server is not None:
+      self.__server.close()
+      await self.__server.wait_closed()
+      self.__server = None
+
+
+registry = Metrics()
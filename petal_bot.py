@@ -1,18 +1,28 @@
 import asyncio
 import json
-import traceback
+import random
+import time
+from collections import deque
 
 import websockets
 from websockets.client import WebSocketClientProtocol
+from websockets.exceptions import ConnectionClosed
 
 import constants
+import irc
+import metrics
 from bot_data import BotData
+from bridge import Bridge, BridgeDestination
 from context import Context, PetalContext
 from discord_bot import DiscordBot
+from loggable import Loggable
 from twitch_bot import TwitchBot
 
+FRAME_SECONDS = metrics.registry.histogram('petal_frame_seconds', 'time to handle one Petal frame')
+FRAME_ERRORS = metrics.registry.counter('petal_frame_errors_total', 'Petal frames that failed to handle')
 
-class PetalBot:
+
+class PetalBot(Loggable):
   log_as = constants.LOG_PETAL_AS
 
   def __init__(self, data: BotData, token: str, name: str, twitch_bot: TwitchBot, discord_bot: DiscordBot):
@@ -25,66 +35,220 @@ class PetalBot:
     self.ws: WebSocketClientProtocol = None
     self.commands = {}
 
+    # outbound frames are queued here and survive reconnects; the oldest is dropped when full
+    self.outbound = deque(maxlen=constants.PETAL_SEND_QUEUE_SIZE)
+    self.__outbound_event = asyncio.Event()
+    self.__connected = asyncio.Event()
+    self.__command_tasks = set()
+    self.__user_commands = {}
+    self.reconnects = 0
+    self.sent = 0
+    self.dropped = 0
+    self.latency = None
+
+    # one bridge per mapped Twitch channel, with its Discord channel; Petal is bridged with the first channel only
+    self.bridges = {}
+    self.discord_bridge_channels = {}
+    for channel, discord_channel_id in constants.BRIDGE_CHANNELS.items():
+      self.bridges[channel] = self.__create_bridge(channel, discord_channel_id)
+      self.discord_bridge_channels[discord_channel_id] = channel
+    self.bridge = self.bridges[constants.BROADCASTER_CHANNEL]
+
+  def __create_bridge(self, channel: str, discord_channel_id: int):
+    bridge = Bridge()
+    bridge.add_destination(BridgeDestination(
+      'twitch',
+      lambda text: self.twitch_bot.get_channel(channel).send(text),
+      *constants.BRIDGE_TWITCH_RATE, constants.TWITCH_MESSAGE_LENGTH, ' | '
+    ))
+    bridge.add_destination(BridgeDestination(
+      'discord',
+      lambda text: self.discord_bot.get_channel(discord_channel_id).send(text),
+      *constants.BRIDGE_DISCORD_RATE, constants.DISCORD_MESSAGE_LENGTH, '\n'
+    ))
+    if channel == constants.BROADCASTER_CHANNEL:
+      bridge.add_destination(BridgeDestination(
+        'petal',
+        lambda text: self.send(type='message', body=text),
+        *constants.BRIDGE_PETAL_RATE, constants.PETAL_MESSAGE_LENGTH, '\n'
+      ))
+    return bridge
+
   async def send(self, **data):
-    await self.ws.send(json.dumps(data))
+    if len(self.outbound) == self.outbound.maxlen:
+      self.dropped += 1
+    self.outbound.append(json.dumps(data))
+    self.__outbound_event.set()
 
-  async def login(self):
-    self.ws: WebSocketClientProtocol = await websockets.connect(constants.PETAL_SERVER)
-    await self.send(type = 'auth-token', name = self.name, token = self.token)
+  async def __sender(self):
+    while True:
+      if not self.outbound:
+        self.__outbound_event.clear()
+        await self.__outbound_event.wait()
+        continue
+      await self.__connected.wait()
+      frame = self.outbound.popleft()
+      ws = self.ws
+      try:
+        await ws.send(frame)
+        self.sent += 1
+      except ConnectionClosed:
+        # put it back for the next connection, the receive loop handles reconnecting
+        self.outbound.appendleft(frame)
+        if ws is self.ws:
+          self.__connected.clear()
+      except Exception as exc:
+        self.dropped += 1
+        self.log_error('failed to send frame, dropping it', exc=exc, sample='petal send')
+
+  async def __supervise(self, name: str, coro_fn):
+    # background loops that must outlive any one failure: log it and start the loop again
+    while True:
+      try:
+        await coro_fn()
+      except Exception as exc:
+        self.log_error(f'{name} failed, restarting it', exc=exc)
+      else:
+        self.log_error(f'{name} stopped, restarting it')
+      await asyncio.sleep(constants.PETAL_RECONNECT_MIN_DELAY)
+
+  async def __pinger(self, ws: WebSocketClientProtocol):
+    # a ping that fails or goes unanswered closes the socket, and the receive loop reconnects
+    try:
+      while True:
+        await asyncio.sleep(constants.PETAL_PING_INTERVAL)
+        started = time.perf_counter()
+        await asyncio.wait_for(await ws.ping(), constants.PETAL_PING_INTERVAL)
+        self.latency = time.perf_counter() - started
+    except ConnectionClosed:
+      pass
+    except Exception as exc:
+      self.log_error(f'ping failed, reconnecting: {exc!r}')
+      await ws.close()
+
+  async def __run_command(self, coro, name: str, body: str, args: list):
+    # commands run concurrently with reading frames, but at most PETAL_USER_CONCURRENCY at a time per user
+    user = self.__user_commands.setdefault(name, [asyncio.Semaphore(constants.PETAL_USER_CONCURRENCY), 0])
+    user[1] += 1
+    try:
+      async with user[0]:
+        await coro(Context(self.twitch_bot, self.discord_bot, self, PetalContext(self, name, body), self.data), *args)
+    except Exception as exc:
+      self.log_error(f'command from {name} failed: {body}', exc=exc)
+    finally:
+      user[1] -= 1
+      if not user[1]:
+        del self.__user_commands[name]
 
+  def handle_frame(self, message):
+    payload = json.loads(message)
+    name, body = payload.get('name'), payload.get('body')
+    if payload.get('type') == 'message' and name != self.name:
+      if body.startswith(self.data[constants.PETAL_PREFIX_KEY]):
+        args = body.split()
+        coro = self.commands.get(args[0].split(self.data[constants.PETAL_PREFIX_KEY], 1)[-1])
+        if coro is not None:
+          task = asyncio.create_task(self.__run_command(coro, name, body, args[1:]))
+          self.__command_tasks.add(task)
+          task.add_done_callback(self.__command_tasks.discard)
+      else:
+        bridge_str = f'{constants.PETAL_EMOJI} {name or "anon"}: {body}'
+        self.bridge.relay(twitch=bridge_str, discord=bridge_str)
+
+  async def __connect(self):
+    self.log_info(constants.LOGIN_ATTEMPT_MESSAGE)
+    ws = await websockets.connect(constants.PETAL_SERVER)
+    # auth goes out before anything queued while disconnected
+    await ws.send(json.dumps({'type': 'auth-token', 'name': self.name, 'token': self.token}))
+    self.ws = ws
+    self.__connected.set()
+    self.log_done(constants.LOGIN_SUCCESS_MESSAGE)
+    return ws
+
+  def __install_bridge_hooks(self):
     async def event_message(message):
       if (message.echo or not message.content or message.author.name == 'nightbot'):
         return
       elif message.content.startswith(self.data[constants.TWITCH_PREFIX_KEY]):
         return await self.twitch_bot.handle_commands(message)
 
-      await asyncio.gather(
-        self.discord_bot.get_channel(constants.DISCORD_BRIDGE_CHANNEL_ID).send(
-          f'<:twitch:912098198934409248> {message.author.name}: {message.content}'
-        ),
-        self.ws.send(json.dumps({
-          'type': 'message',
-          'body': f'[twitch] {message.author.name}: {message.content}'
-        }))
-      )
+      if (bridge := self.bridges.get(message.channel.name)) is None:
+        return
+      parsed = irc.parse(message.raw_data)
+      name = parsed.tag('display-name') or message.author.name
+      lines = {'discord': f'<:twitch:912098198934409248> {name}: {parsed.text}'}
+      if 'petal' in bridge.destinations:
+        lines['petal'] = f'[twitch] {name}: {parsed.text}'
+      bridge.relay(**lines)
     self.twitch_bot.event_message = event_message
 
     async def on_message(message):
-      if message.channel.id != constants.DISCORD_BRIDGE_CHANNEL_ID or\
+      if (channel := self.discord_bridge_channels.get(message.channel.id)) is None or\
         message.author.bot or not message.clean_content:
         return
       elif message.system_content.startswith(self.data[constants.DISCORD_PREFIX_KEY]):
         return await self.discord_bot.process_commands(message)
 
-      await asyncio.gather(
-        self.twitch_bot.get_channel(constants.BROADCASTER_CHANNEL).send(
-          f'🔵 {message.author.display_name}: {message.clean_content}'
-        ),
-        self.ws.send(json.dumps({
-        'type': 'message',
-        'body': f'[discord] {message.author.display_name}: {message.clean_content}'
-        }))
-      )
+      bridge = self.bridges[channel]
+      lines = {'twitch': f'🔵 {message.author.display_name}: {message.clean_content}'}
+      if 'petal' in bridge.destinations:
+        lines['petal'] = f'[discord] {message.author.display_name}: {message.clean_content}'
+      bridge.relay(**lines)
     self.discord_bot.on_message = on_message
 
-    async for message in self.ws:
-      payload = json.loads(message)
-      name, body = payload.get('name'), payload.get('body')
-      if payload.get('type') == 'message' and name != self.name:
-        if body.startswith(self.data[constants.PETAL_PREFIX_KEY]):
-          args = body.split()
-          try:
-            coro = self.commands.get(args[0].split(self.data[constants.PETAL_PREFIX_KEY], 1)[-1])
-            if coro is not None:
-              await coro(Context(self.twitch_bot, self.discord_bot, self, PetalContext(self.ws, name, body), self.data), *args[1:])
-          except:
-            print(traceback.format_exc())
-        else:
-          bridge_str = f'{constants.PETAL_EMOJI} {name or "anon"}: {body}'
-          await asyncio.gather(
-            self.twitch_bot.get_channel(constants.BROADCASTER_CHANNEL).send(bridge_str),
-            self.discord_bot.get_channel(constants.DISCORD_BRIDGE_CHANNEL_ID).send(bridge_str)
-          )
+  async def login(self):
+    # runs for the life of the bot: reconnects with exponential backoff (plus jitter) whenever the socket drops
+    self.__install_bridge_hooks()
+    for bridge in self.bridges.values():
+      bridge.start()
+    sender = asyncio.create_task(self.__supervise('sender', self.__sender))
+    backoff = constants.PETAL_RECONNECT_MIN_DELAY
+
+    try:
+      while True:
+        pinger = None
+        connected_at = None
+        try:
+          ws = await self.__connect()
+          connected_at = time.monotonic()
+          pinger = asyncio.create_task(self.__pinger(ws))
+          async for message in ws:
+            started = time.perf_counter()
+            try:
+              self.handle_frame(message)
+            except Exception as exc:
+              FRAME_ERRORS.inc()
+              self.log_error('failed to handle frame', exc=exc, sample='petal frame error')
+            FRAME_SECONDS.observe(time.perf_counter() - started)
+          self.log_error('connection closed')
+        except (OSError, ConnectionClosed, websockets.InvalidHandshake, asyncio.TimeoutError) as exc:
+          self.log_error(f'connection lost: {exc!r}')
+        finally:
+          self.__connected.clear()
+          if pinger is not None:
+            pinger.cancel()
+          # a server that accepts and then drops the connection right away keeps backing off
+          if connected_at is not None and time.monotonic() - connected_at >= constants.PETAL_RECONNECT_RESET_AFTER:
+            backoff = constants.PETAL_RECONNECT_MIN_DELAY
+
+        self.reconnects += 1
+        delay = backoff * random.uniform(0.5, 1.5)
+        self.log_info(f'reconnecting in {delay:.1f}s')
+        await asyncio.sleep(delay)
+        backoff = min(backoff * 2, constants.PETAL_RECONNECT_MAX_DELAY)
+    finally:
+      sender.cancel()
+
+  def stats(self):
+    return {
+      'connected': self.__connected.is_set(),
+      'reconnects': self.reconnects,
+      'latency': self.latency,
+      'queued': len(self.outbound),
+      'sent': self.sent,
+      'dropped': self.dropped,
+      'commands_running': len(self.__command_tasks)
+    }
 
   def add_command(self, name, coro):
     self.commands[name] = coro
@@ -0,0 +1,143 @@
+import asyncio
+import heapq
+import time
+
+import constants
+from bridge import TokenBucket
+from loggable import Loggable
+
+
+class DailyReminders(Loggable):
+  # Discord DMs for when !daily can be claimed again. subscribers are a set of Discord IDs (persisted
+  # as daily_reminders_list); a min-heap holds when each one is next due, from daily_ts:{twitch_id}.
+  # claims reschedule through a BotData index on daily_ts:, and heap entries made stale by a newer
+  # schedule are skipped when popped, so a sweep only ever touches reminders that are actually due
+  log_as = constants.LOG_DISCORD_AS
+  key = 'daily_reminders_list'
+  timestamp_prefix = 'daily_ts:'
+
+  def __init__(self, discord_bot, data, live_status, rate: tuple = constants.REMINDER_RATE,
+      retry_delay: float = constants.REMINDER_RETRY_DELAY):
+    self.discord_bot = discord_bot
+    self.data = data
+    self.live_status = live_status
+    self.bucket = TokenBucket(*rate)
+    self.retry_delay = retry_delay
+    self.subscribers = set(data.get(self.key, []))
+    # twitch ID -> discord ID, for the subscribers only
+    self.linked = {}
+    self.heap = []
+    self.due_at = {}
+    self.sent = 0
+    self.failed = 0
+    self.__wake = asyncio.Event()
+    self.__task = None
+    live_status.add_listener(self.__on_live_change)
+
+  # BotData index interface for daily_ts:, only set() matters
+  def set(self, twitch_id: str, _):
+    if (discord_id := self.linked.get(twitch_id)) is not None:
+      self.schedule(discord_id)
+  def discard(self, twitch_id: str):
+    pass
+  def rebuild(self, items):
+    pass
+
+  def __persist(self):
+    self.data[self.key] = list(self.subscribers)
+
+  def subscribe(self, discord_id: int):
+    self.subscribers.add(discord_id)
+    self.__persist()
+    self.schedule(discord_id)
+
+  def unsubscribe(self, discord_id: int):
+    self.subscribers.discard(discord_id)
+    self.__persist()
+    self.due_at.pop(discord_id, None)
+    if (twitch_id := self.data.get(f'discord:{discord_id}')) is not None:
+      self.linked.pop(str(twitch_id), None)
+      self.data.pop(f'daily_reminder:{twitch_id}', None)
+
+  def schedule(self, discord_id: int, due_at: float = None):
+    if discord_id not in self.subscribers or (twitch_id := self.data.get(f'discord:{discord_id}')) is None:
+      return
+    self.linked[str(twitch_id)] = discord_id
+    if f'daily_reminder:{twitch_id}' in self.data:
+      # already reminded, the next claim reschedules
+      self.due_at.pop(discord_id, None)
+      return
+
+    if due_at is None:
+      due_at = self.data.get(f'{self.timestamp_prefix}{twitch_id}', 0) + constants.DAILY_COOLDOWN
+    self.due_at[discord_id] = due_at
+    heapq.heappush(self.heap, (due_at, discord_id))
+    if self.heap[0][1] == discord_id:
+      self.__wake.set()
+
+  async def __on_live_change(self, live: bool):
+    self.__wake.set()
+
+  async def __remind(self, discord_id: int):
+    await self.bucket.acquire()
+    try:
+      user = self.discord_bot.get_user(discord_id) or await self.discord_bot.fetch_user(discord_id)
+      await user.send('You can use the daily command again!')
+      self.sent += 1
+      return True
+    except Exception as exc:
+      self.failed += 1
+      self.log_error(f'failed to send daily reminder to {discord_id}: {exc!r}', sample='daily reminder')
+      return False
+
+  async def sweep(self):
+    now = time.time()
+    due = []
+    while self.heap and self.heap[0][0] <= now:
+      due_at, discord_id = heapq.heappop(self.heap)
+      if self.due_at.get(discord_id) == due_at:
+        del self.due_at[discord_id]
+        due.append(discord_id)
+    if not due:
+      return
+
+    results = await asyncio.gather(*(self.__remind(discord_id) for discord_id in due))
+    for discord_id, sent in zip(due, results):
+      # skip anyone who unsubscribed, or claimed (and so was rescheduled), while the DMs went out
+      if discord_id not in self.subscribers or discord_id in self.due_at or \
+          (twitch_id := self.data.get(f'discord:{discord_id}')) is None:
+        continue
+      if sent:
+        self.data[f'daily_reminder:{twitch_id}'] = True
+      else:
+        self.schedule(discord_id, now + self.retry_delay)
+    await self.data.save('stored reminder flags')
+
+  async def run(self):
+    await self.discord_bot.wait_until_ready()
+    for discord_id in self.subscribers:
+      self.schedule(discord_id)
+
+    while True:
+      self.__wake.clear()
+      # reminders only go out while live; going live wakes the loop through the live status listener
+      timeout = constants.LIVE_STATUS_POLL_INTERVAL
+      if self.live_status.is_live():
+        await self.sweep()
+        timeout = max(0.0, self.heap[0][0] - time.time()) if self.heap else None
+      try:
+        await asyncio.wait_for(self.__wake.wait(), timeout)
+      except asyncio.TimeoutError:
+        pass
+
+  def start(self):
+    if self.__task is None:
+      self.__task = asyncio.create_task(self.run())
+
+  def stats(self):
+    return {
+      'subscribers': len(self.subscribers),
+      'scheduled': len(self.due_at),
+      'sent': self.sent,
+      'failed': self.failed
+    }
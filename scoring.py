@@ -0,0 +1,222 @@
+import asyncio
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+
+import constants
+import dictionary
+import irc
+from loggable import Loggable
+
+ENGLISH_WORDS = None
+NON_WORD = re.compile(r'[^\w+]')
+
+# load the compiled English word list (words.txt plus chat slang), see dictionary.py
+def load_words():
+  global ENGLISH_WORDS
+  ENGLISH_WORDS = dictionary.load()
+
+
+# bit-parallel levenshtein distance (Myers / Hyyrö): one pass over `b` with the columns of the DP
+# for `a` packed into an int, instead of util.leven's full matrix. gives the same distances
+def leven(a: str, b: str):
+  if len(a) < len(b):
+    a, b = b, a
+  if not b:
+    return len(a)
+
+  # the shorter word is the bit pattern
+  m = len(b)
+  peq = {}
+  for i, c in enumerate(b):
+    peq[c] = peq.get(c, 0) | (1 << i)
+
+  mask = (1 << m) - 1
+  last = 1 << (m - 1)
+  pv, mv, score = mask, 0, m
+  for c in a:
+    eq = peq.get(c, 0)
+    xv = eq | mv
+    xh = (((eq & pv) + pv) ^ pv) | eq
+    ph = mv | ~(xh | pv)
+    mh = pv & xh
+    if ph & last:
+      score += 1
+    elif mh & last:
+      score -= 1
+    ph = ((ph << 1) | 1) & mask
+    mh = (mh << 1) & mask
+    pv = (mh | ~(xv | ph)) & mask
+    mv = ph & xv
+  return score
+
+@lru_cache(maxsize=constants.SCORING_CACHE_SIZE)
+def __cached_leven(a: str, b: str):
+  return leven(a, b)
+
+def cached_leven(a: str, b: str):
+  # distance is symmetric, so both orders share one cache entry
+  return __cached_leven(a, b) if a < b else __cached_leven(b, a)
+
+# the average of averages of each word's levenshtein distances to the other words in the message.
+# each pair is only computed once; the per-word sums are then averaged exactly like the original
+# expression in event_message so scores (and their int() truncation) stay identical
+def words_score(words: list, max_words: int = constants.SCORING_MAX_WORDS):
+  # the pairwise distances grow with the square of the word count, so only the first max_words count.
+  # callers pass words in message order, which makes the cut the same on every run
+  words = words[:max_words]
+  if not (num_words := len(words)):
+    return 0
+
+  sums = [0] * num_words
+  for i in range(num_words):
+    word = words[i]
+    for j in range(i + 1, num_words):
+      distance = cached_leven(word, words[j])
+      sums[i] += distance
+      sums[j] += distance
+  return sum(s / num_words for s in sums) / num_words
+
+# total reward score for one raw IRC PRIVMSG line. pure and module-level so it can run in a worker pool
+def score_message(raw_data: str):
+  num_emotes, clean_text = irc.strip_emotes(raw_data)
+
+  # the text with emotes cut out, without symbols, lowercased, then tokenized
+  tokens = NON_WORD.sub(' ', clean_text).lower().split()
+
+  # remove duplicate tokens (keeping message order, see words_score), then remove tokens that are not known to be English words
+  words = [t for t in dict.fromkeys(tokens) if t in ENGLISH_WORDS]
+
+  # find the average of averages for each word's levenshtein distances to other words in the message
+  # NOTE: this is a SOMEWHAT accurate way of determining valuable/conversational messages, but it is not ideal
+  score = words_score(words)
+
+  # calculate total score with the emote score combined
+  return int(score + num_emotes ** constants.EMOTE_VALUE_EXPONENT)
+
+# a message that fails to score comes back as its exception, so it doesn't take the rest of the batch with it
+def score_messages(raw_lines: list):
+  if ENGLISH_WORDS is None:
+    load_words()
+  scores = []
+  for raw_data in raw_lines:
+    try:
+      scores.append(score_message(raw_data))
+    except Exception as exc:
+      scores.append(exc)
+  return scores
+
+
+# one pool shared by every channel's pipeline; whoever creates it shuts it down after closing them
+def create_executor(kind: str = constants.SCORING_EXECUTOR, workers: int = constants.SCORING_WORKERS):
+  if kind == 'process':
+    return ProcessPoolExecutor(workers, initializer=load_words)
+  return ThreadPoolExecutor(workers, thread_name_prefix='scoring')
+
+
+class ScoringPipeline(Loggable):
+  # chat messages are queued from event_message and scored off the event loop in batches;
+  # the resulting partial_bal/bal changes are applied back on the loop through the ledger
+  def __init__(self, ledger, executor, workers: int = constants.SCORING_WORKERS,
+      queue_size: int = constants.SCORING_QUEUE_SIZE, batch_size: int = constants.SCORING_BATCH_SIZE):
+    self.ledger = ledger
+    self.queue = asyncio.Queue(queue_size)
+    self.workers = workers
+    self.batch_size = batch_size
+    self.executor = executor
+    self.submitted = 0
+    self.dropped = 0
+    self.scored = 0
+    self.failed = 0
+    self.batches = 0
+    self.scoring_time = 0.0
+    self.latency_total = 0.0
+    self.latency_max = 0.0
+    self.closed = False
+    self.__task = None
+
+  def submit(self, user_id, raw_data: str):
+    # never waits: when scoring falls behind, new messages are dropped (and counted) instead of queueing without bound
+    if self.closed:
+      self.dropped += 1
+      return
+    try:
+      self.queue.put_nowait((str(user_id), raw_data, time.perf_counter()))
+      self.submitted += 1
+    except asyncio.QueueFull:
+      self.dropped += 1
+
+  async def __score_batch(self, batch: list):
+    loop = asyncio.get_running_loop()
+    raw_lines = [raw_data for _, raw_data, _ in batch]
+    chunk_size = -(-len(raw_lines) // self.workers)
+    started = time.perf_counter()
+    chunks = await asyncio.gather(*(
+      loop.run_in_executor(self.executor, score_messages, raw_lines[i : i + chunk_size])
+      for i in range(0, len(raw_lines), chunk_size)
+    ))
+    self.scoring_time += time.perf_counter() - started
+    return [score for chunk in chunks for score in chunk]
+
+  async def __process(self, batch: list):
+    try:
+      scores = await self.__score_batch(batch)
+    except Exception as exc:
+      self.log_error(f'failed to score {len(batch)} messages', exc=exc, sample='scoring batch')
+      return
+
+    now = time.perf_counter()
+    for (user_id, _, submitted_at), total_score in zip(batch, scores):
+      if isinstance(total_score, Exception):
+        self.failed += 1
+        self.log_error(f'failed to score a message from {user_id}', exc=total_score, sample='scoring message')
+        continue
+      self.ledger.accrue(user_id, total_score)
+      latency = now - submitted_at
+      self.latency_total += latency
+      self.latency_max = max(self.latency_max, latency)
+      self.scored += 1
+    self.batches += 1
+
+  async def run(self):
+    while True:
+      batch = [await self.queue.get()]
+      while len(batch) < self.batch_size and not self.queue.empty():
+        batch.append(self.queue.get_nowait())
+
+      # close() queues None last: score everything before it, then stop
+      if (closing := batch[-1] is None):
+        batch.pop()
+      if batch:
+        await self.__process(batch)
+      if closing:
+        return
+
+  def start(self):
+    if self.__task is None:
+      self.__task = asyncio.create_task(self.run())
+
+  # scores what is still queued and applies it through the ledger, so await this before ledger.close().
+  # the executor is shared and stays up
+  async def close(self):
+    if self.closed:
+      return
+    self.closed = True
+    self.start()
+    await self.queue.put(None)
+    await self.__task
+    self.__task = None
+
+  def stats(self):
+    return {
+      'queue_depth': self.queue.qsize(),
+      'submitted': self.submitted,
+      'dropped': self.dropped,
+      'scored': self.scored,
+      'failed': self.failed,
+      'batches': self.batches,
+      'scoring_time_avg': self.scoring_time / self.batches if self.batches else 0.0,
+      'latency_avg': self.latency_total / self.scored if self.scored else 0.0,
+      'latency_max': self.latency_max
+    }
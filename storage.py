@@ -0,0 +1,401 @@
+import asyncio
+import json
+import os
+import sqlite3
+from urllib.parse import urlparse
+
+import constants
+from loggable import Loggable
+
+JOURNAL_SET = 'set'
+JOURNAL_DEL = 'del'
+
+
+class StorageBackend(Loggable):
+  log_as = constants.LOG_DATA_AS
+  # whether other processes can write to the same store, see BotData.refresh
+  shared = False
+
+  async def load(self) -> dict:
+    raise NotImplementedError
+  async def get(self, key: str):
+    return (await self.get_many([key])).get(key)
+  async def get_many(self, keys: list) -> dict:
+    raise NotImplementedError
+  # batched write: persist the current value of every key in `keys` from `data`, deleting keys missing from it
+  async def write(self, data: dict, keys: set):
+    raise NotImplementedError
+  # shared backends only: atomically add each amount to its integer key (missing keys count as 0)
+  # and return the new totals, see BotData.increment
+  async def increment(self, amounts: dict) -> dict:
+    raise NotImplementedError
+  async def close(self):
+    pass
+
+
+class JsonBackend(StorageBackend):
+  def __init__(self, path: str, journal: bool = constants.DATA_JOURNAL,
+      journal_compact_size: int = constants.DATA_JOURNAL_COMPACT_SIZE):
+    self.path = path
+    self.journal_path = f'{path}.journal'
+    self.journal = journal
+    self.journal_compact_size = journal_compact_size
+    self.journal_size = 0
+
+  def __write_file_atomic(self, text: str):
+    tmp_path = f'{self.path}.tmp'
+    with open(tmp_path, 'w') as f:
+      f.write(text)
+      f.flush()
+      os.fsync(f.fileno())
+    os.replace(tmp_path, self.path)
+
+  def __dump_and_write(self, obj: dict):
+    self.__write_file_atomic(json.dumps(obj, indent=2, sort_keys=True))
+
+  async def __write_dict_to_file(self, obj: dict):
+    # the shallow copy pins down which keys and values make up the snapshot; serializing it, the
+    # write, fsync and rename all happen off the loop. a nested dict mutated in place while it is
+    # being serialized makes json.dumps raise, then the snapshot is serialized on the loop instead
+    try:
+      await asyncio.to_thread(self.__dump_and_write, dict(obj))
+    except RuntimeError:
+      await asyncio.to_thread(self.__write_file_atomic, json.dumps(obj, indent=2, sort_keys=True))
+
+  def __append_journal(self, text: str):
+    with open(self.journal_path, 'a') as f:
+      f.write(text)
+      f.flush()
+      os.fsync(f.fileno())
+      return f.tell()
+
+  def __truncate_journal(self):
+    with open(self.journal_path, 'w') as f:
+      os.fsync(f.fileno())
+
+  def __replay_journal(self, data: dict):
+    try:
+      with open(self.journal_path) as f:
+        lines = f.readlines()
+    except FileNotFoundError:
+      return 0, False
+
+    replayed = 0
+    for i, line in enumerate(lines):
+      try:
+        op, key, *value = json.loads(line)
+      except json.JSONDecodeError:
+        # only the last record can be torn by a crash mid-append
+        if i == len(lines) - 1:
+          self.log_error('discarding incomplete journal record')
+          return replayed, True
+        raise
+      if op == JOURNAL_SET:
+        data[key] = value[0]
+      elif op == JOURNAL_DEL:
+        data.pop(key, None)
+      replayed += 1
+    return replayed, False
+
+  def __read(self):
+    with open(self.path) as f:
+      return json.load(f)
+
+  async def load(self):
+    try:
+      data = await asyncio.to_thread(self.__read)
+    except FileNotFoundError:
+      self.log_error('file not found, creating a new data file')
+      data = {}
+      await self.__write_dict_to_file(data)
+      self.log_done('created file')
+
+    replayed, torn = await asyncio.to_thread(self.__replay_journal, data)
+    if replayed:
+      self.log_done(f'replayed {replayed} journal records')
+
+    self.journal_size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+    # fold leftover records into the snapshot if the journal is too big, ends in a torn record,
+    # or journaling was turned off since the last run
+    if self.journal_size >= self.journal_compact_size or torn or (replayed and not self.journal):
+      await self.compact(data)
+    return data
+
+  async def get_many(self, keys: list):
+    # per-key reads are not what this backend is for, this re-reads the snapshot and journal
+    data = await asyncio.to_thread(self.__read)
+    await asyncio.to_thread(self.__replay_journal, data)
+    return {key: data[key] for key in keys if key in data}
+
+  async def compact(self, data: dict):
+    self.log_info(f'compacting journal ({self.journal_size} bytes) into a new snapshot')
+    # a crash between these two steps only replays records the snapshot already contains
+    await self.__write_dict_to_file(data)
+    await asyncio.to_thread(self.__truncate_journal)
+    self.journal_size = 0
+    self.log_done('compacted journal')
+
+  async def write(self, data: dict, keys: set):
+    if not self.journal:
+      # the in-memory copy is the backup: a failed write leaves the previous file untouched
+      return await self.__write_dict_to_file(data)
+
+    # one record per changed key, holding its latest value
+    records = ''.join(
+      json.dumps([JOURNAL_SET, key, data[key]] if key in data else [JOURNAL_DEL, key]) + '\n'
+      for key in keys
+    )
+    if records:
+      self.journal_size = await asyncio.to_thread(self.__append_journal, records)
+    if self.journal_size >= self.journal_compact_size:
+      await self.compact(data)
+
+
+class SqliteBackend(StorageBackend):
+  shared = True
+
+  def __init__(self, path: str):
+    self.path = path
+    self.db = None
+
+  def __connect(self):
+    db = sqlite3.connect(self.path, check_same_thread=False)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute('CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    return db
+
+  def __select(self, keys=None):
+    if keys is None:
+      rows = self.db.execute('SELECT key, value FROM kv')
+    else:
+      rows = self.db.execute(f'SELECT key, value FROM kv WHERE key IN ({",".join("?" * len(keys))})', keys)
+    return {key: json.loads(value) for key, value in rows}
+
+  def __write(self, sets: list, deletes: list):
+    with self.db:
+      self.db.executemany('INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)', sets)
+      self.db.executemany('DELETE FROM kv WHERE key = ?', deletes)
+
+  def __increment(self, amounts: list):
+    with self.db:
+      self.db.executemany(
+        'INSERT INTO kv (key, value) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value',
+        amounts
+      )
+      return self.__select([key for key, _ in amounts])
+
+  async def load(self):
+    if self.db is None:
+      self.db = await asyncio.to_thread(self.__connect)
+    return await asyncio.to_thread(self.__select)
+
+  async def get_many(self, keys: list):
+    return await asyncio.to_thread(self.__select, list(keys)) if keys else {}
+
+  async def write(self, data: dict, keys: set):
+    sets = [(key, json.dumps(data[key])) for key in keys if key in data]
+    deletes = [(key,) for key in keys if key not in data]
+    await asyncio.to_thread(self.__write, sets, deletes)
+
+  async def increment(self, amounts: dict):
+    return await asyncio.to_thread(self.__increment, list(amounts.items()))
+
+  async def close(self):
+    if self.db is not None:
+      await asyncio.to_thread(self.db.close)
+      self.db = None
+
+
+class RespError(Exception):
+  pass
+
+
+class RespPipeline:
+  def __init__(self, client, transaction: bool):
+    self.client = client
+    self.transaction = transaction
+    self.commands = []
+
+  async def __aenter__(self):
+    return self
+  async def __aexit__(self, *exc):
+    self.commands = []
+
+  def set(self, key: str, value: str):
+    self.commands.append(('SET', key, value))
+  def delete(self, *keys: str):
+    self.commands.append(('DEL', *keys))
+  def incrby(self, key: str, amount: int):
+    self.commands.append(('INCRBY', key, amount))
+
+  async def execute(self):
+    if not self.commands:
+      return []
+    if not self.transaction:
+      return await self.client.execute(*self.commands)
+    # commands that fail inside a transaction only show up as errors in EXEC's reply
+    if (replies := (await self.client.execute(('MULTI',), *self.commands, ('EXEC',)))[-1]) is None:
+      raise RespError('transaction aborted')
+    for reply in replies:
+      if isinstance(reply, RespError):
+        raise reply
+    return replies
+
+
+class RespClient:
+  # minimal asyncio client for the subset of the Redis protocol RedisBackend needs. redis-py's
+  # asyncio client needs async-timeout>=4, which the aiohttp that discord.py 1.7.3 pins can't use
+  def __init__(self, url: str):
+    url = urlparse(url)
+    self.host = url.hostname or 'localhost'
+    self.port = url.port or 6379
+    self.password = url.password
+    self.db = int(url.path.lstrip('/') or 0)
+    self.reader = self.writer = None
+    self.__lock = asyncio.Lock()
+
+  @staticmethod
+  def __encode(command):
+    parts = [f'*{len(command)}\r\n'.encode()]
+    for arg in command:
+      arg = arg if isinstance(arg, bytes) else str(arg).encode()
+      parts += [f'${len(arg)}\r\n'.encode(), arg, b'\r\n']
+    return b''.join(parts)
+
+  async def __read_reply(self):
+    line = await self.reader.readline()
+    if not line:
+      raise ConnectionError('redis connection closed')
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+      return rest.decode()
+    elif kind == b'-':
+      return RespError(rest.decode())
+    elif kind == b':':
+      return int(rest)
+    elif kind == b'$':
+      if (length := int(rest)) < 0:
+        return None
+      return (await self.reader.readexactly(length + 2))[:-2].decode()
+    elif kind == b'*':
+      if (length := int(rest)) < 0:
+        return None
+      return [await self.__read_reply() for _ in range(length)]
+    raise RespError(f'unexpected reply: {line!r}')
+
+  async def __connect(self):
+    self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+    setup = ([('AUTH', self.password)] if self.password else []) + ([('SELECT', self.db)] if self.db else [])
+    for command in setup:
+      self.writer.write(self.__encode(command))
+      if isinstance(reply := await self.__read_reply(), RespError):
+        raise reply
+
+  # pipelined: every command is written before any reply is read
+  async def execute(self, *commands):
+    async with self.__lock:
+      if self.writer is None or self.writer.is_closing():
+        await self.__connect()
+      try:
+        self.writer.write(b''.join(map(self.__encode, commands)))
+        await self.writer.drain()
+        replies = [await self.__read_reply() for _ in commands]
+      except Exception:
+        self.writer.close()
+        self.writer = None
+        raise
+    for reply in replies:
+      if isinstance(reply, RespError):
+        raise reply
+    return replies
+
+  async def mget(self, keys: list):
+    return (await self.execute(('MGET', *keys)))[0]
+
+  async def scan_iter(self, match: str, count: int):
+    cursor = '0'
+    while True:
+      cursor, keys = (await self.execute(('SCAN', cursor, 'MATCH', match, 'COUNT', count)))[0]
+      for key in keys:
+        yield key
+      if cursor == '0':
+        break
+
+  def pipeline(self, transaction: bool = True):
+    return RespPipeline(self, transaction)
+
+  async def close(self):
+    if self.writer is not None:
+      self.writer.close()
+      self.writer = None
+
+
+class RedisBackend(StorageBackend):
+  shared = True
+
+  # `client` can be any client with redis.asyncio's interface, e.g. fakeredis.aioredis.FakeRedis
+  def __init__(self, url: str, prefix: str = constants.DATA_REDIS_PREFIX, client=None, batch_size: int = 1000):
+    self.client = client or RespClient(url)
+    self.prefix = prefix
+    self.batch_size = batch_size
+
+  async def load(self):
+    data = {}
+    keys = [key async for key in self.client.scan_iter(match=f'{self.prefix}*', count=self.batch_size)]
+    for i in range(0, len(keys), self.batch_size):
+      batch = keys[i : i + self.batch_size]
+      for key, value in zip(batch, await self.client.mget(batch)):
+        if value is not None:
+          data[(key.decode() if isinstance(key, bytes) else key)[len(self.prefix):]] = json.loads(value)
+    return data
+
+  async def get_many(self, keys: list):
+    if not keys:
+      return {}
+    values = await self.client.mget([f'{self.prefix}{key}' for key in keys])
+    return {key: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+  async def write(self, data: dict, keys: set):
+    # one MULTI/EXEC round-trip per batch
+    async with self.client.pipeline(transaction=True) as pipe:
+      for key in keys:
+        if key in data:
+          pipe.set(f'{self.prefix}{key}', json.dumps(data[key]))
+        else:
+          pipe.delete(f'{self.prefix}{key}')
+      await pipe.execute()
+
+  async def increment(self, amounts: dict):
+    async with self.client.pipeline(transaction=True) as pipe:
+      for key, amount in amounts.items():
+        pipe.incrby(f'{self.prefix}{key}', amount)
+      totals = await pipe.execute()
+    return dict(zip(amounts, map(int, totals)))
+
+  async def close(self):
+    await self.client.close()
+
+
+# each channel's state is a separate store, so channels load, save and compact independently. the
+# first channel keeps the unsuffixed paths, the others get theirs next to it: data.json -> data.<channel>.json
+def shard_path(path: str, channel: str = None):
+  if channel is None or channel == constants.BROADCASTER_CHANNEL:
+    return path
+  root, ext = os.path.splitext(path)
+  return f'{root}.{channel}{ext}'
+
+def shard_prefix(prefix: str, channel: str = None):
+  if channel is None or channel == constants.BROADCASTER_CHANNEL:
+    return prefix
+  # "lynnya_bot@channel:" rather than "lynnya_bot:channel:", which the first channel's SCAN would pick up
+  return f'{prefix.rstrip(":")}@{channel}:'
+
+def create_backend(name: str = constants.DATA_BACKEND, channel: str = None) -> StorageBackend:
+  if name == 'json':
+    return JsonBackend(shard_path(constants.DATA_PATH, channel))
+  elif name == 'sqlite':
+    return SqliteBackend(shard_path(constants.DATA_SQLITE_PATH, channel))
+  elif name == 'redis':
+    return RedisBackend(constants.DATA_REDIS_URL, shard_prefix(constants.DATA_REDIS_PREFIX, channel))
+  raise RuntimeError(f'unknown data backend: {name}')
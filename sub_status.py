@@ -0,0 +1,115 @@
+import time
+from collections import OrderedDict
+
+import constants
+from loggable import Loggable
+
+# USERNOTICE msg-ids that make someone a subscriber, and the tag holding who that is
+SUB_NOTICES = {
+  'sub': 'user-id',
+  'resub': 'user-id',
+  'subgift': 'msg-param-recipient-id',
+  'anonsubgift': 'msg-param-recipient-id'
+}
+
+def has_subscriber_role(member):
+  return any(role.id == constants.DISCORD_SUBSCRIBER_ROLE_ID for role in member.roles)
+
+
+class SubStatus(Loggable):
+  # Twitch user ID -> subscribed, learned from whatever platform last saw the user: IRC badges,
+  # sub USERNOTICEs and the Discord subscriber role of linked members. entries expire after `ttl`
+  # and live in BotData as sub:{user_id} = [subscribed, seen_at], kept in sync through add_index.
+  # like UserCache, the least recently seen entries are dropped past `capacity`
+  log_as = constants.LOG_TWITCH_AS
+  key_prefix = 'sub:'
+
+  def __init__(self, data, capacity: int = constants.SUB_STATUS_SIZE, ttl: float = constants.SUB_STATUS_TTL):
+    self.data = data
+    self.capacity = capacity
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  # BotData index interface
+  def set(self, user_id: str, value):
+    self.entries[user_id] = value
+    self.entries.move_to_end(user_id)
+    while len(self.entries) > self.capacity:
+      self.data.pop(f'{self.key_prefix}{next(iter(self.entries))}', None)
+  def discard(self, user_id: str):
+    self.entries.pop(user_id, None)
+  def rebuild(self, items):
+    now = time.time()
+    self.entries = OrderedDict()
+    for user_id, value in sorted(items, key=lambda item: item[1][1]):
+      if now - value[1] > self.ttl:
+        self.data.pop(f'{self.key_prefix}{user_id}', None)
+      else:
+        self.entries[user_id] = value
+    while len(self.entries) > self.capacity:
+      self.data.pop(f'{self.key_prefix}{next(iter(self.entries))}', None)
+
+  def observe(self, user_id, subscribed: bool):
+    user_id = str(user_id)
+    now = time.time()
+    entry = self.entries.get(user_id)
+    # like UserCache.remember, only write through on a change or once the entry is halfway to expiring
+    if entry is None or entry[0] != subscribed or now - entry[1] > self.ttl / 2:
+      self.data[f'{self.key_prefix}{user_id}'] = [subscribed, now]
+    else:
+      self.entries.move_to_end(user_id)
+
+  # True/False, or None when nothing has been seen within the TTL
+  def get(self, user_id):
+    if user_id is None:
+      return None
+    if (entry := self.entries.get(str(user_id))) is None or time.time() - entry[1] > self.ttl:
+      self.misses += 1
+      return None
+    self.hits += 1
+    self.entries.move_to_end(str(user_id))
+    return entry[0]
+
+  # a chat line's badges say whether its sender is subscribed right now
+  def observe_message(self, message):
+    if (user_id := message.tag('user-id')):
+      self.observe(user_id, message.is_subscriber)
+
+  def observe_notice(self, tags: dict):
+    if (user_key := SUB_NOTICES.get(tags.get('msg-id'))) and (user_id := tags.get(user_key)):
+      self.observe(user_id, True)
+
+  # linked Discord members carry the subscriber role, so their status is known before they chat.
+  # the role syncs late and a missing role proves nothing, so it only ever records True, and never
+  # over a fresher False from chat badges
+  def observe_member(self, member):
+    if (user_id := self.data.get(f'discord:{member.id}')) is None:
+      return
+    if not has_subscriber_role(member):
+      return
+    if (entry := self.entries.get(str(user_id))) is None or entry[0] or time.time() - entry[1] > self.ttl:
+      self.observe(user_id, True)
+
+  # the role being taken away, on the other hand, means the subscription ended
+  def observe_member_update(self, before, after):
+    if has_subscriber_role(before) and not has_subscriber_role(after):
+      if (user_id := self.data.get(f'discord:{after.id}')) is not None:
+        self.observe(user_id, False)
+    else:
+      self.observe_member(after)
+
+  def warm_up(self, guilds):
+    before = len(self.entries)
+    for guild in guilds:
+      for member in guild.members:
+        self.observe_member(member)
+    self.log_done(f'sub status warmed up, {len(self.entries)} known ({len(self.entries) - before} new)')
+
+  def stats(self):
+    return {
+      'known': len(self.entries),
+      'hits': self.hits,
+      'misses': self.misses
+    }
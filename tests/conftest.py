@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+from dotenv import dotenv_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the example config, with numbers for the Discord ID placeholders, so the modules import without a .env
+for key, value in dotenv_values(os.path.join(ROOT, '.env.example')).items():
+  if value == 'REPLACE_ME' and key.startswith('DISCORD_') and '_ID' in key:
+    value = '1'
+  os.environ.setdefault(key, value or '')
+os.environ.setdefault('DISCORD_BROADCASTER_ID', '1')
+os.environ.setdefault('BROADCASTER_CHANNELS', 'lynnya_tv')
+
+# modules load items.json, words.bin and assets/ relative to the working directory
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+from bot_data import BotData
+from storage import JsonBackend
+
+
+# BotData on a JSON file in the test's tmp_path, written only when the test saves or flushes
+@pytest.fixture
+def bot_data(tmp_path):
+  return BotData(JsonBackend(str(tmp_path / 'data.json')), write_behind=False)
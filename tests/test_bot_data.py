@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from bot_data import BotData
+from storage import StorageBackend
+
+
+class MemoryBackend(StorageBackend):
+  # keeps what was written; `fail` makes the next write raise, `shared` turns on increments
+  def __init__(self, shared: bool = False):
+    self.shared = shared
+    self.stored = {}
+    self.writes = 0
+    self.fail = False
+
+  async def load(self):
+    return dict(self.stored)
+
+  async def get_many(self, keys: list):
+    return {key: self.stored[key] for key in keys if key in self.stored}
+
+  async def write(self, data: dict, keys: set):
+    if self.fail:
+      self.fail = False
+      raise OSError('disk full')
+    self.writes += 1
+    for key in keys:
+      if key in data:
+        self.stored[key] = data[key]
+      else:
+        self.stored.pop(key, None)
+
+  async def increment(self, amounts: dict):
+    for key, amount in amounts.items():
+      self.stored[key] = self.stored.get(key, 0) + amount
+    return {key: self.stored[key] for key in amounts}
+
+
+def test_flush_writes_changes_without_a_save():
+  async def main():
+    backend = MemoryBackend()
+    data = BotData(backend, write_behind=True)
+    data['a'] = 1
+    await data.close()
+    assert backend.stored['a'] == 1
+  asyncio.run(main())
+
+def test_threshold_triggers_a_flush():
+  async def main():
+    backend = MemoryBackend()
+    data = BotData(backend, write_behind=True, flush_interval=60, flush_threshold=2)
+    data.start()
+    data['a'] = 1
+    await data.save('first')
+    await asyncio.sleep(0.01)
+    assert backend.writes == 0
+    data['b'] = 2
+    await data.save('second')
+    await asyncio.sleep(0.01)
+    assert backend.stored == {'a': 1, 'b': 2}
+    await data.close()
+  asyncio.run(main())
+
+def test_interval_flush():
+  async def main():
+    backend = MemoryBackend()
+    data = BotData(backend, write_behind=True, flush_interval=0.02, flush_threshold=100)
+    data.start()
+    data['a'] = 1
+    await data.save('one')
+    await asyncio.sleep(0.1)
+    assert backend.stored == {'a': 1}
+    await data.close()
+  asyncio.run(main())
+
+def test_failed_write_is_restored():
+  async def main():
+    backend = MemoryBackend()
+    data = BotData(backend, write_behind=False)
+    backend.fail = True
+    data['a'] = 1
+    with pytest.raises(OSError):
+      await data.save('first')
+    assert data.dirty_keys == {'a'}
+    data['b'] = 2
+    await data.save('second')
+    assert backend.stored == {'a': 1, 'b': 2}
+    assert not data.dirty_keys
+  asyncio.run(main())
+
+def test_deltas_on_a_shared_backend():
+  async def main():
+    backend = MemoryBackend(shared=True)
+    backend.stored['bal:1'] = 100
+    data = BotData(backend, write_behind=False)
+    await data.load()
+    data.increment('bal:1', 5)
+    assert data.dirty_deltas == {'bal:1': 5}
+    # another process adds to the same balance before the flush
+    backend.stored['bal:1'] += 10
+    await data.save('award')
+    assert backend.stored['bal:1'] == 115
+    assert data['bal:1'] == 115
+    assert not data.dirty_deltas
+
+    # a failed flush keeps the delta for the next one
+    data.increment('bal:1', 1)
+    backend.fail = True
+    data['other'] = 1
+    with pytest.raises(OSError):
+      await data.save('retry')
+    assert data.dirty_deltas == {'bal:1': 1}
+    await data.save('retry')
+    assert backend.stored['bal:1'] == 116
+  asyncio.run(main())
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import bridge
+from bridge import BridgeDestination, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+  # bridge's own view of time: waiting on the bucket advances the fake clock instead of sleeping,
+  # and the event loop keeps the real time.monotonic
+  now = [1000.0]
+  real_sleep = asyncio.sleep
+  async def sleep(seconds: float):
+    now[0] += seconds
+    await real_sleep(0)
+  monkeypatch.setattr(bridge, 'time', SimpleNamespace(monotonic=lambda: now[0], perf_counter=time.perf_counter))
+  monkeypatch.setattr(bridge, 'asyncio', SimpleNamespace(sleep=sleep, Event=asyncio.Event, create_task=asyncio.create_task))
+  return now
+
+async def settle():
+  for _ in range(10):
+    await asyncio.sleep(0)
+
+def destination(sent: list, **kwargs):
+  async def send(message: str):
+    if message.startswith('fail'):
+      raise ConnectionError('send failed')
+    sent.append(message)
+  return BridgeDestination('test', send, **({'rate': 1, 'per': 10, 'max_length': 20, 'separator': ' | '} | kwargs))
+
+
+def test_token_bucket_refills_at_its_rate(clock):
+  bucket = TokenBucket(2, 10)
+  assert bucket.try_acquire() and bucket.try_acquire()
+  assert not bucket.try_acquire()
+  clock[0] += 4.9
+  assert not bucket.try_acquire()
+  clock[0] += 0.1
+  assert bucket.try_acquire()
+  # idle time never banks more than the burst
+  clock[0] += 1000
+  assert [bucket.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+def test_lines_queued_while_throttled_are_merged(clock):
+  async def main():
+    sent = []
+    dest = destination(sent)
+    task = asyncio.create_task(dest.run())
+    dest.put('first')
+    await settle()
+    assert sent == ['first'] and clock[0] == 1000
+    # the bucket is empty now, so these wait for the next token and go out together, split where
+    # max_length requires
+    for line in ('a', 'b', 'c', 'a much longer line'):
+      dest.put(line)
+    await settle()
+    assert sent == ['first', 'a | b | c', 'a much longer line']
+    assert clock[0] == pytest.approx(1020)
+    assert dest.merged == 2
+    task.cancel()
+  asyncio.run(main())
+
+
+def test_full_queue_drops_and_failures_are_counted(clock):
+  async def main():
+    sent = []
+    dest = destination(sent, rate=10, per=1, separator=None, queue_size=2)
+    dest.put('fail once')
+    dest.put('ok')
+    dest.put('dropped')
+    assert dest.dropped == 1
+    task = asyncio.create_task(dest.run())
+    await settle()
+    assert sent == ['ok']
+    assert dest.stats() == {'queued': 0, 'sent': 1, 'merged': 0, 'dropped': 1, 'failed': 1}
+    # lines are cut to max_length, and nothing is merged without a separator
+    dest.put('x' * 30)
+    dest.put('y')
+    await settle()
+    assert sent == ['ok', 'x' * 20, 'y']
+    task.cancel()
+  asyncio.run(main())
@@ -0,0 +1,26 @@
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip('PIL')
+
+import constants
+from cards import SLOT_SIDES, CardRenderer, sprite_name
+from inventory import ITEMS, Item
+
+
+def test_every_item_has_sprite_files():
+  renderer = CardRenderer()
+  for name, item in ITEMS.items():
+    key = (sprite_name(name), SLOT_SIDES.get(item['slot'], 'left'))
+    assert key in renderer.frame_counts, name
+    for frame in range(1, renderer.frame_counts[key] + 1):
+      assert os.path.isfile(renderer.sprite_path(*key, frame)), (name, frame)
+
+
+def test_every_item_renders():
+  renderer = CardRenderer()
+  for name in ITEMS:
+    filename, card = asyncio.run(renderer.item_card(Item(name, constants.RARITY_COMMON, 1)))
+    assert card, name
@@ -0,0 +1,47 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# constants is read once per process, so each configuration is loaded in a fresh interpreter
+SHARDS = '''
+import json
+import constants
+from storage import shard_path, shard_prefix
+print(json.dumps({
+  channel: [
+    shard_path(constants.DATA_PATH, channel),
+    shard_path(constants.LEDGER_AUDIT_PATH, channel),
+    shard_prefix(constants.DATA_REDIS_PREFIX, channel)
+  ]
+  for channel in constants.BROADCASTER_CHANNELS
+} | {'bridges': constants.BRIDGE_CHANNELS}))
+'''
+
+def load(**env):
+  return subprocess.run([sys.executable, '-c', SHARDS], env=os.environ | env, capture_output=True, text=True, timeout=60)
+
+
+def test_channels_get_separate_shards():
+  result = load(BROADCASTER_CHANNELS='First, #second', BRIDGE_CHANNELS='second:42', DATA_PATH='data.json',
+    LEDGER_AUDIT_PATH='ledger.jsonl', DATA_REDIS_PREFIX='lynnya_bot:')
+  assert result.returncode == 0, result.stderr
+  shards = json.loads(result.stdout)
+  # the first channel keeps the unsuffixed names, so a single-channel setup reads its existing data
+  assert shards['first'] == ['data.json', 'ledger.jsonl', 'lynnya_bot:']
+  assert shards['second'] == ['data.second.json', 'ledger.second.jsonl', 'lynnya_bot@second:']
+  assert shards['bridges'] == {'second': 42, 'first': int(os.environ['DISCORD_BRIDGE_CHANNEL_ID'])}
+
+
+@pytest.mark.parametrize('env, error', [
+  ({'BROADCASTER_CHANNELS': ' , ', 'BROADCASTER_CHANNEL': ''}, 'must name at least one Twitch channel'),
+  ({'BROADCASTER_CHANNELS': 'first', 'BRIDGE_CHANNELS': 'second'}, 'must look like channel:discord_channel_id'),
+  ({'BROADCASTER_CHANNELS': 'first', 'BRIDGE_CHANNELS': 'second:42'}, 'missing from BROADCASTER_CHANNELS: second'),
+  ({'BROADCASTER_CHANNELS': 'first,second,third', 'BRIDGE_CHANNELS': 'second:42,third:42'}, 'same Discord channel')
+])
+def test_bad_channel_config_fails_at_startup(env, error):
+  result = load(**env)
+  assert result.returncode != 0
+  assert error in result.stderr
@@ -0,0 +1,49 @@
+import os
+from zlib import crc32
+
+import dictionary
+
+SLOTS = 16
+
+
+def slot(word: str):
+  return crc32(word.encode()) & (SLOTS - 1)
+
+def colliding(count: int, start: int = 0):
+  # words that all land in the same slot of a 16-slot table
+  words = []
+  i = start
+  while len(words) < count:
+    if slot(word := f'word{i}') == 3:
+      words.append(word)
+    i += 1
+  return words, i
+
+
+def test_build_and_look_up(tmp_path):
+  # five words make a 16-slot table; four of them share a slot, so lookups probe past each other
+  words, next_i = colliding(5)
+  source = tmp_path / 'words.txt'
+  source.write_text(f'{words[0].upper()} {words[1]}\n{words[2]} # comment {words[4]}\n{words[3]}\nnaïve\n{"x" * 300}\n')
+  compiled = str(tmp_path / 'words.bin')
+  assert dictionary.build(compiled, str(source)) == 5
+
+  table = dictionary.WordDictionary(compiled)
+  assert len(table) == 5
+  assert table.mask == SLOTS - 1
+  for word in words[:4] + ['naïve']:
+    assert word in table
+  # commented out, colliding with stored words, or never added
+  missing, _ = colliding(2, next_i)
+  for word in [words[4], *missing, 'nope', '', 'x' * 300, 'naive']:
+    assert word not in table
+
+def test_load_rebuilds_when_the_source_changes(tmp_path):
+  source = tmp_path / 'words.txt'
+  compiled = str(tmp_path / 'words.bin')
+  source.write_text('cat\n')
+  assert 'cat' in dictionary.load(compiled, str(source))
+  source.write_text('cat\ndog\n')
+  os.utime(source, (os.path.getmtime(compiled) + 10,) * 2)
+  table = dictionary.load(compiled, str(source))
+  assert 'dog' in table and len(table) == 2
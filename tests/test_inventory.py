@@ -0,0 +1,20 @@
+from inventory import Inventory, InventoryStore
+
+
+def test_legacy_item_without_table_entry():
+  store = InventoryStore({})
+  inventory = Inventory(store.codes)
+  inventory.add_item('Retired Sword', 'Common', 3)
+  item = inventory.item(0)
+  assert item.stat_type == 'stat'
+  assert item.slot is None
+
+
+def test_cache_is_bounded():
+  data = {}
+  store = InventoryStore(data, cache_size=2)
+  for user_id in range(5):
+    store.put(user_id, Inventory(store.codes))
+  assert list(store.cache) == ['3', '4']
+  assert store.get(0) is not None
+  assert list(store.cache) == ['4', '0']
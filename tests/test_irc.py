@@ -0,0 +1,44 @@
+import irc
+
+
+def line(text: str, emotes: str):
+  return f'@badges=;emotes={emotes};user-id=1 :chatter!chatter@chatter.tmi.twitch.tv PRIVMSG #lynnya_tv :{text}\r\n'
+
+
+def test_strip_emotes_cuts_by_range():
+  # "LUL" inside "LULW" is not an emote use
+  message = irc.parse(line('LUL LULW nice Kappa LUL', '25:20-22,0-2/1902:14-18'))
+  assert message.strip_emotes() == (3, ' LULW nice  ')
+  assert message.emote_names == ['LUL', 'Kappa']
+  assert message.emote_count == 3
+  assert message.clean_text == ' LULW nice  '
+
+
+def test_strip_emotes_without_emotes():
+  message = irc.parse(line('no emotes here', ''))
+  assert message.strip_emotes() == (0, 'no emotes here')
+  assert message.emote_names == []
+  assert irc.parse(line('Kappa', '25:0-4')).clean_text == ''
+
+
+def test_lines_are_located_with_and_without_tags():
+  message = irc.parse(line('note: hi :)', '25:10-10'))
+  assert (message.nick, message.command, message.text) == ('chatter', 'PRIVMSG', 'note: hi :)')
+  message = irc.parse(':tmi.twitch.tv 001 lynnya_bot :Welcome, GLHF!\r\n')
+  assert (message.nick, message.command, message.text, message.tags) == ('tmi.twitch.tv', '001', 'Welcome, GLHF!', {})
+  assert irc.parse('PING :tmi.twitch.tv').text == 'tmi.twitch.tv'
+  assert irc.parse('@emotes=25:0-4 :chatter PRIVMSG #lynnya_tv :Kappa hi').strip_emotes() == (1, ' hi')
+
+
+def test_strip_emotes_matches_the_parsed_emotes():
+  for raw in [
+    line('LUL LULW nice Kappa LUL', '25:20-22,0-2/1902:14-18'),
+    line('Kappa', '25:0-4'),
+    line('no emotes here', ''),
+    '@badges=;user-id=1 :chatter!chatter@chatter.tmi.twitch.tv PRIVMSG #lynnya_tv :no emotes tag',
+    ':chatter!chatter@chatter.tmi.twitch.tv PRIVMSG #lynnya_tv :no tags at all\r\n',
+    'PING :tmi.twitch.tv'
+  ]:
+    message = irc.parse(raw)
+    expected = irc.cut_ranges(message.text, [(start, end + 1) for start, end, _ in message.emotes])
+    assert irc.strip_emotes(raw) == (message.emote_count, expected), raw
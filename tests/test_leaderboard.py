@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from leaderboard import Leaderboard, SortedList
+
+
+@pytest.fixture(autouse=True)
+def small_buckets(monkeypatch):
+  # a few hundred users then span many buckets, splits and emptied buckets included
+  monkeypatch.setattr(SortedList, 'bucket_size', 4)
+
+def reference(balances: dict):
+  return sorted(balances.items(), key=lambda item: (-item[1], int(item[0])))
+
+
+def test_rank_and_top_match_a_sorted_reference():
+  rng = random.Random(1337)
+  leaderboard = Leaderboard()
+  balances = {}
+  for step in range(3000):
+    user_id = str(rng.randrange(300))
+    if rng.random() < 0.2:
+      leaderboard.discard(user_id)
+      balances.pop(user_id, None)
+    else:
+      # small balances make ties, large jumps move users across buckets
+      balance = rng.choice([rng.randrange(10), rng.randrange(100000)])
+      leaderboard.set(user_id, balance)
+      balances[user_id] = balance
+
+    if step % 100 == 0:
+      expected = reference(balances)
+      assert leaderboard.top(25) == expected[:25]
+      assert len(leaderboard) == len(leaderboard.entries) == len(expected)
+      for rank, (user_id, _) in enumerate(expected, 1):
+        assert leaderboard.rank(user_id) == rank
+      assert all(len(bucket) <= 2 * SortedList.bucket_size for bucket in leaderboard.entries.buckets)
+
+
+def test_update_moves_a_user_between_buckets():
+  leaderboard = Leaderboard()
+  leaderboard.rebuild((str(user_id), user_id * 10) for user_id in range(1, 41))
+  assert len(leaderboard.entries.buckets) == 10
+  assert leaderboard.rank('1') == 40
+  leaderboard.set('1', 1000)
+  assert leaderboard.rank('1') == 1
+  assert leaderboard.top(2) == [('1', 1000), ('40', 400)]
+  assert leaderboard.rank('40') == 2
+
+
+def test_delete_and_ignored_keys():
+  leaderboard = Leaderboard()
+  leaderboard.rebuild([('1', 5), ('2', 7), ('sorted', 3), ('3', 'not a balance')])
+  assert leaderboard.top() == [('2', 7), ('1', 5)]
+  leaderboard.discard('2')
+  leaderboard.discard('missing')
+  assert leaderboard.rank('2') is None
+  assert leaderboard.rank('1') == 1
+  leaderboard.discard('1')
+  assert leaderboard.top() == [] and len(leaderboard.entries) == 0
+  with pytest.raises(ValueError):
+    leaderboard.entries.remove((-5, 1))
@@ -0,0 +1,67 @@
+import asyncio
+import json
+
+import pytest
+
+from inventory import InventoryStore
+from ledger import InsufficientFunds, Ledger
+from storage import JsonBackend
+
+
+def test_failed_audit_append_is_retried(tmp_path, bot_data):
+  async def main():
+    audit_path = tmp_path / 'audit' / 'ledger.jsonl'
+    ledger = Ledger(bot_data, audit_path=str(audit_path))
+    ledger.credit('1', 10, 'test')
+    # the directory is missing, so the append fails and the entry stays unwritten
+    await ledger.commit()
+    assert len(ledger.unwritten) == 1
+    audit_path.parent.mkdir()
+    ledger.credit('2', 5, 'test')
+    await ledger.commit()
+    assert ledger.unwritten == []
+    entries = [json.loads(line) for line in audit_path.read_text().splitlines()]
+    assert [(user_id, delta) for _, user_id, delta, *_ in entries] == [('1', 10), ('2', 5)]
+  asyncio.run(main())
+
+
+def test_staged_inventory_applies_with_the_debit(tmp_path, bot_data):
+  ledger = Ledger(bot_data, audit_path=str(tmp_path / 'ledger.jsonl'))
+  inventories = InventoryStore(bot_data)
+  bot_data.add_index('inv:', inventories)
+  ledger.credit('1', 10, 'test')
+
+  with pytest.raises(InsufficientFunds):
+    with ledger.transaction('box purchased') as tx:
+      inventory = inventories.get('1')
+      inventory.add_boxes({'Common': 1})
+      inventories.stage(tx, '1', inventory)
+      tx.debit('1', 20)
+  assert 'inv:1' not in bot_data
+  assert inventories.get('1').box_counts() == {}
+
+  with ledger.transaction('box purchased') as tx:
+    tx.debit('1', 10)
+    inventory = inventories.get('1')
+    inventory.add_boxes({'Common': 1})
+    inventories.stage(tx, '1', inventory)
+  assert bot_data['bal:1'] == 0
+  assert inventories.get('1') is inventory
+  assert inventories.get('1').box_counts() == {'Common': 1}
+
+
+def test_close_finishes_a_commit_in_flight(tmp_path, bot_data):
+  async def main():
+    audit_path = tmp_path / 'ledger.jsonl'
+    ledger = Ledger(bot_data, audit_path=str(audit_path))
+    ledger.tick = 0
+    ledger.start()
+    ledger.credit('1', 10, 'test')
+    # let the background commit get as far as the audit append, then shut down under it
+    for _ in range(3):
+      await asyncio.sleep(0)
+    await ledger.close()
+    await bot_data.close()
+    assert len(audit_path.read_text().splitlines()) == 1
+    assert (await JsonBackend(str(tmp_path / 'data.json')).load())['bal:1'] == 10
+  asyncio.run(main())
@@ -0,0 +1,36 @@
+import asyncio
+from types import SimpleNamespace
+
+from live_status import LiveStatus, LiveStatusPoller
+
+
+class StubTwitchBot:
+  # the login only resolves once `known` is set, like an account created or renamed after startup
+  def __init__(self):
+    self.known = False
+    self.user_lookups = 0
+
+  async def fetch_users(self, ids=None, names=None):
+    self.user_lookups += 1
+    return [SimpleNamespace(id='7', name='Second')] if self.known and 'second' in names else []
+
+  async def fetch_streams(self, user_logins: list):
+    return [SimpleNamespace(user=SimpleNamespace(id='7'))] if 'second' in user_logins else []
+
+
+def test_unresolved_logins_are_retried():
+  async def main():
+    twitch_bot = StubTwitchBot()
+    poller = LiveStatusPoller(twitch_bot)
+    status = LiveStatus(twitch_bot, 'second')
+    poller.add(status)
+
+    await poller.refresh()
+    assert not status.live
+    twitch_bot.known = True
+    await poller.refresh()
+    assert status.live
+    # once resolved, the login is not looked up again
+    await poller.refresh()
+    assert twitch_bot.user_lookups == 2
+  asyncio.run(main())
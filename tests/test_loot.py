@@ -0,0 +1,52 @@
+import random
+from collections import Counter
+
+import pytest
+
+import constants
+import loot
+from benchmarks.loot import chi_square, critical_value
+
+SEED = 1337
+DRAWS = 50_000
+
+
+def test_box_rarities_fit_the_configured_odds():
+  odds = loot.BOX_RARITY_TABLE.odds()
+  assert odds == {rarity: constants.LOOT_BOX_ODDS[rarity] / sum(constants.LOOT_BOX_ODDS.values()) for rarity in loot.RARITIES}
+  drawn = loot.draw_box_rarities(DRAWS, random.Random(SEED))
+  assert sum(drawn.values()) == DRAWS
+  assert chi_square(Counter(drawn), odds, DRAWS) < critical_value(len(odds) - 1)
+
+def test_items_fit_the_loot_table_odds():
+  table = loot.LootTable(rng=random.Random(SEED))
+  tiers = loot.item_tiers(list(table.items.values()))
+  for rarity, rarity_stat in constants.RARITY_STATS.items():
+    odds = table.odds(rarity)
+    assert sum(odds.values()) == pytest.approx(1)
+    # within a slot, each tier step away from the box's rarity stat costs a factor of LOOT_TIER_FALLOFF
+    for slot in table.slot_table.values:
+      names = [name for name, item in table.items.items() if item['slot'] == slot and tiers[name] is not None]
+      for a in names:
+        for b in names:
+          expected = constants.LOOT_TIER_FALLOFF ** (abs(tiers[a] - rarity_stat) - abs(tiers[b] - rarity_stat))
+          assert odds[a] / odds[b] == pytest.approx(expected)
+
+    opened = Counter(name for name, _, _ in table.open_boxes({rarity: DRAWS}))
+    assert chi_square(opened, odds, DRAWS) < critical_value(len(odds) - 1), rarity
+
+def test_same_seed_same_results():
+  counts = {rarity: 20 for rarity in loot.RARITIES}
+  first = loot.LootTable(rng=random.Random(SEED))
+  second = loot.LootTable(rng=random.Random(SEED))
+  assert first.open_boxes(counts) == second.open_boxes(counts)
+  assert first.open_boxes(counts, random.Random(7)) == second.open_boxes(counts, random.Random(7))
+  name = next(iter(first.items))
+  assert [first.reforge(name, rarity) for rarity in loot.RARITIES] == [second.reforge(name, rarity) for rarity in loot.RARITIES]
+  assert loot.draw_box_rarities(100, random.Random(SEED)) == loot.draw_box_rarities(100, random.Random(SEED))
+
+def test_reforge_stays_in_range():
+  table = loot.LootTable(rng=random.Random(SEED))
+  for name, item in table.items.items():
+    for rarity, rarity_stat in constants.RARITY_STATS.items():
+      assert item['base_stat'] * rarity_stat <= table.reforge(name, rarity) <= item['base_stat'] * (rarity_stat + 1)
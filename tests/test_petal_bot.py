@@ -0,0 +1,76 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import websockets
+
+import constants
+from petal_bot import PetalBot
+
+
+class StandIn:
+  # a Petal server that drops the first connection once told to, and records every frame per connection
+  def __init__(self):
+    self.connections = []
+    self.drop = asyncio.Event()
+    self.received = asyncio.Condition()
+
+  async def handler(self, ws, path=None):
+    frames = []
+    self.connections.append(frames)
+    first = len(self.connections) == 1
+    reader = asyncio.create_task(self.read(ws, frames))
+    if first:
+      await self.drop.wait()
+      await ws.close()
+    await reader
+
+  async def read(self, ws, frames: list):
+    try:
+      async for message in ws:
+        async with self.received:
+          frames.append(json.loads(message))
+          self.received.notify_all()
+    except websockets.ConnectionClosed:
+      pass
+
+  async def wait_for(self, predicate):
+    async with self.received:
+      await asyncio.wait_for(self.received.wait_for(predicate), 5)
+
+
+def test_reconnects_reauths_and_delivers_queued_frames(monkeypatch):
+  async def main():
+    server = StandIn()
+    async with websockets.serve(server.handler, '127.0.0.1', 0) as ws_server:
+      port = ws_server.sockets[0].getsockname()[1]
+      monkeypatch.setattr(constants, 'PETAL_SERVER', f'ws://127.0.0.1:{port}')
+      monkeypatch.setattr(constants, 'PETAL_RECONNECT_MIN_DELAY', 0.05)
+
+      data = {constants.PETAL_PREFIX_KEY: '!', constants.TWITCH_PREFIX_KEY: '!', constants.DISCORD_PREFIX_KEY: '!'}
+      petal_bot = PetalBot(data, 'token', 'lynnya_bot', SimpleNamespace(), SimpleNamespace())
+      login = asyncio.create_task(petal_bot.login())
+
+      await server.wait_for(lambda: server.connections and server.connections[0])
+      await petal_bot.send(type='message', body='before')
+      await server.wait_for(lambda: len(server.connections[0]) == 2)
+
+      # dropped by the server: frames sent meanwhile wait in the queue for the next connection
+      server.drop.set()
+      while petal_bot.stats()['connected']:
+        await asyncio.sleep(0.01)
+      await petal_bot.send(type='message', body='queued 1')
+      await petal_bot.send(type='message', body='queued 2')
+      await server.wait_for(lambda: len(server.connections) == 2 and len(server.connections[1]) == 3)
+
+      login.cancel()
+      await asyncio.gather(login, return_exceptions=True)
+
+    auth = {'type': 'auth-token', 'name': 'lynnya_bot', 'token': 'token'}
+    first, second = server.connections
+    assert first == [auth, {'type': 'message', 'body': 'before'}]
+    # authenticated again before anything queued goes out
+    assert second == [auth, {'type': 'message', 'body': 'queued 1'}, {'type': 'message', 'body': 'queued 2'}]
+    assert petal_bot.reconnects == 1
+    assert petal_bot.stats()['queued'] == 0
+  asyncio.run(main())
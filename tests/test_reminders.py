@@ -0,0 +1,74 @@
+import asyncio
+from types import SimpleNamespace
+
+import constants
+import reminders
+from reminders import DailyReminders
+
+NOW = 1_000_000.0
+
+
+class StubDiscordBot:
+  def __init__(self, failing: set):
+    self.failing = failing
+    self.sent = []
+
+  def get_user(self, discord_id: int):
+    async def send(message: str):
+      if discord_id in self.failing:
+        raise ConnectionError('cannot DM')
+      self.sent.append(discord_id)
+    return SimpleNamespace(send=send)
+
+
+def test_sweeps_send_due_reminders_in_order(bot_data, monkeypatch):
+  clock = [NOW]
+  monkeypatch.setattr(reminders, 'time', SimpleNamespace(time=lambda: clock[0]))
+
+  async def main():
+    data = bot_data
+    saves = []
+    async def save(reason: str):
+      saves.append(reason)
+    data.save = save
+
+    discord_bot = StubDiscordBot(failing={4})
+    live_status = SimpleNamespace(add_listener=lambda listener: None)
+    daily_reminders = DailyReminders(discord_bot, data, live_status, rate=(100, 1), retry_delay=15)
+    data.add_index(DailyReminders.timestamp_prefix, daily_reminders)
+
+    # discord ID -> (twitch ID, seconds from now until the daily can be claimed again)
+    for discord_id, (twitch_id, due_in) in {1: ('a', 10), 2: ('b', 5), 3: ('c', 20), 4: ('d', 1)}.items():
+      data[f'discord:{discord_id}'] = twitch_id
+      data[f'daily_ts:{twitch_id}'] = NOW + due_in - constants.DAILY_COOLDOWN
+      daily_reminders.subscribe(discord_id)
+    assert daily_reminders.heap[0] == (NOW + 1, 4)
+    assert daily_reminders.due_at == {1: NOW + 10, 2: NOW + 5, 3: NOW + 20, 4: NOW + 1}
+
+    # only what is due goes out, earliest first, with one save for the whole sweep
+    clock[0] = NOW + 10
+    await daily_reminders.sweep()
+    assert discord_bot.sent == [2, 1]
+    assert data.get('daily_reminder:a') and data.get('daily_reminder:b')
+    assert saves == ['stored reminder flags']
+    # the failed DM is retried later, the rest wait for their next claim
+    assert daily_reminders.due_at == {3: NOW + 20, 4: NOW + 25}
+
+    # claiming reschedules through the daily_ts: index, leaving the old heap entry stale
+    data.pop('daily_reminder:b')
+    data['daily_ts:b'] = NOW + 10
+    data['daily_ts:c'] = NOW + 10
+    assert daily_reminders.due_at == {2: NOW + 10 + constants.DAILY_COOLDOWN, 3: NOW + 10 + constants.DAILY_COOLDOWN, 4: NOW + 25}
+
+    discord_bot.failing.clear()
+    clock[0] = NOW + 30
+    await daily_reminders.sweep()
+    assert discord_bot.sent == [2, 1, 4]
+    assert len(saves) == 2
+
+    # nothing due, nothing sent or saved
+    await daily_reminders.sweep()
+    assert discord_bot.sent == [2, 1, 4] and len(saves) == 2
+    assert daily_reminders.heap[0][0] == NOW + 10 + constants.DAILY_COOLDOWN
+
+  asyncio.run(main())
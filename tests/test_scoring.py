@@ -0,0 +1,116 @@
+import asyncio
+import random
+
+import constants
+import scoring
+import util
+
+SEED = 1337
+# small alphabets make near-duplicates, which is where off-by-one distances would show
+ALPHABETS = ['ab', 'abc', 'abcdefghijklmnopqrstuvwxyz', 'aeiouæøå🌸']
+
+
+def random_word(rng: random.Random, max_length: int = 16):
+  alphabet = rng.choice(ALPHABETS)
+  return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, max_length)))
+
+# the expression event_message used before scoring.words_score
+def reference_words_score(words: list):
+  num_words = len(words)
+  return sum(sum(util.leven(word, w) for w in words) / num_words for word in words) / num_words if num_words else 0
+
+def test_leven_matches_reference():
+  rng = random.Random(SEED)
+  for i in range(10000):
+    # now and then longer than the 64 bits a fixed-width implementation would have
+    max_length = 80 if i % 50 == 0 else 16
+    a, b = random_word(rng, max_length), random_word(rng, max_length)
+    assert scoring.leven(a, b) == util.leven(a, b), (a, b)
+    assert scoring.cached_leven(a, b) == util.leven(a, b), (a, b)
+
+def test_words_score_matches_reference():
+  rng = random.Random(SEED)
+  for _ in range(400):
+    words = list({random_word(rng, 12) for _ in range(rng.randint(0, min(constants.SCORING_MAX_WORDS, 20)))})
+    expected = reference_words_score(words)
+    assert scoring.words_score(words) == expected, words
+    assert int(scoring.words_score(words)) == int(expected), words
+
+def test_long_messages_keep_the_first_words(monkeypatch):
+  rng = random.Random(SEED)
+  # plain lowercase words, so tokenizing leaves them as they are
+  vocabulary = list(dict.fromkeys(
+    ''.join(rng.choice('abcdefghij') for _ in range(rng.randint(1, 10))) for _ in range(3 * constants.SCORING_MAX_WORDS)
+  ))
+  monkeypatch.setattr(scoring, 'ENGLISH_WORDS', set(vocabulary))
+  # repeats and unknown tokens don't use up the cap, and only the first SCORING_MAX_WORDS distinct words count
+  tokens = [word for word in vocabulary for word in (word, 'zzzunknown', word)]
+  raw_data = f'@badges=;emotes= :chatter!chatter@chatter.tmi.twitch.tv PRIVMSG #lynnya_tv :{" ".join(tokens)}'
+  expected = reference_words_score(vocabulary[:constants.SCORING_MAX_WORDS])
+  assert scoring.score_message(raw_data) == int(expected)
+
+class StubLedger:
+  def __init__(self):
+    self.accrued = []
+
+  def accrue(self, user_id, amount):
+    self.accrued.append((user_id, amount))
+
+def privmsg(text: str):
+  return f'@badges=;emotes= :chatter!chatter@chatter.tmi.twitch.tv PRIVMSG #lynnya_tv :{text}'
+
+def test_pipeline_drops_when_full():
+  async def main():
+    executor = scoring.create_executor('thread', 1)
+    pipeline = scoring.ScoringPipeline(StubLedger(), executor, workers=1, queue_size=1)
+    try:
+      # not started, so nothing drains the queue
+      for user_id in range(3):
+        pipeline.submit(user_id, privmsg('hello'))
+      assert (pipeline.submitted, pipeline.dropped) == (1, 2)
+      await pipeline.close()
+      pipeline.submit(3, privmsg('hello'))
+      assert (pipeline.submitted, pipeline.dropped, pipeline.scored) == (1, 3, 1)
+    finally:
+      executor.shutdown()
+
+  asyncio.run(main())
+
+def test_pipeline_close_scores_everything_queued():
+  async def main():
+    executor = scoring.create_executor('thread', 2)
+    ledger = StubLedger()
+    pipeline = scoring.ScoringPipeline(ledger, executor, workers=2, queue_size=100, batch_size=8)
+    try:
+      for user_id in range(20):
+        pipeline.submit(user_id, privmsg('hello there friend'))
+      await pipeline.close()
+    finally:
+      executor.shutdown()
+    assert [user_id for user_id, _ in ledger.accrued] == [str(user_id) for user_id in range(20)]
+    assert pipeline.scored == 20 and pipeline.queue.empty()
+
+  asyncio.run(main())
+
+def test_pipeline_skips_only_the_failing_message(monkeypatch):
+  score_message = scoring.score_message
+  def failing_score_message(raw_data):
+    if raw_data.endswith(':boom'):
+      raise ValueError('boom')
+    return score_message(raw_data)
+  monkeypatch.setattr(scoring, 'score_message', failing_score_message)
+
+  async def main():
+    executor = scoring.create_executor('thread', 1)
+    ledger = StubLedger()
+    pipeline = scoring.ScoringPipeline(ledger, executor, workers=1, queue_size=10, batch_size=10)
+    try:
+      for user_id, text in enumerate(['hello', 'boom', 'there']):
+        pipeline.submit(user_id, privmsg(text))
+      await pipeline.close()
+    finally:
+      executor.shutdown()
+    assert [user_id for user_id, _ in ledger.accrued] == ['0', '2']
+    assert (pipeline.scored, pipeline.failed, pipeline.batches) == (2, 1, 1)
+
+  asyncio.run(main())
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import threading
+
+import os
+
+import pytest
+
+from bot_data import BotData
+from storage import JsonBackend, RedisBackend, RespClient, RespError
+
+
+@pytest.fixture
+def redis_url():
+  fakeredis = pytest.importorskip('fakeredis')
+  server = fakeredis.TcpFakeServer(('127.0.0.1', 0))
+  thread = threading.Thread(target=server.serve_forever, daemon=True)
+  thread.start()
+  yield f'redis://127.0.0.1:{server.server_address[1]}/0'
+  server.shutdown()
+  server.server_close()
+
+def test_journal_replay(tmp_path):
+  async def main():
+    path = str(tmp_path / 'data.json')
+    backend = JsonBackend(path, journal=True)
+    await backend.load()
+    await backend.write({'a': 1, 'b': 2}, {'a', 'b'})
+    await backend.write({'a': 3}, {'a', 'b'})
+    # only the journal has the changes, a fresh load replays them over the snapshot
+    assert await JsonBackend(path, journal=True).load() == {'a': 3}
+    assert await backend.get_many(['a', 'b']) == {'a': 3}
+  asyncio.run(main())
+
+def test_torn_journal_record_is_discarded(tmp_path):
+  async def main():
+    path = str(tmp_path / 'data.json')
+    backend = JsonBackend(path, journal=True)
+    await backend.load()
+    await backend.write({'a': 1}, {'a'})
+    with open(f'{path}.journal', 'a') as f:
+      f.write('["set", "b", ')
+    assert await JsonBackend(path, journal=True).load() == {'a': 1}
+    # the torn record was folded away, so the next load doesn't see it either
+    assert os.path.getsize(f'{path}.journal') == 0
+    assert await JsonBackend(path, journal=True).load() == {'a': 1}
+  asyncio.run(main())
+
+def test_journal_compaction(tmp_path):
+  async def main():
+    path = str(tmp_path / 'data.json')
+    backend = JsonBackend(path, journal=True, journal_compact_size=64)
+    await backend.load()
+    data = {f'key{i}': i for i in range(10)}
+    await backend.write(data, set(data))
+    assert os.path.getsize(f'{path}.journal') == 0
+    with open(path) as f:
+      assert json.load(f) == data
+    assert await JsonBackend(path, journal=False).load() == data
+  asyncio.run(main())
+
+def test_write_load_and_get(redis_url):
+  async def main():
+    backend = RedisBackend(redis_url, prefix='test:')
+    await backend.write({'a': 1, 'b': {'c': [1, 2]}}, {'a', 'b', 'gone'})
+    assert await backend.load() == {'a': 1, 'b': {'c': [1, 2]}}
+    assert await backend.get_many(['a', 'missing']) == {'a': 1}
+    await backend.write({}, {'a'})
+    assert await backend.get('a') is None
+    await backend.close()
+  asyncio.run(main())
+
+def test_error_inside_exec_raises(redis_url):
+  async def main():
+    client = RespClient(redis_url)
+    await client.execute(('SET', 'test:name', json.dumps('lynn')))
+    async with client.pipeline() as pipe:
+      pipe.set('test:ok', '1')
+      pipe.incrby('test:name', 1)
+      with pytest.raises(RespError):
+        await pipe.execute()
+    await client.close()
+  asyncio.run(main())
+
+def test_processes_sharing_state(redis_url):
+  async def main():
+    first = BotData(RedisBackend(redis_url, prefix='test:'), write_behind=False)
+    second = BotData(RedisBackend(redis_url, prefix='test:'), write_behind=False)
+    await first.load()
+    await second.load()
+
+    # balance changes add up instead of the last flush winning
+    first.increment('bal:1', 10)
+    second.increment('bal:1', 5)
+    await first.save('first')
+    await second.save('second')
+    assert second['bal:1'] == 15
+    await second.refresh('bal:1')
+    assert second['bal:1'] == 15
+    await first.refresh('bal:1')
+    assert first['bal:1'] == 15
+
+    # plain keys are re-read on refresh, unless there is an unsaved local change
+    first['daily_ts:1'] = 100
+    await first.save('first')
+    await second.refresh('daily_ts:1')
+    assert second['daily_ts:1'] == 100
+    second['link:x'] = 'local'
+    first['link:x'] = 'remote'
+    await first.save('first')
+    await second.refresh('link:x')
+    assert second['link:x'] == 'local'
+
+    await first.close()
+    await second.close()
+  asyncio.run(main())
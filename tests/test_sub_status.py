@@ -0,0 +1,60 @@
+import time
+from types import SimpleNamespace
+
+import constants
+from sub_status import SubStatus
+
+
+def indexed(data, **kwargs):
+  sub_status = SubStatus(data, **kwargs)
+  data.add_index(SubStatus.key_prefix, sub_status)
+  return sub_status
+
+def member(member_id, subscriber):
+  roles = [SimpleNamespace(id=constants.DISCORD_SUBSCRIBER_ROLE_ID)] if subscriber else []
+  return SimpleNamespace(id=member_id, roles=roles)
+
+
+def test_roles_only_record_subscribers(bot_data):
+  sub_status = indexed(bot_data)
+  bot_data['discord:10'] = '1'
+  bot_data['discord:20'] = '2'
+  bot_data['discord:30'] = '3'
+
+  # no role is not evidence of anything, and a role never overrides fresher badges
+  sub_status.observe('1', True)
+  sub_status.observe_member(member(10, False))
+  assert sub_status.get('1') is True
+  sub_status.observe('2', False)
+  sub_status.observe_member(member(20, True))
+  assert sub_status.get('2') is False
+  sub_status.observe_member(member(30, True))
+  assert sub_status.get('3') is True
+
+
+def test_entries_are_bounded(bot_data):
+  sub_status = indexed(bot_data, capacity=3)
+  for user_id in range(5):
+    sub_status.observe(user_id, True)
+  assert list(sub_status.entries) == ['2', '3', '4']
+  assert sorted(key for key in bot_data if key.startswith('sub:')) == ['sub:2', 'sub:3', 'sub:4']
+
+  # expired entries are dropped when the index is rebuilt
+  bot_data['sub:2'] = [True, time.time() - 2 * sub_status.ttl]
+  rebuilt = indexed(bot_data, capacity=3)
+  assert list(rebuilt.entries) == ['3', '4']
+
+
+def test_role_removal_records_unsubscribed(bot_data):
+  sub_status = indexed(bot_data)
+  bot_data['discord:10'] = '1'
+
+  sub_status.observe_member_update(member(10, False), member(10, True))
+  assert sub_status.get('1') is True
+  sub_status.observe_member_update(member(10, True), member(10, False))
+  assert sub_status.get('1') is False
+  assert bot_data['sub:1'][0] is False
+
+  # unlinked members are still ignored
+  sub_status.observe_member_update(member(20, True), member(20, False))
+  assert list(sub_status.entries) == ['1']
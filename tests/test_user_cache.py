@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+import user_cache
+from user_cache import HELIX_BATCH_SIZE, UserCache
+
+
+class StubTwitchBot:
+  def __init__(self):
+    self.calls = []
+
+  async def fetch_users(self, ids=None, names=None):
+    self.calls.append(list(ids))
+    return [SimpleNamespace(id=user_id, name=f'user{user_id}') for user_id in ids]
+
+def make(data, **kwargs):
+  twitch_bot = StubTwitchBot()
+  cache = UserCache(twitch_bot, data, **kwargs)
+  data.add_index(UserCache.key_prefix, cache)
+  return twitch_bot, cache
+
+
+def test_lookups_are_batched_per_helix_request(bot_data):
+  async def main():
+    twitch_bot, cache = make(bot_data)
+    names = await cache.names(range(250))
+    assert names == {str(user_id): f'user{user_id}' for user_id in range(250)}
+    assert [len(call) for call in twitch_bot.calls] == [HELIX_BATCH_SIZE, HELIX_BATCH_SIZE, 50]
+    # everything is cached now, only the new ID is fetched
+    await cache.names(range(251))
+    assert twitch_bot.calls[-1] == [250]
+    assert cache.hits == 250 and cache.misses == 251
+  asyncio.run(main())
+
+def test_least_recently_used_entries_are_evicted(bot_data):
+  async def main():
+    twitch_bot, cache = make(bot_data, capacity=3)
+    await cache.names([1, 2, 3])
+    # reading 1 makes 2 the least recently used
+    assert cache.get(1) == 'user1'
+    await cache.name(4)
+    assert list(cache.entries) == ['3', '1', '4']
+    assert 'name:2' not in bot_data
+    assert await cache.name(2) == 'user2'
+    assert len(twitch_bot.calls) == 3
+  asyncio.run(main())
+
+def test_entries_expire_after_the_ttl(bot_data, monkeypatch):
+  async def main():
+    now = [1000.0]
+    monkeypatch.setattr(user_cache.time, 'time', lambda: now[0])
+    twitch_bot, cache = make(bot_data, ttl=60)
+    assert await cache.name(1) == 'user1'
+    now[0] += 59
+    assert await cache.name(1) == 'user1'
+    assert len(twitch_bot.calls) == 1
+    now[0] += 2
+    assert cache.get(1) is None
+    assert await cache.name(1) == 'user1'
+    assert len(twitch_bot.calls) == 2
+  asyncio.run(main())
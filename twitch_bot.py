@@ -1,3 +1,5 @@
+import asyncio
+
 from twitchio.errors import AuthenticationError
 from twitchio.ext.commands import Bot
 from twitchio.ext.commands import CommandNotFound
@@ -6,6 +8,8 @@ import constants
 
 from bot_data import BotData
 from loggable import Loggable
+from sub_status import SubStatus
+from user_cache import UserCache
 
 
 class TwitchBot(Bot, Loggable):
@@ -15,9 +19,14 @@ class TwitchBot(Bot, Loggable):
     super().__init__(
       token=token,
       prefix=data[constants.TWITCH_PREFIX_KEY],
-      initial_channels=[constants.BROADCASTER_CHANNEL]
+      initial_channels=constants.BROADCASTER_CHANNELS
     )
     self.data = data
+    self.ready_event = asyncio.Event()
+    self.user_cache = UserCache(self, data)
+    data.add_index(UserCache.key_prefix, self.user_cache)
+    self.sub_status = SubStatus(data)
+    data.add_index(SubStatus.key_prefix, self.sub_status)
 
   async def connect(self):
     self.log_info(constants.LOGIN_ATTEMPT_MESSAGE)
@@ -35,5 +44,11 @@ class TwitchBot(Bot, Loggable):
       return
     raise error
 
+  async def event_raw_usernotice(self, channel, tags: dict):
+    # subs to the first channel, the one Discord and Petal sub checks are about
+    if channel.name == constants.BROADCASTER_CHANNEL:
+      self.sub_status.observe_notice(tags)
+
   async def event_ready(self):
+    self.ready_event.set()
     self.log_done('ready')
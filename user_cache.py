@@ -0,0 +1,74 @@
+import time
+from collections import OrderedDict
+
+import constants
+from loggable import Loggable
+
+# Helix accepts up to 100 IDs per users request
+HELIX_BATCH_SIZE = 100
+
+
+class UserCache(Loggable):
+  # Twitch user ID -> login name, bounded LRU with a TTL. entries live in BotData as
+  # name:{user_id} = [name, seen_at], which BotData.add_index keeps this cache in sync with
+  log_as = constants.LOG_TWITCH_AS
+  key_prefix = 'name:'
+
+  def __init__(self, twitch_bot, data, capacity: int = constants.USER_CACHE_SIZE, ttl: float = constants.USER_CACHE_TTL):
+    self.twitch_bot = twitch_bot
+    self.data = data
+    self.capacity = capacity
+    self.ttl = ttl
+    self.entries = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  # BotData index interface
+  def set(self, user_id: str, value):
+    self.entries[user_id] = value
+    self.entries.move_to_end(user_id)
+    while len(self.entries) > self.capacity:
+      self.data.pop(f'{self.key_prefix}{next(iter(self.entries))}', None)
+  def discard(self, user_id: str):
+    self.entries.pop(user_id, None)
+  def rebuild(self, items):
+    self.entries = OrderedDict(sorted(items, key=lambda item: item[1][1]))
+    while len(self.entries) > self.capacity:
+      self.data.pop(f'{self.key_prefix}{next(iter(self.entries))}', None)
+
+  def remember(self, user_id, name: str):
+    user_id = str(user_id)
+    now = time.time()
+    entry = self.entries.get(user_id)
+    # only write through when the name changed or the entry is halfway to expiring, not on every message
+    if entry is None or entry[0] != name or now - entry[1] > self.ttl / 2:
+      self.data[f'{self.key_prefix}{user_id}'] = [name, now]
+    else:
+      self.entries.move_to_end(user_id)
+
+  def get(self, user_id):
+    user_id = str(user_id)
+    if (entry := self.entries.get(user_id)) is None or time.time() - entry[1] > self.ttl:
+      return None
+    self.entries.move_to_end(user_id)
+    return entry[0]
+
+  async def names(self, user_ids) -> dict:
+    names = {}
+    missing = []
+    for user_id in map(str, user_ids):
+      if (name := self.get(user_id)) is not None:
+        names[user_id] = name
+      else:
+        missing.append(user_id)
+    self.hits += len(names)
+    self.misses += len(missing)
+
+    for i in range(0, len(missing), HELIX_BATCH_SIZE):
+      for user in await self.twitch_bot.fetch_users(ids=[int(user_id) for user_id in missing[i : i + HELIX_BATCH_SIZE]]):
+        self.remember(user.id, user.name)
+        names[str(user.id)] = user.name
+    return names
+
+  async def name(self, user_id):
+    return (await self.names([user_id])).get(str(user_id))
@@ -1,13 +1,14 @@
-import constants
+from collections import OrderedDict
+
+from logger import logger
 
 def print_box(message: str):
   l = len(message)
-  print(
+  logger.log('raw', '', ('\n'.join((
     '┏━' + '━' * l + '━┓',
     '┃ ' + message + ' ┃',
-    '┗━' + '━' * l + '━┛',
-    sep='\n'
-  )
+    '┗━' + '━' * l + '━┛'
+  )),))
 
 # levenshtein distance function. used to determine word values for chatter rewards
 # source: https://devrescue.com/levenshtein-distance-in-python
@@ -25,5 +26,28 @@ def leven(x, y):
       )
   return A[n][m]
 
-def log(prefix: str, origin: str, *info: str):
-  print(f'{prefix} {origin}{" " * max(1, constants.LOG_COLUMN_WIDTH - len(origin))}{"".join(info)}')
\ No newline at end of file
+# for code without a Loggable, e.g. log('done', constants.LOG_GENERAL_AS, 'compiled words')
+def log(kind: str, origin: str, *info: str):
+  logger.log(kind, origin, info)
+
+# least recently used entries are evicted past capacity; hits/misses are counted by get
+class LRU(OrderedDict):
+  def __init__(self, capacity: int):
+    super().__init__()
+    self.capacity = capacity
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    if (value := super().get(key)) is None:
+      self.misses += 1
+    else:
+      self.hits += 1
+      self.move_to_end(key)
+    return value
+
+  def put(self, key, value):
+    self[key] = value
+    self.move_to_end(key)
+    while len(self) > self.capacity:
+      self.popitem(last=False)